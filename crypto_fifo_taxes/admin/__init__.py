@@ -2,14 +2,20 @@ from django.contrib import admin
 from django.contrib.admin import ModelAdmin
 
 from crypto_fifo_taxes.models import (
+    BinanceTradeCursor,
     Currency,
     CurrencyPair,
     CurrencyPrice,
+    EthereumTransactionSender,
+    FiatExchangeRate,
+    MiningPoolAddress,
     Snapshot,
     SnapshotBalance,
+    SyncWatermark,
     Transaction,
     TransactionDetail,
     Wallet,
+    WalletBalanceSnapshot,
 )
 
 admin.site.register(Currency)
@@ -29,6 +35,17 @@ class CurrencyPriceAdmin(ModelAdmin):
     list_filter = ["currency", "date"]
 
 
+@admin.register(FiatExchangeRate)
+class FiatExchangeRateAdmin(ModelAdmin):
+    list_display = [
+        "base",
+        "quote",
+        "date",
+        "rate",
+    ]
+    list_filter = ["quote", "date"]
+
+
 class SnapshotBalanceInline(admin.TabularInline):
     model = SnapshotBalance
     extra = 0
@@ -46,3 +63,52 @@ class SnapshotAdmin(ModelAdmin):
     ]
     inlines = [SnapshotBalanceInline]
     ordering = ["-date"]
+
+
+@admin.register(WalletBalanceSnapshot)
+class WalletBalanceSnapshotAdmin(ModelAdmin):
+    list_display = [
+        "timestamp",
+        "wallet",
+        "currency",
+        "quantity",
+    ]
+    list_filter = ["wallet"]
+    ordering = ["-timestamp"]
+
+
+@admin.register(MiningPoolAddress)
+class MiningPoolAddressAdmin(ModelAdmin):
+    list_display = [
+        "address",
+        "fetched_at",
+    ]
+
+
+@admin.register(EthereumTransactionSender)
+class EthereumTransactionSenderAdmin(ModelAdmin):
+    list_display = [
+        "tx_id",
+        "from_address",
+        "fetched_at",
+    ]
+    search_fields = ["tx_id", "from_address"]
+
+
+@admin.register(BinanceTradeCursor)
+class BinanceTradeCursorAdmin(ModelAdmin):
+    list_display = [
+        "symbol",
+        "last_trade_id",
+        "updated_at",
+    ]
+
+
+@admin.register(SyncWatermark)
+class SyncWatermarkAdmin(ModelAdmin):
+    list_display = [
+        "endpoint",
+        "wallet",
+        "synced_until",
+        "updated_at",
+    ]
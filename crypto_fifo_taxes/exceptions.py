@@ -40,3 +40,7 @@ class CoinGeckoMultipleMatchingCurrenciesCurrency(CoinGeckoAPIException):
 
 class SnapshotHelperException(Exception):
     pass
+
+
+class TimestampConflictError(Exception):
+    """Allocated transaction timestamps were taken by another transaction before they were saved"""
@@ -0,0 +1,101 @@
+import logging
+import sys
+import time
+from dataclasses import fields
+
+from django.core.management import BaseCommand, call_command
+from django.db.transaction import atomic, set_rollback
+from django.test import override_settings
+
+from crypto_fifo_taxes.models import Currency, Transaction, Wallet
+from crypto_fifo_taxes.utils.binance.binance_api import clear_binance_client
+from crypto_fifo_taxes.utils.binance.fake_exchange import ASSETS, FakeBinanceVolumes, get_fake_binance_adapter
+from crypto_fifo_taxes.utils.currency import get_currency, get_or_create_currency, get_or_create_currency_pair
+
+logging.basicConfig(stream=sys.stdout, level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+
+class Command(BaseCommand):
+    help = (
+        "Benchmark `sync_binance` against a local fake of the Binance API: a FULL sync of the whole history, "
+        "followed by a FAST sync. Nothing is saved to the database."
+    )
+
+    def add_arguments(self, parser):
+        for field in fields(FakeBinanceVolumes):
+            parser.add_argument(
+                f"--{field.name.replace('_', '-')}",
+                type=int,
+                default=field.default,
+                help=f"Number of synthetic {field.name.replace('_', ' ')}. Default: {field.default}",
+            )
+        parser.add_argument("--latency", type=float, default=0.0, help="Seconds each response takes")
+        parser.add_argument(
+            "--weight-per-minute",
+            type=int,
+            default=6000,
+            help="Request weight budget per minute, like the 6000 of Binance. Increase to measure raw throughput.",
+        )
+        parser.add_argument(
+            "--rate-limit-every", type=int, default=None, help="Respond with HTTP 429 to every nth request"
+        )
+
+    def clear_caches(self) -> None:
+        clear_binance_client()
+        get_fake_binance_adapter.cache_clear()
+        get_currency.cache_clear()
+        get_or_create_currency.cache_clear()
+        get_or_create_currency_pair.cache_clear()
+
+    def run_sync(self, mode_name: str, mode: int) -> None:
+        adapter = get_fake_binance_adapter()
+        requests_before, rows_before = adapter.request_count, adapter.rows_served
+        rate_limited_before = adapter.rate_limited_count
+        transactions_before = Transaction.objects.count()
+
+        start_time = time.monotonic()
+        call_command("sync_binance", mode=mode)
+        elapsed = time.monotonic() - start_time
+
+        requests = adapter.request_count - requests_before
+        rows = adapter.rows_served - rows_before
+        logger.info(
+            f"{mode_name}: {elapsed:.2f}s total, "
+            f"{requests} calls ({requests / elapsed:.1f} calls/s), "
+            f"{rows} rows ({rows / elapsed:.1f} rows/s), "
+            f"{adapter.rate_limited_count - rate_limited_before} rate limited, "
+            f"{Transaction.objects.count() - transactions_before} transactions created."
+        )
+
+    def handle(self, *args, **options):
+        fake_exchange = {field.name: options[field.name] for field in fields(FakeBinanceVolumes)}
+        fake_exchange.update(
+            latency=options["latency"],
+            weight_per_minute=options["weight_per_minute"],
+            rate_limit_every=options["rate_limit_every"],
+        )
+
+        with override_settings(
+            BINANCE_TRANSPORT="fake",
+            BINANCE_FAKE_EXCHANGE=fake_exchange,
+            BINANCE_REQUEST_WEIGHT_PER_MINUTE=options["weight_per_minute"],
+            BINANCE_ARCHIVE_DIR="",
+        ):
+            self.clear_caches()
+            try:
+                with atomic():
+                    Wallet.objects.get_or_create(name="Binance")
+                    # Synthetic currencies are created upfront, so that they are not looked up from CoinGecko
+                    for symbol in ASSETS:
+                        Currency.objects.get_or_create(
+                            symbol=symbol, defaults={"name": symbol, "cg_id": f"fake-{symbol.lower()}"}
+                        )
+
+                    self.run_sync("FULL", mode=1)
+                    self.run_sync("FAST", mode=0)
+
+                    # Don't leave any synthetic transactions
+                    set_rollback(True)
+            finally:
+                self.clear_caches()
@@ -1,10 +1,13 @@
 import logging
 import sys
 
+from django.conf import settings
 from django.core.management import BaseCommand
 
-from crypto_fifo_taxes.models import Currency, Transaction
-from crypto_fifo_taxes.utils.coingecko import fetch_currency_market_chart
+from crypto_fifo_taxes.utils.coingecko import fetch_fiat_exchange_rates, fetch_prices_for_coverage
+from crypto_fifo_taxes.utils.currency import get_currency, get_or_create_fiat_currency
+from crypto_fifo_taxes.utils.price_fetch_planner import get_price_coverage, plan_price_fetch_requests
+from crypto_fifo_taxes.utils.price_store import export_price_store
 from crypto_fifo_taxes.utils.wrappers import print_time_elapsed
 
 logging.basicConfig(stream=sys.stdout, level=logging.INFO)
@@ -14,28 +17,38 @@ logger = logging.getLogger(__name__)
 class Command(BaseCommand):
     @print_time_elapsed
     def fetch_historical_market_prices(self):
-        currency_qs = Currency.objects.filter(is_fiat=False)
-        count = currency_qs.count()
+        # Missing prices of every currency are resolved with a single query
+        coverages = [coverage for coverage in get_price_coverage().values() if coverage.missing_ranges]
+        if not coverages:
+            logger.info("All currencies already have all prices.")
+            return
+
+        request_count = sum(len(plan_price_fetch_requests(coverage)) for coverage in coverages)
         logger.info(
-            f"Fetching market data for {count} currencies: ({', '.join(currency_qs.values_list('symbol', flat=True))})"
+            f"Fetching {sum(coverage.missing_days for coverage in coverages)} missing prices "
+            f"for {len(coverages)} currencies with {request_count} requests."
         )
 
-        # Only fetch prices for currencies that don't have prices for the last transaction date
-        for i, currency in enumerate(currency_qs):
-            last_transaction = Transaction.objects.filter_currency(currency.symbol).order_by("timestamp").last()
-            if last_transaction is None:
-                logger.warning(f"Currency {currency} has no transactions.")
-                continue
-
-            last_transaction_date = last_transaction.timestamp.date()
-            if currency.prices.filter(date=last_transaction_date).exists():
-                logger.info(f"Currency {currency} already has prices for {last_transaction_date}.")
-                continue
+        count = len(coverages)
+        for i, coverage in enumerate(coverages):
+            currency = get_currency(coverage.currency_id)
+            logger.info(
+                f"Fetching market data for {currency.symbol} ({coverage.missing_days} days) "
+                f"{(i + 1) / count * 100:>5.2f}% ({i+1}/{count})"
+            )
+            fetch_prices_for_coverage(coverage)
 
-            logger.info(f"Fetching market data for {currency.symbol} {(i + 1) / count * 100:>5.2f}% ({i+1}/{count})")
-            fetch_currency_market_chart(currency)
+    @print_time_elapsed
+    def fetch_fiat_exchange_rates(self):
+        for symbol in settings.REPORTING_FIAT_SYMBOLS:
+            fetch_fiat_exchange_rates(get_or_create_fiat_currency(symbol))
 
     def handle(self, *args, **kwargs):
         self.mode = kwargs.pop("mode", None)
 
         self.fetch_historical_market_prices()
+        if settings.REPORTING_FIAT_SYMBOLS:
+            self.fetch_fiat_exchange_rates()
+
+        if settings.PRICE_STORE_DIR:
+            export_price_store()
@@ -1,26 +1,47 @@
 import logging
 import sys
+from datetime import datetime
 
-from django.core.management import BaseCommand, call_command
+from django.core.management import BaseCommand, call_command, load_command_class
 
+from crypto_fifo_taxes.utils.import_pipeline import ImportSource, run_import_pipeline
 from crypto_fifo_taxes.utils.wrappers import print_time_elapsed_new_transactions
 
 logging.basicConfig(stream=sys.stdout, level=logging.INFO)
 
+FILE_IMPORT_COMMANDS = ("import_coinbase_json", "import_binance_eth2_json", "import_nicehash", "import_json")
+
 
 class Command(BaseCommand):
     def add_arguments(self, parser):
         parser.add_argument("-d", "--date", type=str, help="Start from this date. Format: YYYY-MM-DD")
         parser.add_argument("-m", "--mode", type=int, help="Mode this sync will be run in. 0=fast, 1=full")
+        parser.add_argument(
+            "--all-pairs", action="store_true", help="In FULL mode, fetch the trades of every pair in Binance"
+        )
+
+    def get_import_sources(self) -> list[ImportSource]:
+        """
+        Return the sources of all transaction imports, in the order they are written to the database.
+        All sources are fetched and parsed concurrently.
+        """
+        sync_binance = load_command_class("crypto_fifo_taxes", "sync_binance")
+        sync_binance.mode = self.mode
+        sync_binance.all_pairs = self.all_pairs
+        if not self.mode and self.date is not None:
+            # Use date only if fast mode is enabled
+            sync_binance.date = datetime.strptime(self.date, "%Y-%m-%d")
+
+        sources = sync_binance.get_import_sources()
+        for command_name in FILE_IMPORT_COMMANDS:
+            sources.append(load_command_class("crypto_fifo_taxes", command_name).get_import_source())
+        return sources
 
     @print_time_elapsed_new_transactions
     def import_all(self):
         # Import transactions
-        call_command("sync_binance", date=self.date, mode=self.mode)
-        call_command("import_coinbase_json")
-        call_command("import_binance_eth2_json")
-        call_command("import_nicehash")
-        call_command("import_json")
+        run_import_pipeline(self.get_import_sources())
+        call_command("label_mining_deposits")
 
         # Fetch market prices for currencies
         call_command("fetch_market_prices")
@@ -34,5 +55,6 @@ class Command(BaseCommand):
     def handle(self, *args, **kwargs):
         self.date = kwargs.pop("date")
         self.mode = kwargs.pop("mode")
+        self.all_pairs = kwargs.pop("all_pairs")
 
         self.import_all()
@@ -1,37 +1,69 @@
-import json
 import logging
-import os
 import sys
 from decimal import Decimal
 
 from django.conf import settings
-from django.core.management import BaseCommand
-from django.db.transaction import atomic
 
 from crypto_fifo_taxes.enums import TransactionLabel, TransactionType
 from crypto_fifo_taxes.exceptions import InvalidImportRowException
-from crypto_fifo_taxes.models import Transaction, Wallet
+from crypto_fifo_taxes.models import Currency, Transaction, TransactionDetail, Wallet
 from crypto_fifo_taxes.utils.binance.binance_api import bstrptime, to_timestamp
 from crypto_fifo_taxes.utils.currency import get_or_create_currency
-from crypto_fifo_taxes.utils.transaction_creator import TransactionCreator
+from crypto_fifo_taxes.utils.file_importer import FileImportCommand
+from crypto_fifo_taxes.utils.import_pipeline import ImportSource
+from crypto_fifo_taxes.utils.transaction_creator import TransactionBatch, TransactionCreator
 
 logging.basicConfig(stream=sys.stdout, level=logging.INFO)
 logger = logging.getLogger(__name__)
 
 
-class Command(BaseCommand):
-    def add_arguments(self, parser):
-        parser.add_argument("--file", type=str)
+WALLET_KEYS = ("wallet", "from_wallet", "to_wallet", "fee_wallet")
+SYMBOL_KEYS = ("from_symbol", "to_symbol", "fee_symbol")
+
+
+class Command(FileImportCommand):
+    default_filename = "import.json"
+
+    def get_import_source(self, file: str | None = None, chunk_size: int | None = None) -> ImportSource:
+        # Resolved once per import, and shared by all chunks
+        self.wallets: dict[str, Wallet] = {}
+        self.currencies: dict[str, Currency] = {}
+        return super().get_import_source(file, chunk_size)
+
+    def resolve_wallets(self, rows: list[dict]) -> None:
+        """Fetch all wallets used in the rows with a single query."""
+        names = {row[key] for row in rows for key in WALLET_KEYS if key in row} - self.wallets.keys()
+        if not names:
+            return
+
+        self.wallets.update({wallet.name: wallet for wallet in Wallet.objects.filter(name__in=names)})
+        if missing_names := names - self.wallets.keys():
+            raise Wallet.DoesNotExist(f"Wallets {sorted(missing_names)} do not exist.")
+
+    def resolve_currencies(self, rows: list[dict]) -> None:
+        """Fetch all currencies used in the rows with a single query. Missing currencies are created."""
+        symbols = {row[key].upper() for row in rows for key in SYMBOL_KEYS if key in row} - self.currencies.keys()
+        if not symbols:
+            return
+
+        renamed_symbols = {settings.RENAMED_SYMBOLS.get(symbol, symbol): symbol for symbol in symbols}
+        for currency in Currency.objects.filter(symbol__in=renamed_symbols.keys()):
+            self.currencies[renamed_symbols[currency.symbol]] = currency
+        for symbol in symbols - self.currencies.keys():
+            self.currencies[symbol] = get_or_create_currency(symbol)
+
+    def get_currency(self, symbol: str) -> Currency:
+        return self.currencies[symbol.upper()]
 
     def get_wallets(self, row: dict) -> tuple[Wallet | None, Wallet | None, Wallet | None]:
         if "wallet" in row:
-            wallet = Wallet.objects.get(name=row["wallet"])
+            wallet = self.wallets[row["wallet"]]
             return wallet, wallet, wallet
 
         return (
-            Wallet.objects.get(name=row["from_wallet"]) if "from_wallet" in row else None,
-            Wallet.objects.get(name=row["to_wallet"]) if "to_wallet" in row else None,
-            Wallet.objects.get(name=row["fee_wallet"]) if "fee_wallet" in row else None,
+            self.wallets[row["from_wallet"]] if "from_wallet" in row else None,
+            self.wallets[row["to_wallet"]] if "to_wallet" in row else None,
+            self.wallets[row["fee_wallet"]] if "fee_wallet" in row else None,
         )
 
     def build_transaction_id(self, row: dict) -> str:
@@ -42,113 +74,124 @@ class Command(BaseCommand):
         timestamp = to_timestamp(bstrptime(row["timestamp"])) if "timestamp" in row else "0" * 8
         return f"{wallet}_{timestamp}"
 
-    def update_existing_transaction(self, row: dict, tx_id: str):
-        # tx_id provided, add provided information to an existing transaction
-        transaction = Transaction.objects.filter(tx_id=tx_id).first()
-
-        if transaction is None:
-            logger.error(
-                f"Trying to update a transaction that has a tx_id ({tx_id}) set "  # noqa: S608,RUF100
-                f"but matching transaction was not found!"
-            )
-            return
-
+    def get_existing_transactions(self, tx_ids: set[str]) -> dict[str, Transaction]:
+        """Fetch the transactions with the given tx_ids, with their details, with a single query."""
+        existing_transactions: dict[str, Transaction] = {}
+        for transaction in Transaction.objects.filter(tx_id__in=tx_ids).order_by("timestamp"):
+            # Update the first transaction with the tx_id, if there are multiple
+            existing_transactions.setdefault(transaction.tx_id, transaction)
+        return existing_transactions
+
+    def update_existing_transaction(
+        self,
+        row: dict,
+        transaction: Transaction,
+        new_details: list[TransactionDetail],
+        updated_details: dict[int, TransactionDetail],
+    ) -> None:
+        """
+        Add the provided information to an existing transaction, in memory.
+        New and updated details are collected to be saved in bulk.
+        """
         transaction.description = "Manually updated transaction"
         if rox_description := row.get("description"):
             transaction.description += f" ({rox_description})"
 
         wallets = self.get_wallets(row)
         # FIXME: Updating does not work on wallet, symbol or quantity
+        for detail_field, prefix, wallet in (
+            ("from_detail", "from", wallets[0]),
+            ("to_detail", "to", wallets[1]),
+            ("fee_detail", "fee", wallets[2]),
+        ):
+            if f"{prefix}_symbol" not in row:
+                continue
+
+            currency = self.get_currency(row[f"{prefix}_symbol"])
+            quantity = Decimal(str(row[f"{prefix}_amount"]))
+            detail: TransactionDetail | None = getattr(transaction, detail_field)
+            if detail is not None:
+                detail.wallet, detail.currency, detail.quantity = wallet, currency, quantity
+                updated_details[detail.pk] = detail
+            else:
+                detail = TransactionDetail(wallet=wallet, currency=currency, quantity=quantity)
+                new_details.append(detail)
+                setattr(transaction, detail_field, detail)
+
+        if "type" in row:
+            transaction.transaction_type = TransactionType[row["type"]]
+        if "label" in row:
+            transaction.transaction_label = TransactionLabel[row["label"]]
+
+    def import_chunk(self, rows: list[dict]) -> None:
+        self.resolve_wallets(rows)
+        self.resolve_currencies(rows)
+
+        tx_ids = [self.build_transaction_id(row) for row in rows]
+        existing_transactions = self.get_existing_transactions(set(tx_ids))
+
+        batch = TransactionBatch()
+        new_details: list[TransactionDetail] = []
+        updated_details: dict[int, TransactionDetail] = {}
+        updated_transactions: dict[int, Transaction] = {}
+        for row, tx_id in zip(rows, tx_ids, strict=True):
+            # Update already imported transactions
+            if tx_id in existing_transactions:
+                transaction = existing_transactions[tx_id]
+                self.update_existing_transaction(row, transaction, new_details, updated_details)
+                updated_transactions[transaction.pk] = transaction
+                continue
+
+            self.import_row(row, tx_id, batch)
+        batch.create()
+
+        if updated_transactions:
+            TransactionDetail.objects.bulk_create(new_details)
+            TransactionDetail.objects.bulk_update(updated_details.values(), ["wallet", "currency", "quantity"])
+            Transaction.objects.bulk_update(
+                updated_transactions.values(),
+                ["description", "transaction_type", "transaction_label", "from_detail", "to_detail", "fee_detail"],
+            )
+
+    def import_row(self, row: dict, tx_id: str, batch: TransactionBatch) -> None:
+        if not row.get("timestamp"):
+            logger.error(
+                f"Missing timestamp or wallet in row: '{row}'. "
+                f"Did you try to update an existing transaction which is not yet imported?"
+            )
+            raise InvalidImportRowException(f"Missing timestamp or wallet in row. {row}")
+
+        wallets = self.get_wallets(row)
+        tx_description = "Manually imported transaction"
+        if rox_description := row.get("description"):
+            tx_description += f" ({rox_description})"
+        tx_creator = TransactionCreator(
+            timestamp=bstrptime(row["timestamp"]),
+            description=tx_description,
+            tx_id=tx_id,
+            type=TransactionType[row["type"]],
+            fill_cost_basis=False,
+        )
+        if "label" in row:
+            tx_creator.label = TransactionLabel[row["label"]]
+
         if "from_symbol" in row:
-            transaction.add_detail(
-                "from_detail",
+            tx_creator.add_from_detail(
                 wallet=wallets[0],
-                currency=get_or_create_currency(row["from_symbol"]),
+                currency=self.get_currency(row["from_symbol"]),
                 quantity=Decimal(str(row["from_amount"])),
             )
         if "to_symbol" in row:
-            transaction.add_detail(
-                "to_detail",
+            tx_creator.add_to_detail(
                 wallet=wallets[1],
-                currency=get_or_create_currency(row["to_symbol"]),
+                currency=self.get_currency(row["to_symbol"]),
                 quantity=Decimal(str(row["to_amount"])),
             )
         if "fee_symbol" in row:
-            transaction.add_detail(
-                "fee_detail",
+            tx_creator.add_fee_detail(
                 wallet=wallets[2],
-                currency=get_or_create_currency(row["fee_symbol"]),
+                currency=self.get_currency(row["fee_symbol"]),
                 quantity=Decimal(str(row["fee_amount"])),
             )
-        if "type" in row:
-            transaction.transaction_type = TransactionType[row["type"]]
-        if "label" in row:
-            transaction.transaction_label = TransactionLabel[row["label"]]
-        transaction.save()
-
-    def handle_imported_rows(self, data: list) -> None:
-        tx_ids = {self.build_transaction_id(row) for row in data}
-        existing_transactions = Transaction.objects.filter(tx_id__in=tx_ids).values_list("tx_id", flat=True)
 
-        for row in data:
-            tx_id = self.build_transaction_id(row)
-
-            # Update already imported transactions
-            if tx_id in existing_transactions:
-                self.update_existing_transaction(row, tx_id)
-                continue
-
-            if not row.get("timestamp"):
-                logger.error(
-                    f"Missing timestamp or wallet in row: '{row}'. "
-                    f"Did you try to update an existing transaction which is not yet imported?"
-                )
-                raise InvalidImportRowException(f"Missing timestamp or wallet in row. {row}")
-
-            wallets = self.get_wallets(row)
-            tx_description = "Manually imported transaction"
-            if rox_description := row.get("description"):
-                tx_description += f" ({rox_description})"
-            tx_creator = TransactionCreator(
-                timestamp=bstrptime(row["timestamp"]),
-                description=tx_description,
-                tx_id=tx_id,
-                type=TransactionType[row["type"]],
-                fill_cost_basis=False,
-            )
-            if "label" in row:
-                tx_creator.label = TransactionLabel[row["label"]]
-
-            if "from_symbol" in row:
-                tx_creator.add_from_detail(
-                    wallet=wallets[0],
-                    currency=get_or_create_currency(row["from_symbol"]),
-                    quantity=Decimal(str(row["from_amount"])),
-                )
-            if "to_symbol" in row:
-                tx_creator.add_to_detail(
-                    wallet=wallets[1],
-                    currency=get_or_create_currency(row["to_symbol"]),
-                    quantity=Decimal(str(row["to_amount"])),
-                )
-            if "fee_symbol" in row:
-                tx_creator.add_fee_detail(
-                    wallet=wallets[2],
-                    currency=get_or_create_currency(row["fee_symbol"]),
-                    quantity=Decimal(str(row["fee_amount"])),
-                )
-
-            tx_creator.create_transaction()
-
-    @atomic
-    def handle(self, *args, **kwargs):
-        transactions_count = Transaction.objects.count()
-
-        filename = kwargs.pop("file") or "import.json"
-        filepath = os.path.join(settings.BASE_DIR, filename)
-
-        with open(filepath) as json_file:
-            data = json.load(json_file)
-            self.handle_imported_rows(data)
-
-        logger.info(f"New transactions created: {Transaction.objects.count() - transactions_count}")
+        batch.add(tx_creator)
@@ -1,29 +1,39 @@
 import csv
+import io
 import logging
-import os
 import sys
+from collections.abc import Iterator
 from datetime import UTC, datetime
-from decimal import Decimal
 
-from django.conf import settings
-from django.core.management import BaseCommand
-from django.db.transaction import atomic
-
-from crypto_fifo_taxes.enums import TransactionLabel
-from crypto_fifo_taxes.models import Transaction, Wallet
-from crypto_fifo_taxes.utils.currency import get_or_create_currency
-from crypto_fifo_taxes.utils.transaction_creator import TransactionCreator
+from crypto_fifo_taxes.enums import TransactionLabel, TransactionType
+from crypto_fifo_taxes.utils.file_importer import FileImportCommand
+from crypto_fifo_taxes.utils.import_spec import ImportSpec
 
 logging.basicConfig(stream=sys.stdout, level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-
-class Command(BaseCommand):
-    wallet = Wallet.objects.get(name="Nicehash")
-    btc = get_or_create_currency(symbol="BTC")
-
-    def add_arguments(self, parser) -> None:
-        parser.add_argument("--file", type=str)
+REWARD_PURPOSE = "Hashpower mining"
+FEE_PURPOSE = "Hashpower mining fee"
+
+
+class Command(FileImportCommand):
+    default_filename = "nicehash_report.csv"
+    # One row per date, so a single chunk covers decades of reports
+    default_chunk_size = 10000
+    import_spec = ImportSpec(
+        wallet="Nicehash",
+        description="Nicehash csv imported transaction",
+        transaction_type=TransactionType.DEPOSIT,
+        label=TransactionLabel.MINING,
+        timestamp_column="Date time",
+        timestamp_format="%Y-%m-%d %H:%M:%S GMT",
+        quantity_column="reward",
+        symbol="BTC",
+        # Fees are negative in the report
+        absolute_quantities=True,
+        fee_column="fee",
+        fee_symbol="BTC",
+    )
 
     @staticmethod
     def nstrptime(stamp: str) -> datetime:
@@ -35,54 +45,27 @@ class Command(BaseCommand):
         """
         return datetime.strptime(stamp, "%Y-%m-%d %H:%M:%S GMT").replace(tzinfo=UTC)
 
-    def import_income_row(self, data, row: dict[str, str]) -> None:
-        pass
-
-    def import_fee_row(self, data, row: dict[str, str]) -> None:
-        pass
-
     def get_tx_td(self, date: str):
         return f"Nicehash-{self.nstrptime(date).date()}"
 
-    def import_data(self, data: list[dict[str, str]]) -> None:
-        dates = [r["Date time"] for r in data if r["Date time"] and r["Date time"] != "∑"]
-
-        # Iterate by dates, because there are multiple transactions per date, and they should be combined
-        for date in dates:
-            tx_id = self.get_tx_td(date)
-
-            # If data is already imported, skip date
-            if Transaction.objects.filter(tx_id=tx_id).exists():
+    def iter_rows(self, file: io.TextIOBase) -> Iterator[dict]:
+        """
+        There are multiple rows per date (reward and fee), which are combined to a single transaction.
+        Group the amounts by date in a single pass, then yield one row per date.
+        """
+        amounts_by_date: dict[str, dict[str, str]] = {}
+        for row in csv.DictReader(file):
+            date = row["Date time"]
+            if not date or date == "∑":
                 continue
 
-            # Get nicehash transactions with the same date
-            nicehash_transactions = [r for r in data if r["Date time"] == date]
-            assert len(nicehash_transactions) == 2  # Reward and Fee
-            reward = next(filter(lambda r: r["Purpose"] == "Hashpower mining", nicehash_transactions))
-            fee = next(filter(lambda r: r["Purpose"] == "Hashpower mining fee", nicehash_transactions))
-            assert reward
-            assert fee
-
-            tx_creator = TransactionCreator(
-                timestamp=self.nstrptime(date),
-                tx_id=tx_id,
-                description="Nicehash csv imported transaction",
-                label=TransactionLabel.MINING,
-                fill_cost_basis=False,
-            )
-            tx_creator.add_to_detail(wallet=self.wallet, currency=self.btc, quantity=Decimal(reward["Amount (BTC)"]))
-            tx_creator.add_fee_detail(wallet=self.wallet, currency=self.btc, quantity=abs(Decimal(fee["Amount (BTC)"])))
-            tx_creator.create_deposit()
-
-    @atomic
-    def handle(self, *args, **kwargs) -> None:
-        transactions_count = Transaction.objects.count()
-
-        filename = kwargs.pop("file") or "nicehash_report.csv"
-        filepath = os.path.join(settings.BASE_DIR, filename)
+            amounts = amounts_by_date.setdefault(date, {})
+            assert row["Purpose"] not in amounts, f"Multiple `{row['Purpose']}` rows for {date}"
+            amounts[row["Purpose"]] = row["Amount (BTC)"]
 
-        with open(filepath) as csv_file:
-            reader = csv.DictReader(csv_file)
-            self.import_data(list(reader))
+        for date, amounts in amounts_by_date.items():
+            assert len(amounts) == 2  # Reward and Fee
+            yield {"Date time": date, "reward": amounts[REWARD_PURPOSE], "fee": amounts[FEE_PURPOSE]}
 
-        logger.info(f"New transactions created: {Transaction.objects.count() - transactions_count}")
+    def build_transaction_id(self, row: dict) -> str:
+        return self.get_tx_td(row["Date time"])
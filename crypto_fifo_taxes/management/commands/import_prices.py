@@ -0,0 +1,157 @@
+import csv
+import gzip
+import io
+import json
+import logging
+import os
+import sys
+from collections.abc import Iterator
+from datetime import UTC, date, datetime
+from decimal import Decimal
+
+from django.conf import settings
+from django.core.management import BaseCommand, CommandError
+
+from crypto_fifo_taxes.models import Currency, CurrencyPrice
+from crypto_fifo_taxes.utils.binance.binance_api import from_timestamp
+from crypto_fifo_taxes.utils.currency import bulk_upsert_currency_prices, get_currency
+from crypto_fifo_taxes.utils.price_store import export_price_store
+
+logging.basicConfig(stream=sys.stdout, level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+
+def open_price_dump(filepath: str) -> io.TextIOBase:
+    """Open a price dump as text, decompressing it on the fly if it is gzipped."""
+    if filepath.endswith(".gz"):
+        return gzip.open(filepath, mode="rt", newline="")
+    return open(filepath, newline="")  # noqa: SIM115
+
+
+def parse_price_date(value: str) -> date:
+    """
+    Parse the date of a price row.
+
+    Accepts plain dates (`2021-01-01`), CoinGecko CSV export dates (`2021-01-01 00:00:00 UTC`)
+    and millisecond timestamps (`1609459200000`).
+    """
+    value = value.strip()
+    if value.isdigit():
+        return from_timestamp(int(value)).date()
+    return datetime.strptime(value[:10], "%Y-%m-%d").replace(tzinfo=UTC).date()
+
+
+def _decimal_or_zero(value: str | float | None) -> Decimal:
+    if value is None or value == "":
+        return Decimal(0)
+    return Decimal(str(value))
+
+
+class Command(BaseCommand):
+    help = (
+        "Import historical prices from local CSV or CoinGecko market chart JSON files (optionally gzipped). "
+        "CSV files must have `date` (or `snapped_at`) and `price` columns, and optionally `symbol`, "
+        "`market_cap` and `volume` (or `total_volume`) columns. "
+        "Files without a `symbol` column are imported for `--symbol`, or the symbol in the file name."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("files", nargs="+", type=str)
+        parser.add_argument("--symbol", type=str, help="Currency symbol for files that don't contain one")
+        parser.add_argument("--format", type=str, choices=["csv", "json"], help="Detected from the file name")
+        parser.add_argument("--batch-size", type=int, default=10000)
+
+    def get_currency(self, symbol: str) -> Currency | None:
+        """Map the symbol to a currency, caching the result (also misses) to keep the import free of lookups."""
+        symbol = symbol.strip().upper()
+        if symbol not in self.currencies:
+            try:
+                self.currencies[symbol] = get_currency(symbol)
+            except Currency.DoesNotExist:
+                logger.warning(f"Currency `{symbol}` does not exist, skipping its prices.")
+                self.currencies[symbol] = None
+        return self.currencies[symbol]
+
+    @staticmethod
+    def get_file_symbol(filepath: str) -> str:
+        """e.g. `/dumps/btc.csv.gz` -> `BTC`"""
+        return os.path.basename(filepath).split(".")[0].upper()
+
+    def get_file_format(self, filepath: str) -> str:
+        if self.format is not None:
+            return self.format
+        name = filepath.removesuffix(".gz")
+        if name.endswith(".json"):
+            return "json"
+        if name.endswith(".csv"):
+            return "csv"
+        raise CommandError(f"Unable to detect the format of `{filepath}`, use `--format`.")
+
+    def iter_csv_prices(self, price_file: io.TextIOBase, default_symbol: str) -> Iterator[CurrencyPrice]:
+        for row in csv.DictReader(price_file):
+            currency = self.get_currency(row.get("symbol") or default_symbol)
+            if currency is None or currency.is_fiat:
+                continue
+
+            yield CurrencyPrice(
+                currency=currency,
+                date=parse_price_date(row["date"] if "date" in row else row["snapped_at"]),
+                price=_decimal_or_zero(row["price"]),
+                market_cap=_decimal_or_zero(row.get("market_cap")),
+                volume=_decimal_or_zero(row.get("volume", row.get("total_volume"))),
+            )
+
+    def iter_json_prices(self, price_file: io.TextIOBase, default_symbol: str) -> Iterator[CurrencyPrice]:
+        """
+        A CoinGecko market chart contains the prices of a single currency, one entry per day,
+        so its size is bounded by the length of the price history, not by the size of the whole dump.
+        """
+        currency = self.get_currency(default_symbol)
+        if currency is None or currency.is_fiat:
+            return
+
+        market_chart = json.load(price_file)
+        market_caps = market_chart.get("market_caps") or []
+        volumes = market_chart.get("total_volumes") or []
+        for i, (stamp, price) in enumerate(market_chart["prices"]):
+            yield CurrencyPrice(
+                currency=currency,
+                date=from_timestamp(stamp).date(),
+                price=_decimal_or_zero(price),
+                market_cap=_decimal_or_zero(market_caps[i][1] if i < len(market_caps) else None),
+                volume=_decimal_or_zero(volumes[i][1] if i < len(volumes) else None),
+            )
+
+    def import_file(self, filepath: str) -> int:
+        default_symbol = self.symbol or self.get_file_symbol(filepath)
+        file_format = self.get_file_format(filepath)
+
+        imported_count = 0
+        batch: list[CurrencyPrice] = []
+        with open_price_dump(filepath) as price_file:
+            prices = (
+                self.iter_json_prices(price_file, default_symbol)
+                if file_format == "json"
+                else self.iter_csv_prices(price_file, default_symbol)
+            )
+            for currency_price in prices:
+                batch.append(currency_price)
+                if len(batch) >= self.batch_size:
+                    imported_count += bulk_upsert_currency_prices(batch, batch_size=self.batch_size)
+                    batch = []
+            imported_count += bulk_upsert_currency_prices(batch, batch_size=self.batch_size)
+
+        logger.info(f"Imported {imported_count} prices from `{filepath}`.")
+        return imported_count
+
+    def handle(self, *args, **kwargs):
+        self.symbol = kwargs.pop("symbol", None)
+        self.format = kwargs.pop("format", None)
+        self.batch_size = kwargs.pop("batch_size", 10000)
+        self.currencies: dict[str, Currency | None] = {}
+
+        imported_count = sum(self.import_file(filepath) for filepath in kwargs.pop("files"))
+        logger.info(f"Prices imported: {imported_count}")
+
+        if settings.PRICE_STORE_DIR and imported_count:
+            export_price_store()
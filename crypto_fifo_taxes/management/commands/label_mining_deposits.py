@@ -0,0 +1,21 @@
+import logging
+import sys
+
+from django.core.management import BaseCommand
+
+from crypto_fifo_taxes.utils.ethplorer import label_mining_deposits
+from crypto_fifo_taxes.utils.wrappers import print_time_elapsed
+
+logging.basicConfig(stream=sys.stdout, level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+
+class Command(BaseCommand):
+    help = "Label ETH deposits sent from known mining pools as mining income"
+
+    @print_time_elapsed
+    def label_mining_deposits(self):
+        label_mining_deposits()
+
+    def handle(self, *args, **kwargs):
+        self.label_mining_deposits()
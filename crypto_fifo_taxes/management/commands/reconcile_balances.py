@@ -0,0 +1,58 @@
+import logging
+import sys
+from decimal import Decimal
+
+from django.core.management import BaseCommand
+
+from crypto_fifo_taxes.models import Wallet
+from crypto_fifo_taxes.utils.balance_reconciliation import find_balance_divergences
+from crypto_fifo_taxes.utils.binance.binance_wallet import (
+    import_binance_account_snapshots,
+    save_binance_balance_snapshot,
+)
+from crypto_fifo_taxes.utils.wrappers import print_time_elapsed
+
+logging.basicConfig(stream=sys.stdout, level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+
+class Command(BaseCommand):
+    help = (
+        "Compare the stored exchange balance snapshots of a wallet with the balances of its transactions, "
+        "and find the first snapshot where the balance of each currency diverges."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--wallet", type=str, default="Binance", help="Name of the wallet. Default: Binance")
+        parser.add_argument(
+            "--save-binance-snapshot",
+            action="store_true",
+            help="Store the live Binance wallet balance as a snapshot before reconciling",
+        )
+        parser.add_argument(
+            "--import-binance-snapshots",
+            action="store_true",
+            help="Store the daily Binance SPOT account snapshots of the last month before reconciling",
+        )
+        parser.add_argument(
+            "--tolerance", type=Decimal, default=Decimal(0), help="Ignore differences up to this quantity"
+        )
+
+    @print_time_elapsed
+    def handle(self, *args, **options):
+        if options["import_binance_snapshots"]:
+            logger.info(f"Stored {import_binance_account_snapshots()} daily Binance account snapshots.")
+        if options["save_binance_snapshot"]:
+            save_binance_balance_snapshot()
+
+        wallet = Wallet.objects.get(name=options["wallet"])
+        divergences = find_balance_divergences(wallet, tolerance=options["tolerance"])
+        if not divergences:
+            logger.info(f"All balances of {wallet} match the snapshots.")
+
+        for divergence in divergences:
+            logger.info(
+                f"{divergence.symbol}: diverged by {divergence.difference} "
+                f"between {divergence.last_matching or 'the beginning'} and {divergence.first_diverging} "
+                f"(snapshot: {divergence.snapshot_balance}, transactions: {divergence.local_balance})"
+            )
@@ -1,13 +1,20 @@
 import logging
 import sys
-import time
+from collections import deque
+from collections.abc import Callable, Iterable, Iterator
+from concurrent.futures import Future, ThreadPoolExecutor
 from datetime import datetime
+from functools import cached_property
 
-from binance.exceptions import BinanceAPIException
-from django.core.management import BaseCommand
+from django.conf import settings
+from django.core.management import BaseCommand, CommandError
+from django.db.models import Value
+from django.db.models.functions import Greatest
+from django.utils import timezone
 
-from crypto_fifo_taxes.models import CurrencyPair, Wallet
+from crypto_fifo_taxes.models import BinanceTradeCursor, CurrencyPair, Transaction, Wallet
 from crypto_fifo_taxes.utils.binance.binance_api import (
+    EXCHANGE_INFO_WEIGHT,
     get_binance_beth_interest_history,
     get_binance_client,
     get_binance_deposits,
@@ -15,9 +22,11 @@ from crypto_fifo_taxes.utils.binance.binance_api import (
     get_binance_dust_log,
     get_binance_flexible_interest_history,
     get_binance_locked_interest_history,
+    get_binance_pair_trades,
     get_binance_withdraws,
     get_convert_trade_history,
 )
+from crypto_fifo_taxes.utils.binance.binance_client import BinanceClient
 from crypto_fifo_taxes.utils.binance.binance_importer import (
     import_convert_trade_history,
     import_deposits,
@@ -27,22 +36,95 @@ from crypto_fifo_taxes.utils.binance.binance_importer import (
     import_pair_trades,
     import_withdrawals,
 )
+from crypto_fifo_taxes.utils.binance.candidate_pairs import get_candidate_pairs, get_held_assets
+from crypto_fifo_taxes.utils.binance.response_archive import read_response_archive
+from crypto_fifo_taxes.utils.binance.sync_watermark import (
+    get_sync_start_date,
+    get_sync_watermarks,
+    is_watermark_covered,
+    save_sync_watermark,
+)
 from crypto_fifo_taxes.utils.currency import get_or_create_currency_pair
+from crypto_fifo_taxes.utils.ethplorer import label_mining_deposits
+from crypto_fifo_taxes.utils.import_pipeline import ImportSource, run_import_pipeline
 from crypto_fifo_taxes.utils.wrappers import print_time_elapsed_new_transactions
 
 logging.basicConfig(stream=sys.stdout, level=logging.INFO)
 logger = logging.getLogger(__name__)
 
 
+# Archived endpoints, the key of the rows in their responses, and the source they are imported as.
+# In the order of `Command.get_import_sources`. Trades are replayed separately, as they are imported by pair,
+# and after all other sources.
+REPLAYED_ENDPOINTS: dict[str, tuple[str | None, str, Callable]] = {
+    "/sapi/v1/asset/dribblet": ("userAssetDribblets", "sync_dust", import_dust),
+    "/sapi/v1/asset/assetDividend": ("rows", "sync_dividends", import_dividends),
+    "/sapi/v1/simple-earn/flexible/history/rewardsRecord": ("rows", "sync_interest_flexible", import_interest),
+    "/sapi/v1/simple-earn/locked/history/rewardsRecord": ("rows", "sync_interest_locked", import_interest),
+    "/sapi/v1/eth-staking/eth/history/rewardsHistory": ("rows", "sync_interest_eth", import_interest),
+    "/sapi/v1/capital/deposit/hisrec": (None, "sync_deposits", import_deposits),
+    "/sapi/v1/capital/withdraw/history": (None, "sync_withdrawals", import_withdrawals),
+    "/sapi/v1/convert/tradeFlow": ("list", "sync_convert_trade_history", import_convert_trade_history),
+}
+MY_TRADES_ENDPOINT = "/api/v3/myTrades"
+EXCHANGE_INFO_ENDPOINT = "/api/v3/exchangeInfo"
+
+
+def join_trade_pages(trade_pages: list[tuple[str, int, list[dict]]]) -> list[tuple[str, list[dict]]]:
+    """
+    Join the archived `myTrades` pages of `(symbol, fromId, trades)` to the trades of each fetch of a pair.
+
+    A sync fetches all pages of a pair and imports them together, as the fills of an order may be split across pages,
+    and fills of an already imported order are skipped. Pairs are fetched concurrently, so their pages are interleaved
+    in the archive: a page continues the previous page of the same symbol if its `fromId` follows the last trade.
+    """
+    joined: list[tuple[str, list[dict]]] = []
+    # Trades of the last fetch of each symbol, and the id the next page of the fetch starts from
+    open_fetches: dict[str, tuple[list[dict], int]] = {}
+    for symbol, from_id, trades in trade_pages:
+        if symbol in open_fetches and open_fetches[symbol][1] == from_id:
+            pair_trades = open_fetches[symbol][0]
+            pair_trades.extend(trades)
+        else:
+            pair_trades = list(trades)
+            joined.append((symbol, pair_trades))
+        if pair_trades:
+            open_fetches[symbol] = (pair_trades, max(trade["id"] for trade in pair_trades) + 1)
+    return joined
+
+
 class Command(BaseCommand):
-    client = get_binance_client()
-    wallet = Wallet.objects.get(name="Binance")
     mode = 0  # Fast mode
     date = None
+    all_pairs = False  # Fetch all pairs in FULL mode, not only the pairs of held assets
+    held_assets: set[str] | None = None
+
+    # Resources are initialized when they are first used, not when the command is loaded,
+    # as Django loads every command e.g. for `manage.py help`. Creating the client sends a request to Binance.
+    @cached_property
+    def client(self) -> BinanceClient:
+        return get_binance_client()
+
+    @cached_property
+    def wallet(self) -> Wallet:
+        return Wallet.objects.get(name="Binance")
 
     def add_arguments(self, parser):
         parser.add_argument("-m", "--mode", type=int, help="Mode this sync will be run in. 0=fast, 1=full")
         parser.add_argument("-d", "--date", type=str, help="Start from this date. Format: YYYY-MM-DD")
+        parser.add_argument(
+            "--all-pairs",
+            action="store_true",
+            help=(
+                "In FULL mode, fetch the trades of every pair in Binance. "
+                "By default only the pairs of assets found in the wallet are fetched."
+            ),
+        )
+        parser.add_argument(
+            "--replay",
+            action="store_true",
+            help="Import the responses archived in `BINANCE_ARCHIVE_DIR`, instead of fetching them from Binance",
+        )
 
     def print_dot(self):
         print(".", end="", flush=True)  # noqa: T201,RUF100
@@ -61,119 +143,274 @@ class Command(BaseCommand):
         ]
         return all_pairs
 
-    def sync_pair(self, pair: dict | str):
-        while True:
-            try:
-                # Full sync
-                if isinstance(pair, dict):
-                    trades = self.client.get_my_trades(symbol=pair["symbol"])
-                    trading_pair = None
-                    if trades != []:
-                        trading_pair = get_or_create_currency_pair(
-                            symbol=pair["symbol"],
-                            buy=pair["baseAsset"],
-                            sell=pair["quoteAsset"],
-                        )
-                    time.sleep(0.1)  # Reduce the frequency of cooldowns
-                # Fast sync
-                else:
-                    trades = self.client.get_my_trades(symbol=pair)
-                    trading_pair = CurrencyPair.objects.get(symbol=pair)
-
-                if trading_pair is not None:
-                    print(trading_pair, end=".", flush=True)  # noqa: T201,RUF100
-                    import_pair_trades(wallet=self.wallet, trading_pair=trading_pair, trades=trades)
-                else:
-                    self.print_dot()
-                break
-            except BinanceAPIException as e:
-                if "Too much request weight used" in str(e):
-                    logger.info("\nToo much Binance API weight used, on cooldown")
-                    time.sleep(15)  # API cool down time is not accessible. Try again soon
+    def fetch_trades(
+        self, pairs: list[dict | str] | None, cursors: dict[str, int]
+    ) -> Iterator[tuple[dict | str, list[dict]]]:
+        """
+        Fetch the trades of the pairs concurrently, paced by the request weight limiter of the client.
+        Only trades after the cursor of each pair are fetched.
+        Trades are yielded in the order of the pairs, so they are imported in the same order on every run.
 
-    @print_time_elapsed_new_transactions
-    def sync_deposits(self) -> None:
-        for deposits in get_binance_deposits(start_date=self.date):
-            self.print_dot()
-            import_deposits(self.wallet, deposits)
+        In FULL mode, only the pairs of which both sides are in `held_assets` are fetched, out of all pairs in Binance,
+        unless `all_pairs` is set. An asset only ever held between two trades is not found in the wallet,
+        so the trades of its pairs are only synced with `all_pairs`.
+        """
+        if pairs is None:
+            # FULL sync
+            # Fetch any new trading pairs from Binance
+            self.client.weight_limiter.acquire(EXCHANGE_INFO_WEIGHT)
+            all_pairs = self.get_all_pairs()
+            if self.all_pairs:
+                pairs = all_pairs
+            else:
+                pairs = get_candidate_pairs(all_pairs, self.held_assets)
+                self.log_excluded_pairs(all_pairs, pairs)
+            logger.info(f"Syncing trades using FULL mode for {len(pairs)} of {len(all_pairs)} pairs...")
 
-    @print_time_elapsed_new_transactions
-    def sync_withdrawals(self) -> None:
-        for withdraws in get_binance_withdraws(start_date=self.date):
-            self.print_dot()
-            import_withdrawals(self.wallet, withdraws)
+        def fetch_pair_trades(pair: dict | str) -> list[dict]:
+            symbol = pair["symbol"] if isinstance(pair, dict) else pair
+            from_id = cursors[symbol] + 1 if symbol in cursors else 0
+            return get_binance_pair_trades(symbol, from_id=from_id)
 
-    @print_time_elapsed_new_transactions
-    def sync_convert_trade_history(self) -> None:
-        for converts in get_convert_trade_history(start_date=self.date):
-            self.print_dot()
-            import_convert_trade_history(self.wallet, converts["list"])
+        # Only a few pairs are fetched ahead of the writer, so that fetched trades don't pile up in memory
+        executor = ThreadPoolExecutor(max_workers=settings.BINANCE_MAX_WORKERS)
+        pending: deque[tuple[dict | str, Future]] = deque()
+        try:
+            for pair in pairs:
+                pending.append((pair, executor.submit(fetch_pair_trades, pair)))
+                if len(pending) > settings.BINANCE_MAX_WORKERS * 2:
+                    pending_pair, future = pending.popleft()
+                    yield pending_pair, future.result()
+            while pending:
+                pending_pair, future = pending.popleft()
+                yield pending_pair, future.result()
+        finally:
+            # If the pipeline is cancelled, the generator is closed: don't fetch the remaining pairs
+            executor.shutdown(cancel_futures=True)
 
-    @print_time_elapsed_new_transactions
-    def sync_dust(self):
-        import_dust(self.wallet, get_binance_dust_log())
+    def load_held_assets(self) -> None:
+        """Find the assets held in the wallet, to plan the pairs of a FULL sync. Called from the writer thread."""
+        self.held_assets = get_held_assets(self.wallet)
 
-    @print_time_elapsed_new_transactions
-    def sync_dividends(self):
-        for dividends in get_binance_dividends(start_date=self.date):
-            self.print_dot()
-            import_dividends(self.wallet, dividends)
+    def log_excluded_pairs(self, all_pairs: list[dict], pairs: list[dict]) -> None:
+        symbols = {pair["symbol"] for pair in pairs}
+        excluded = [pair for pair in all_pairs if pair["symbol"] not in symbols]
+        # Pairs with one held side are where trades through an otherwise never held asset would be
+        partially_held = [
+            pair["symbol"]
+            for pair in excluded
+            if pair["baseAsset"] in self.held_assets or pair["quoteAsset"] in self.held_assets
+        ]
+        logger.info(
+            f"Excluded {len(excluded)} pairs of assets not found in the wallet, use `--all-pairs` to sync them. "
+            f"Excluded pairs with one held asset: {', '.join(partially_held) or '-'}"
+        )
+        logger.debug(f"Excluded pairs: {', '.join(pair['symbol'] for pair in excluded)}")
 
-    @print_time_elapsed_new_transactions
-    def sync_interest_flexible(self):
-        for interests in get_binance_flexible_interest_history(start_date=self.date):
-            self.print_dot()
-            import_interest(self.wallet, interests)
+    def import_trades(self, pair_trades: tuple[dict | str, list[dict]]) -> None:
+        pair, trades = pair_trades
+        # Full sync
+        if isinstance(pair, dict):
+            trading_pair = None
+            if trades != []:
+                trading_pair = get_or_create_currency_pair(
+                    symbol=pair["symbol"],
+                    buy=pair["baseAsset"],
+                    sell=pair["quoteAsset"],
+                )
+        # Fast sync
+        else:
+            trading_pair = CurrencyPair.objects.get(symbol=pair)
 
-    @print_time_elapsed_new_transactions
-    def sync_interest_locked(self):
-        for interests in get_binance_locked_interest_history(start_date=self.date):
+        if trading_pair is not None:
+            print(trading_pair, end=".", flush=True)  # noqa: T201,RUF100
+            import_pair_trades(wallet=self.wallet, trading_pair=trading_pair, trades=trades)
+        else:
             self.print_dot()
-            import_interest(self.wallet, interests)
 
-    @print_time_elapsed_new_transactions
-    def sync_interest_eth(self):
-        for interests in get_binance_beth_interest_history(start_date=self.date):
-            self.print_dot()
-            import_interest(self.wallet, interests)
+        if trades:
+            # The next sync continues after the last imported trade.
+            # The cursor is only moved forward, as replayed archives may be older than the last sync.
+            last_trade_id = max(trade["id"] for trade in trades)
+            BinanceTradeCursor.objects.update_or_create(
+                symbol=trading_pair.symbol,
+                create_defaults={"last_trade_id": last_trade_id},
+                defaults={"last_trade_id": Greatest("last_trade_id", Value(last_trade_id))},
+            )
 
-    @print_time_elapsed_new_transactions
-    def sync_trades(self) -> None:
-        pairs = []
+    def get_trade_pairs(self) -> list[str] | None:
+        """Return the pairs to sync in FAST mode, or None in FULL mode, where the pairs are fetched from Binance."""
         if not self.mode:
             # FAST sync.
             # Sync only trading pairs which already have records
-            pairs = CurrencyPair.objects.values_list("symbol", flat=True)
+            pairs = list(CurrencyPair.objects.values_list("symbol", flat=True))
             if len(pairs) > 1:
                 logger.info(f"Syncing trades using FAST mode for {len(pairs)} pairs...")
-            else:
-                logger.info("No existing currency pairs found for FAST mode sync. Running in FULL sync.")
-                self.mode = 1
+                return pairs
+            logger.info("No existing currency pairs found for FAST mode sync. Running in FULL sync.")
+            self.mode = 1
+        return None
 
-        if self.mode == 1:
-            # FULL sync
-            # Fetch any new trading pairs from Binance
-            pairs = self.get_all_pairs()
-            logger.info(f"Syncing trades using FULL mode for {len(pairs)} pairs. This will take over ten minutes...")
+    def get_history_source(
+        self,
+        name: str,
+        fetch: Callable[[], Iterable],
+        import_func: Callable,
+        finish: Callable[[], None] | None = None,
+    ) -> ImportSource:
+        def write(data) -> None:
+            self.print_dot()
+            import_func(self.wallet, data)
+
+        return ImportSource(name=name, fetch=fetch, write=write, finish=finish)
+
+    @staticmethod
+    def get_known_tx_ids_import(import_func: Callable, start_date: datetime | None) -> Callable:
+        """
+        Return `import_func` checking every page against a set of the tx_ids imported since `start_date`.
+        The set is loaded with a single query on the first page, instead of a query for each page.
+        """
+        known_tx_ids: set[str] | None = None
+
+        def import_page(wallet: Wallet, rows: list) -> None:
+            nonlocal known_tx_ids
+            if known_tx_ids is None:
+                # `start_date` is a naive local datetime
+                since = start_date.astimezone() if start_date is not None else None
+                known_tx_ids = Transaction.objects.imported_tx_ids(since)
+            import_func(wallet, rows, known_tx_ids=known_tx_ids)
+
+        return import_page
+
+    def get_synced_history_source(
+        self,
+        name: str,
+        fetch_history: Callable[[datetime | None], Iterable],
+        import_func: Callable,
+        watermarks: dict[str, datetime],
+        synced_until: datetime,
+        load_known_tx_ids: bool = False,
+    ) -> ImportSource:
+        """
+        Return a source of a history endpoint, which resumes from the watermark of the endpoint.
+        The watermark is advanced to `synced_until` after the whole history has been imported.
+        With `load_known_tx_ids`, pages are deduplicated with `get_known_tx_ids_import`.
+        """
+        start_date = get_sync_start_date(watermarks.get(name), self.date)
+
+        def finish() -> None:
+            save_sync_watermark(name, self.wallet, synced_until)
 
-        for pair in pairs:
-            self.sync_pair(pair)
+        return self.get_history_source(
+            name,
+            lambda: fetch_history(start_date),
+            self.get_known_tx_ids_import(import_func, start_date) if load_known_tx_ids else import_func,
+            finish=finish if is_watermark_covered(start_date, watermarks.get(name)) else None,
+        )
+
+    def get_import_sources(self) -> list[ImportSource]:
+        """
+        Return every synced Binance endpoint as a separate import source.
+        The endpoints are fetched concurrently, and imported in this order.
+        """
+        # Create the client before the sources fetch concurrently with it
+        self.client  # noqa: B018
+        pairs = self.get_trade_pairs()
+        plan_pairs = pairs is None and not self.all_pairs
+        cursors = dict(BinanceTradeCursor.objects.values_list("symbol", "last_trade_id"))
+        watermarks = get_sync_watermarks(self.wallet)
+        # Records created while syncing are synced again by the next sync, within the overlap
+        synced_until = timezone.now()
+
+        def history_source(
+            name: str, fetch_history: Callable, import_func: Callable, load_known_tx_ids: bool = False
+        ) -> ImportSource:
+            return self.get_synced_history_source(
+                name, fetch_history, import_func, watermarks, synced_until, load_known_tx_ids
+            )
+
+        return [
+            history_source("sync_dust", get_binance_dust_log, import_dust, load_known_tx_ids=True),
+            history_source("sync_dividends", get_binance_dividends, import_dividends),
+            history_source("sync_interest_flexible", get_binance_flexible_interest_history, import_interest),
+            history_source("sync_interest_locked", get_binance_locked_interest_history, import_interest),
+            history_source("sync_interest_eth", get_binance_beth_interest_history, import_interest),
+            history_source("sync_deposits", get_binance_deposits, import_deposits),
+            history_source("sync_withdrawals", get_binance_withdraws, import_withdrawals),
+            history_source(
+                "sync_convert_trade_history",
+                get_convert_trade_history,
+                import_convert_trade_history,
+                load_known_tx_ids=True,
+            ),
+            ImportSource(
+                name="sync_trades",
+                fetch=lambda: self.fetch_trades(pairs, cursors),
+                write=self.import_trades,
+                # In FULL mode, the candidate pairs are planned from the assets imported by the previous sources.
+                # They are read in the writer thread, which sees everything written so far.
+                prepare=self.load_held_assets if plan_pairs else None,
+                wait_for_previous=plan_pairs,
+            ),
+        ]
+
+    def get_replay_sources(self, archive_dir: str) -> list[ImportSource]:
+        """
+        Return the responses archived in `archive_dir` as import sources, in the same order as `get_import_sources`.
+        Every archived page is imported with the same import function as when syncing, without requests to Binance.
+        """
+        pages: dict[str, list] = {endpoint: [] for endpoint in REPLAYED_ENDPOINTS}
+        trade_pages: list[tuple[str, int, list[dict]]] = []
+        pairs: dict[str, dict] = {}
+        for record in read_response_archive(archive_dir):
+            endpoint, response = record["endpoint"], record["response"]
+            if endpoint in REPLAYED_ENDPOINTS:
+                rows_key = REPLAYED_ENDPOINTS[endpoint][0]
+                pages[endpoint].append(response if rows_key is None else response.get(rows_key, []))
+            elif endpoint == MY_TRADES_ENDPOINT:
+                trade_pages.append((record["params"]["symbol"], int(record["params"].get("fromId", 0)), response))
+            elif endpoint == EXCHANGE_INFO_ENDPOINT:
+                pairs.update(
+                    (s["symbol"], {"symbol": s["symbol"], "baseAsset": s["baseAsset"], "quoteAsset": s["quoteAsset"]})
+                    for s in response["symbols"]
+                )
+
+        sources = [
+            self.get_history_source(name, lambda endpoint=endpoint: pages[endpoint], import_func)
+            for endpoint, (_, name, import_func) in REPLAYED_ENDPOINTS.items()
+        ]
+        # Pairs not in an archived exchange info are expected to exist already, like in FAST mode
+        sources.append(
+            ImportSource(
+                name="sync_trades",
+                fetch=lambda: ((pairs.get(symbol, symbol), trades) for symbol, trades in join_trade_pages(trade_pages)),
+                write=self.import_trades,
+            ),
+        )
+        return sources
 
     @print_time_elapsed_new_transactions
     def sync_binance_full(self):
-        self.sync_dust()
-        self.sync_dividends()
-        self.sync_interest_flexible()
-        self.sync_interest_locked()
-        self.sync_interest_eth()
-        self.sync_deposits()
-        self.sync_trades()
-        self.sync_convert_trade_history()
-        self.sync_withdrawals()
+        run_import_pipeline(self.get_import_sources())
+        label_mining_deposits()
+
+    @print_time_elapsed_new_transactions
+    def replay_binance(self):
+        archive_dir = settings.BINANCE_ARCHIVE_DIR
+        if not archive_dir:
+            raise CommandError("Set `BINANCE_ARCHIVE_DIR` to replay the archived Binance responses.")
+        logger.info(f"Importing archived Binance responses from `{archive_dir}`...")
+        run_import_pipeline(self.get_replay_sources(archive_dir))
+        label_mining_deposits()
 
     # @atomic
     def handle(self, *args, **kwargs):
+        if kwargs.pop("replay"):
+            self.replay_binance()
+            return
+
         self.mode = kwargs.pop("mode")
+        self.all_pairs = kwargs.pop("all_pairs")
         if not self.mode:
             # Use date only if fast mode is enabled
             self.date = kwargs.pop("date")
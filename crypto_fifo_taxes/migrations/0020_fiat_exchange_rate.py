@@ -0,0 +1,53 @@
+# Generated by Django 5.0.14 on 2026-10-19 06:16
+
+import crypto_fifo_taxes.utils.models
+import django.core.validators
+import django.db.models.deletion
+from decimal import Decimal
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("crypto_fifo_taxes", "0019_remove_fiat_connections"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="FiatExchangeRate",
+            fields=[
+                ("id", models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name="ID")),
+                ("date", models.DateField()),
+                (
+                    "rate",
+                    crypto_fifo_taxes.utils.models.TransactionDecimalField(
+                        decimal_places=14,
+                        default=Decimal("0"),
+                        max_digits=32,
+                        validators=[django.core.validators.MinValueValidator(Decimal("0"))],
+                    ),
+                ),
+                (
+                    "base",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="+",
+                        to="crypto_fifo_taxes.currency",
+                        verbose_name="Base currency",
+                    ),
+                ),
+                (
+                    "quote",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="exchange_rates",
+                        to="crypto_fifo_taxes.currency",
+                        verbose_name="Quote currency",
+                    ),
+                ),
+            ],
+            options={
+                "unique_together": {("base", "quote", "date")},
+            },
+        ),
+    ]
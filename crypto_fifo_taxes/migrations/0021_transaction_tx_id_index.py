@@ -0,0 +1,16 @@
+# Generated by Django 5.0.14 on 2026-10-19 06:25
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("crypto_fifo_taxes", "0020_fiat_exchange_rate"),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="transaction",
+            index=models.Index(fields=["tx_id"], name="transaction_tx_id_idx"),
+        ),
+    ]
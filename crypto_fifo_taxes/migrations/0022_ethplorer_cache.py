@@ -0,0 +1,29 @@
+# Generated by Django 5.0.14 on 2026-10-19 06:29
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("crypto_fifo_taxes", "0021_transaction_tx_id_index"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="EthereumTransactionSender",
+            fields=[
+                ("id", models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name="ID")),
+                ("tx_id", models.CharField(max_length=66, unique=True, verbose_name="Transaction hash")),
+                ("from_address", models.CharField(blank=True, default="", max_length=42, verbose_name="From address")),
+                ("fetched_at", models.DateTimeField(auto_now_add=True, verbose_name="Fetched at")),
+            ],
+        ),
+        migrations.CreateModel(
+            name="MiningPoolAddress",
+            fields=[
+                ("id", models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name="ID")),
+                ("address", models.CharField(max_length=42, unique=True, verbose_name="Address")),
+                ("fetched_at", models.DateTimeField(verbose_name="Fetched at")),
+            ],
+        ),
+    ]
@@ -0,0 +1,21 @@
+# Generated by Django 5.0.14 on 2026-10-19 06:33
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("crypto_fifo_taxes", "0022_ethplorer_cache"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="BinanceTradeCursor",
+            fields=[
+                ("id", models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name="ID")),
+                ("symbol", models.CharField(max_length=20, unique=True, verbose_name="Symbol")),
+                ("last_trade_id", models.BigIntegerField(verbose_name="Last trade id")),
+                ("updated_at", models.DateTimeField(auto_now=True, verbose_name="Updated at")),
+            ],
+        ),
+    ]
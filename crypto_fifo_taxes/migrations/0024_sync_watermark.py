@@ -0,0 +1,33 @@
+# Generated by Django 5.0.14 on 2026-10-19 06:35
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("crypto_fifo_taxes", "0023_binance_trade_cursor"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="SyncWatermark",
+            fields=[
+                ("id", models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name="ID")),
+                ("endpoint", models.CharField(max_length=50, verbose_name="Endpoint")),
+                ("synced_until", models.DateTimeField(verbose_name="Synced until")),
+                ("updated_at", models.DateTimeField(auto_now=True, verbose_name="Updated at")),
+                (
+                    "wallet",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="sync_watermarks",
+                        to="crypto_fifo_taxes.wallet",
+                    ),
+                ),
+            ],
+            options={
+                "unique_together": {("endpoint", "wallet")},
+            },
+        ),
+    ]
@@ -0,0 +1,52 @@
+# Generated by Django 5.0.14 on 2026-10-19 06:49
+
+import crypto_fifo_taxes.utils.models
+import django.core.validators
+import django.db.models.deletion
+from decimal import Decimal
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("crypto_fifo_taxes", "0024_sync_watermark"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="WalletBalanceSnapshot",
+            fields=[
+                ("id", models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name="ID")),
+                ("timestamp", models.DateTimeField()),
+                (
+                    "quantity",
+                    crypto_fifo_taxes.utils.models.TransactionDecimalField(
+                        decimal_places=14,
+                        default=Decimal("0"),
+                        max_digits=32,
+                        validators=[django.core.validators.MinValueValidator(Decimal("0"))],
+                    ),
+                ),
+                (
+                    "currency",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="wallet_balance_snapshots",
+                        to="crypto_fifo_taxes.currency",
+                    ),
+                ),
+                (
+                    "wallet",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="balance_snapshots",
+                        to="crypto_fifo_taxes.wallet",
+                    ),
+                ),
+            ],
+            options={
+                "ordering": ("timestamp",),
+                "unique_together": {("wallet", "currency", "timestamp")},
+            },
+        ),
+    ]
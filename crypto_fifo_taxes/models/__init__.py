@@ -1,5 +1,7 @@
-from crypto_fifo_taxes.models.currency import Currency, CurrencyPair, CurrencyPrice
-from crypto_fifo_taxes.models.snapshot import Snapshot, SnapshotBalance
+from crypto_fifo_taxes.models.currency import Currency, CurrencyPair, CurrencyPrice, FiatExchangeRate
+from crypto_fifo_taxes.models.ethereum import EthereumTransactionSender, MiningPoolAddress
+from crypto_fifo_taxes.models.snapshot import Snapshot, SnapshotBalance, WalletBalanceSnapshot
+from crypto_fifo_taxes.models.sync import BinanceTradeCursor, SyncWatermark
 from crypto_fifo_taxes.models.transaction import Transaction, TransactionDetail
 from crypto_fifo_taxes.models.wallet import Wallet
 
@@ -7,9 +9,15 @@ __all__ = [
     "Currency",
     "CurrencyPair",
     "CurrencyPrice",
+    "FiatExchangeRate",
     "Wallet",
     "Transaction",
     "TransactionDetail",
     "Snapshot",
     "SnapshotBalance",
+    "WalletBalanceSnapshot",
+    "EthereumTransactionSender",
+    "MiningPoolAddress",
+    "BinanceTradeCursor",
+    "SyncWatermark",
 ]
@@ -1,7 +1,11 @@
 import datetime
+from decimal import Decimal
 from functools import lru_cache
+from typing import Self
 
+from django.conf import settings
 from django.db import models
+from django.db.models import ExpressionWrapper, F, OuterRef, Subquery
 from django.utils.translation import gettext_lazy as _
 
 from crypto_fifo_taxes.exceptions import MissingPriceHistoryError
@@ -38,6 +42,21 @@ def _get_cached_fiat_price(currency: "Currency", date: datetime.date) -> "Curren
     return currency_price
 
 
+def _get_exchange_rate(fiat: "Currency", date: datetime.date) -> Decimal:
+    """
+    Get the exchange rate from the default FIAT currency to another FIAT currency on a specific date.
+    Not cached, as new rates are saved while the process runs.
+    """
+    rate = (
+        FiatExchangeRate.objects.filter(base__symbol=settings.DEFAULT_FIAT_SYMBOL, quote=fiat, date=date)
+        .values_list("rate", flat=True)
+        .first()
+    )
+    if rate is None:
+        raise MissingPriceHistoryError(f"Exchange rate to `{fiat}` is missing for {date}.")
+    return rate
+
+
 class Currency(models.Model):
     """
     Basic information about a currency.
@@ -89,6 +108,37 @@ class Currency(models.Model):
 
         return _get_cached_fiat_price(self, date)
 
+    def get_price_in_fiat(self, fiat: "Currency", date: datetime.date | datetime.datetime) -> Decimal:
+        """
+        Get the price in any FIAT currency.
+        Prices are only saved in the default FIAT currency, and converted to others using the daily exchange rate.
+        """
+        if isinstance(date, datetime.datetime):
+            date = date.date()
+
+        currency_price = self.get_fiat_price(date)
+        if fiat.symbol == settings.DEFAULT_FIAT_SYMBOL:
+            return currency_price.price
+        # The price may be from a later date, if it's missing on `date`. Convert it with the rate of the same date.
+        return currency_price.price * _get_exchange_rate(fiat, currency_price.date)
+
+    def get_fiat_prices(
+        self,
+        fiat: "Currency",
+        start_date: datetime.date,
+        end_date: datetime.date | None = None,
+    ) -> dict[datetime.date, Decimal]:
+        """
+        Get all saved prices between the dates (inclusive) in any FIAT currency, converted in a single query.
+        Dates without a price or an exchange rate are not included.
+        """
+        qs = self.prices.filter(date__gte=start_date)
+        if end_date is not None:
+            qs = qs.filter(date__lte=end_date)
+        return dict(
+            qs.with_fiat_price(fiat).filter(fiat_price__isnull=False).order_by("date").values_list("date", "fiat_price")
+        )
+
 
 class CurrencyPair(models.Model):
     """
@@ -119,6 +169,25 @@ class CurrencyPair(models.Model):
         return f"<{self.__class__.__name__} ({self.pk}): {self.symbol}>"
 
 
+class CurrencyPriceQuerySet(models.QuerySet):
+    def with_fiat_price(self, fiat: Currency) -> Self:
+        """
+        Annotate `fiat_price`, the price converted from the default FIAT currency to `fiat`.
+        It is NULL for dates without an exchange rate.
+        """
+        if fiat.symbol == settings.DEFAULT_FIAT_SYMBOL:
+            return self.annotate(fiat_price=F("price"))
+
+        rate_qs = FiatExchangeRate.objects.filter(
+            base__symbol=settings.DEFAULT_FIAT_SYMBOL,
+            quote=fiat,
+            date=OuterRef("date"),
+        ).values_list("rate", flat=True)[:1]
+        return self.annotate(
+            fiat_price=ExpressionWrapper(F("price") * Subquery(rate_qs), output_field=TransactionDecimalField())
+        )
+
+
 class CurrencyPrice(models.Model):
     """
     Crypto price in FIAT on a specific date.
@@ -139,6 +208,8 @@ class CurrencyPrice(models.Model):
     # This can be used to reduce unnecessary API calls, when this CurrencyPrice is the latest one saved.
     num_missing_days = models.IntegerField(default=0)
 
+    objects = CurrencyPriceQuerySet.as_manager()
+
     class Meta:
         # Only one crypto price per day per FIAT currency
         unique_together = ("currency", "date")
@@ -148,3 +219,35 @@ class CurrencyPrice(models.Model):
 
     def __repr__(self):
         return f"<{self.__class__.__name__} ({self.pk}): {self.currency.symbol}: {self.price} ({self.date})>"
+
+
+class FiatExchangeRate(models.Model):
+    """
+    Exchange rate between two FIAT currencies on a specific date.
+    One unit of `base` is worth `rate` units of `quote`.
+    """
+
+    base = models.ForeignKey(
+        to=Currency,
+        on_delete=models.CASCADE,
+        related_name="+",
+        verbose_name=_("Base currency"),
+    )
+    quote = models.ForeignKey(
+        to=Currency,
+        on_delete=models.CASCADE,
+        related_name="exchange_rates",
+        verbose_name=_("Quote currency"),
+    )
+    date = models.DateField()
+    rate = TransactionDecimalField()
+
+    class Meta:
+        unique_together = ("base", "quote", "date")
+
+    def __str__(self):
+        return f"{self.base.symbol}/{self.quote.symbol} on {self.date} ({self.rate})"
+
+    def __repr__(self):
+        pair = f"{self.base.symbol}/{self.quote.symbol}"
+        return f"<{self.__class__.__name__} ({self.pk}): {pair}: {self.rate} ({self.date})>"
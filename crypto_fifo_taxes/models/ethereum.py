@@ -0,0 +1,29 @@
+from django.db import models
+from django.utils.translation import gettext_lazy as _
+
+
+class MiningPoolAddress(models.Model):
+    """Cached Ethereum address with the `miner` tag in Ethplorer"""
+
+    address = models.CharField(max_length=42, unique=True, verbose_name=_("Address"))
+    fetched_at = models.DateTimeField(verbose_name=_("Fetched at"))
+
+    def __str__(self):
+        return self.address
+
+    def __repr__(self):
+        return f"<{self.__class__.__name__} ({self.pk}): {self.address}>"
+
+
+class EthereumTransactionSender(models.Model):
+    """Cached sender address of an Ethereum transaction, used to find deposits from mining pools"""
+
+    tx_id = models.CharField(max_length=66, unique=True, verbose_name=_("Transaction hash"))
+    from_address = models.CharField(max_length=42, blank=True, default="", verbose_name=_("From address"))
+    fetched_at = models.DateTimeField(auto_now_add=True, verbose_name=_("Fetched at"))
+
+    def __str__(self):
+        return f"{self.tx_id} from {self.from_address or '?'}"
+
+    def __repr__(self):
+        return f"<{self.__class__.__name__} ({self.pk}): {self.tx_id}: {self.from_address}>"
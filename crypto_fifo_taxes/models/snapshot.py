@@ -52,3 +52,25 @@ class SnapshotBalance(models.Model):
         if self.cost_basis is None:
             return Decimal(0)
         return self.cost_basis * self.quantity
+
+
+class WalletBalanceSnapshot(models.Model):
+    """
+    Balance of a currency in a wallet as reported by the exchange at a point in time.
+    Compared to the balance reconstructed from the wallet's transactions to find missing transactions.
+    """
+
+    wallet = models.ForeignKey(to="Wallet", on_delete=models.CASCADE, related_name="balance_snapshots")
+    currency = models.ForeignKey(to="Currency", on_delete=models.CASCADE, related_name="wallet_balance_snapshots")
+    timestamp = models.DateTimeField()
+    quantity = TransactionDecimalField()
+
+    class Meta:
+        ordering = ("timestamp",)
+        unique_together = ("wallet", "currency", "timestamp")
+
+    def __str__(self):
+        return f"Balance of {self.currency} in {self.wallet} at {self.timestamp}"
+
+    def __repr__(self):
+        return f"<{self.__class__.__name__} ({self.pk}): {self.currency_id}, {self.quantity}, {self.timestamp})>"
@@ -0,0 +1,34 @@
+from django.db import models
+from django.utils.translation import gettext_lazy as _
+
+
+class BinanceTradeCursor(models.Model):
+    """Id of the last imported Binance trade of a trading pair, where the next sync continues from"""
+
+    symbol = models.CharField(max_length=20, unique=True, verbose_name=_("Symbol"))
+    last_trade_id = models.BigIntegerField(verbose_name=_("Last trade id"))
+    updated_at = models.DateTimeField(auto_now=True, verbose_name=_("Updated at"))
+
+    def __str__(self):
+        return f"{self.symbol} from trade {self.last_trade_id}"
+
+    def __repr__(self):
+        return f"<{self.__class__.__name__} ({self.pk}): {self.symbol}: {self.last_trade_id}>"
+
+
+class SyncWatermark(models.Model):
+    """End time of the last fully synced history of an endpoint in a wallet, where the next sync continues from"""
+
+    endpoint = models.CharField(max_length=50, verbose_name=_("Endpoint"))
+    wallet = models.ForeignKey(to="Wallet", on_delete=models.CASCADE, related_name="sync_watermarks")
+    synced_until = models.DateTimeField(verbose_name=_("Synced until"))
+    updated_at = models.DateTimeField(auto_now=True, verbose_name=_("Updated at"))
+
+    class Meta:
+        unique_together = ("endpoint", "wallet")
+
+    def __str__(self):
+        return f"{self.endpoint} of {self.wallet} synced until {self.synced_until}"
+
+    def __repr__(self):
+        return f"<{self.__class__.__name__} ({self.pk}): {self.endpoint}: {self.synced_until}>"
@@ -30,6 +30,21 @@ class TransactionQuerySet(models.QuerySet):
     def filter_currency(self, symbol: str) -> Self:
         return self.filter(Q(from_detail__currency__symbol=symbol) | Q(to_detail__currency__symbol=symbol))
 
+    def existing_tx_ids(self, tx_ids: Iterable[str]) -> set[str]:
+        """Return the given tx_ids which have already been imported, with a single indexed query."""
+        tx_ids = set(tx_ids)
+        if not tx_ids:
+            return set()
+        return set(self.filter(tx_id__in=tx_ids).values_list("tx_id", flat=True))
+
+    def imported_tx_ids(self, since: datetime.datetime | None = None) -> set[str]:
+        """
+        Return the tx_ids of all transactions from `since`, with a single query.
+        Used to check many pages of an import against the same set, instead of querying for each page.
+        """
+        queryset = self if since is None else self.filter(timestamp__gte=since)
+        return set(queryset.exclude(tx_id="").values_list("tx_id", flat=True))
+
 
 class TransactionManager(models.Manager):
     def get_queryset(self):
@@ -63,6 +78,7 @@ class Transaction(models.Model):
 
     class Meta:
         ordering = ["timestamp"]
+        indexes = [models.Index(fields=["tx_id"], name="transaction_tx_id_idx")]
 
     def __str__(self):
         if self.transaction_type == TransactionType.DEPOSIT:
@@ -0,0 +1,193 @@
+from bisect import bisect_left, bisect_right
+from collections import defaultdict
+from dataclasses import dataclass
+from datetime import datetime
+from decimal import Decimal
+from itertools import accumulate
+
+from django.conf import settings
+from django.db.models import Case, F, Q, When
+from django.db.models.functions import Coalesce
+
+from crypto_fifo_taxes.enums import TransactionType
+from crypto_fifo_taxes.models import TransactionDetail, Wallet, WalletBalanceSnapshot
+from crypto_fifo_taxes.utils.currency import get_or_create_currency
+
+__all__ = [
+    "BalanceDivergence",
+    "BalanceHistory",
+    "find_balance_divergences",
+    "get_balance_histories",
+    "save_wallet_balance_snapshot",
+]
+
+
+@dataclass(frozen=True)
+class BalanceHistory:
+    """Running balance of a currency, `balances[i]` is the balance after the transaction at `timestamps[i]`"""
+
+    timestamps: list[datetime]
+    balances: list[Decimal]
+
+    def get_balance(self, timestamp: datetime) -> Decimal:
+        """Return the balance at `timestamp`, including transactions at exactly `timestamp`"""
+        index = bisect_right(self.timestamps, timestamp)
+        return self.balances[index - 1] if index else Decimal(0)
+
+
+@dataclass(frozen=True)
+class BalanceDivergence:
+    """
+    First snapshot where the balance reported by the exchange differs from the balance of the wallet's transactions.
+    The transaction causing it is after `last_matching` (None if no snapshot matched) and before `first_diverging`.
+    """
+
+    symbol: str
+    last_matching: datetime | None
+    first_diverging: datetime
+    snapshot_balance: Decimal
+    local_balance: Decimal
+
+    @property
+    def difference(self) -> Decimal:
+        """Positive if the wallet is missing deposits, negative if it has too many withdrawals"""
+        return self.snapshot_balance - self.local_balance
+
+
+def get_balance_histories(wallet: Wallet) -> dict[str, BalanceHistory]:
+    """
+    Return the running balances of all currencies of the wallet, by symbol.
+
+    All transaction details are read in a single query and summed up in order,
+    so the balance at any timestamp is a binary search away instead of an aggregate query.
+    Details are counted the same way as in `Wallet.get_current_balance`.
+    """
+    details = (
+        TransactionDetail.objects.filter(wallet=wallet)
+        .filter(
+            Q(to_detail__isnull=False)
+            | Q(from_detail__isnull=False)
+            | (Q(fee_detail__isnull=False) & ~Q(fee_detail__transaction_type=TransactionType.WITHDRAW))
+        )
+        .annotate(
+            timestamp=Coalesce("to_detail__timestamp", "from_detail__timestamp", "fee_detail__timestamp"),
+            signed_quantity=Case(When(to_detail__isnull=False, then=F("quantity")), default=-F("quantity")),
+        )
+        .order_by("timestamp")
+        .values_list("currency__symbol", "timestamp", "signed_quantity")
+    )
+
+    timestamps: dict[str, list[datetime]] = defaultdict(list)
+    quantities: dict[str, list[Decimal]] = defaultdict(list)
+    for symbol, timestamp, quantity in details.iterator():
+        timestamps[symbol].append(timestamp)
+        quantities[symbol].append(quantity)
+
+    return {
+        symbol: BalanceHistory(timestamps=timestamps[symbol], balances=list(accumulate(quantities[symbol])))
+        for symbol in timestamps
+    }
+
+
+def _get_snapshots(wallet: Wallet) -> tuple[list[datetime], dict[str, dict[datetime, Decimal]]]:
+    """
+    Return the timestamps of the wallet's snapshots in order, and the snapshot balances by symbol and timestamp.
+    Currencies missing from a snapshot had no balance at the time.
+    """
+    rows = (
+        WalletBalanceSnapshot.objects.filter(wallet=wallet)
+        .order_by("timestamp")
+        .values_list("currency__symbol", "timestamp", "quantity")
+    )
+    snapshot_timestamps: list[datetime] = []
+    balances: dict[str, dict[datetime, Decimal]] = defaultdict(dict)
+    for symbol, timestamp, quantity in rows.iterator():
+        if not snapshot_timestamps or snapshot_timestamps[-1] != timestamp:
+            snapshot_timestamps.append(timestamp)
+        balances[symbol][timestamp] = quantity
+    return snapshot_timestamps, balances
+
+
+def _find_first_divergence(
+    symbol: str,
+    snapshot_timestamps: list[datetime],
+    snapshots: dict[datetime, Decimal],
+    history: BalanceHistory,
+    tolerance: Decimal,
+) -> BalanceDivergence | None:
+    def get_balances(index: int) -> tuple[Decimal, Decimal]:
+        timestamp = snapshot_timestamps[index]
+        return snapshots.get(timestamp, Decimal(0)), history.get_balance(timestamp)
+
+    def is_diverged(index: int) -> bool:
+        snapshot_balance, local_balance = get_balances(index)
+        return abs(snapshot_balance - local_balance) > tolerance
+
+    index = bisect_left(range(len(snapshot_timestamps)), True, key=is_diverged)
+    if index == len(snapshot_timestamps):
+        return None
+
+    snapshot_balance, local_balance = get_balances(index)
+    return BalanceDivergence(
+        symbol=symbol,
+        last_matching=snapshot_timestamps[index - 1] if index else None,
+        first_diverging=snapshot_timestamps[index],
+        snapshot_balance=snapshot_balance,
+        local_balance=local_balance,
+    )
+
+
+def find_balance_divergences(wallet: Wallet, tolerance: Decimal = Decimal(0)) -> list[BalanceDivergence]:
+    """
+    Find the first snapshot of each currency where the stored exchange balance snapshots of the wallet
+    differ from its transactions by more than `tolerance`.
+
+    A missing or extra transaction shifts every later balance, so after the first divergence the balances stay apart.
+    This makes the snapshots searchable with a binary search, which only reconstructs a logarithmic number of balances.
+    If an error was later cancelled out, e.g. by a manual correction, an earlier divergence may be missed.
+    """
+    snapshot_timestamps, snapshot_balances = _get_snapshots(wallet)
+    if not snapshot_timestamps:
+        return []
+    histories = get_balance_histories(wallet)
+    empty_history = BalanceHistory(timestamps=[], balances=[])
+
+    divergences = []
+    for symbol in sorted(snapshot_balances.keys() | histories.keys()):
+        if symbol in settings.IGNORED_TOKENS:
+            continue
+        divergence = _find_first_divergence(
+            symbol,
+            snapshot_timestamps,
+            snapshot_balances.get(symbol, {}),
+            histories.get(symbol, empty_history),
+            tolerance,
+        )
+        if divergence is not None:
+            divergences.append(divergence)
+    return divergences
+
+
+def save_wallet_balance_snapshot(wallet: Wallet, balances: dict[str, Decimal], timestamp: datetime) -> None:
+    """
+    Store the balances reported by an exchange at `timestamp`.
+    Zero balances are only stored for currencies held in an earlier snapshot, so that the snapshot is kept
+    even when nothing is held anymore, without storing a row for every currency of the exchange.
+    """
+    previously_held = set(
+        WalletBalanceSnapshot.objects.filter(wallet=wallet, timestamp__lt=timestamp)
+        .exclude(quantity=0)
+        .values_list("currency__symbol", flat=True)
+        .distinct()
+    )
+    quantities = {symbol: Decimal(0) for symbol in previously_held}
+    quantities.update({symbol: quantity for symbol, quantity in balances.items() if quantity})
+    WalletBalanceSnapshot.objects.bulk_create(
+        [
+            WalletBalanceSnapshot(
+                wallet=wallet, currency=get_or_create_currency(symbol), timestamp=timestamp, quantity=quantity
+            )
+            for symbol, quantity in quantities.items()
+        ],
+        ignore_conflicts=True,
+    )
@@ -1,6 +1,9 @@
 import logging
+import queue
+import threading
 import time
 from collections.abc import Callable, Iterator
+from concurrent.futures import ThreadPoolExecutor
 from datetime import UTC, datetime, timedelta
 from functools import lru_cache
 
@@ -9,6 +12,9 @@ from django.conf import settings
 
 from crypto_fifo_taxes.exceptions import TooManyResultsError
 from crypto_fifo_taxes.utils.binance.binance_client import BinanceClient
+from crypto_fifo_taxes.utils.binance.fake_exchange import get_fake_binance_adapter
+from crypto_fifo_taxes.utils.binance.request_weight import RequestWeightLimiter
+from crypto_fifo_taxes.utils.binance.response_archive import get_response_archive
 from crypto_fifo_taxes.utils.binance.types import (
     BinanceFlexibleInterest,
     BinanceFlexibleInterestHistoryResponse,
@@ -18,6 +24,31 @@ from crypto_fifo_taxes.utils.binance.types import (
 
 logger = logging.getLogger(__name__)
 
+# Request weights of the endpoints, https://binance-docs.github.io/apidocs/spot/en/#account-trade-list-user_data
+MY_TRADES_WEIGHT = 20
+MY_TRADES_LIMIT = 1000
+EXCHANGE_INFO_WEIGHT = 20
+DEPOSIT_HISTORY_WEIGHT = 1
+DEPOSIT_HISTORY_LIMIT = 1000
+WITHDRAW_HISTORY_WEIGHT = 1
+WITHDRAW_HISTORY_LIMIT = 1000
+# The deposit and withdraw history endpoints reject periods of 90 days or more
+DEPOSIT_HISTORY_MAX_DAYS = 89
+ASSET_DIVIDEND_WEIGHT = 10
+SIMPLE_EARN_HISTORY_WEIGHT = 150
+ETH_STAKING_HISTORY_WEIGHT = 150
+DUST_LOG_WEIGHT = 1
+DUST_LOG_LIMIT = 100
+# Convert history weighs 3000 of the 180000 UID weight per minute, scaled here to the IP weight budget
+CONVERT_TRADE_FLOW_WEIGHT = 100
+CONVERT_TRADE_FLOW_LIMIT = 1000
+ACCOUNT_SNAPSHOT_WEIGHT = 2400
+ACCOUNT_SNAPSHOT_LIMIT = 30
+# Daily account snapshots are only kept for a month, and the queried period must be shorter than 30 days
+ACCOUNT_SNAPSHOT_MAX_DAYS = 29
+# The dust log has no records before this date
+DUST_LOG_START_DATE = datetime(2020, 12, 1)
+
 
 def to_timestamp(dt: datetime) -> int:
     """datetime to Binance-timestamp"""
@@ -34,86 +65,399 @@ def bstrptime(stamp: str) -> datetime:
     return datetime.strptime(stamp, "%Y-%m-%d %H:%M:%S").replace(tzinfo=UTC)
 
 
+def _fetch_window(
+    fetch_function: Callable,
+    start_date: datetime,
+    end_date: datetime,
+    weight_limiter: RequestWeightLimiter | None = None,
+    request_weight: int = 1,
+):
+    """Fetch a single window of history, retrying after a cooldown when rate limited"""
+    while True:
+        if weight_limiter is not None:
+            weight_limiter.acquire(request_weight)
+        try:
+            results = fetch_function(startTime=to_timestamp(start_date), endTime=to_timestamp(end_date))
+        except BinanceAPIException as err:
+            if err.status_code not in (418, 429) and "Too much request weight used" not in str(err):
+                raise
+            logger.info("Too much Binance API weight used, on cooldown")
+            if weight_limiter is None:
+                time.sleep(15)  # API cool down time is not accessible. Try again soon
+            # Otherwise the limiter waits for the `Retry-After` of the response before the next request
+        else:
+            return results
+
+
+def _walk_fixed_windows(
+    fetch_window: Callable[[datetime, datetime], list],
+    start_date: datetime,
+    end_date: datetime,
+    period_length: int,
+) -> Iterator:
+    """
+    Walk the period in windows of `period_length` days.
+    If a window has too many results, it and the rest of the period are walked again with windows of half the length.
+    """
+    while start_date.date() < end_date.date():
+        window_end = min(start_date + timedelta(days=period_length), end_date)
+        try:
+            results = fetch_window(start_date, window_end)
+        except TooManyResultsError:
+            if period_length <= 1:
+                raise
+            yield from _walk_fixed_windows(fetch_window, start_date, end_date, period_length // 2)
+            return
+        yield results
+        start_date = window_end
+
+
+def _get_next_period_length(
+    period_length: int, num_results: int, max_period_length: int, max_results: int | None
+) -> int:
+    """
+    Size the next window from the result density of the previous one: grow it over empty periods,
+    and aim for half of `max_results`, so that a somewhat denser period still fits in the next window.
+    """
+    if num_results == 0:
+        return min(period_length * 2, max_period_length)
+    if max_results is None:
+        return period_length
+    sized_length = int(period_length * max_results / 2 / num_results)
+    return max(1, min(sized_length, period_length * 2, max_period_length))
+
+
+def _walk_adaptive_windows(
+    fetch_window: Callable[[datetime, datetime], list],
+    start_date: datetime,
+    end_date: datetime,
+    period_length: int,
+    max_period_length: int,
+    max_results: int | None,
+) -> Iterator:
+    """
+    Walk the period in windows sized from the observed result density.
+    A window with too many results is fetched again with half the length, and windows don't grow again
+    until the end of the window that had too many results.
+    """
+    dense_until = start_date
+    while start_date.date() < end_date.date():
+        window_end = min(start_date + timedelta(days=period_length), end_date)
+        try:
+            results = fetch_window(start_date, window_end)
+        except TooManyResultsError:
+            if period_length <= 1:
+                raise
+            dense_until = window_end
+            period_length //= 2
+            continue
+        yield results
+        start_date = window_end
+        next_period_length = _get_next_period_length(period_length, len(results), max_period_length, max_results)
+        period_length = min(next_period_length, period_length) if start_date < dense_until else next_period_length
+
+
+def _get_segments(
+    start_date: datetime, end_date: datetime, segment_length: int, max_segments: int | None = None
+) -> list[tuple[datetime, datetime]]:
+    """Split the period to consecutive segments of `segment_length` days, or to at most `max_segments` segments"""
+    if max_segments is not None:
+        total_days = (end_date.date() - start_date.date()).days
+        segment_length = max(segment_length, -(-total_days // max_segments))
+    segments = []
+    while start_date.date() < end_date.date():
+        segment_end = min(start_date + timedelta(days=segment_length), end_date)
+        segments.append((start_date, segment_end))
+        start_date = segment_end
+    return segments
+
+
 def binance_history_iterator(
     fetch_function: Callable,
     period_length: int = 60,
     start_date: datetime | None = None,
     end_date: datetime | None = None,
-    _depth: int = 1,
+    max_period_length: int | None = None,
+    max_results: int | None = None,
+    max_workers: int = 1,
+    weight_limiter: RequestWeightLimiter | None = None,
+    request_weight: int = 1,
 ) -> Iterator:
     """
     Loop through history n days at a time, because binance API has limitations on maximum period that can be queried
 
-    If `TooManyResultsError` is raised in `fetch_function`, period length is reduced and the method is called again,
-    until the error is not raised
+    If `TooManyResultsError` is raised in `fetch_function`, the window is split to windows of half the length,
+    until the error is not raised.
+
+    By default every window is `period_length` days. If `max_period_length` is given, windows are sized adaptively:
+    they grow over sparse periods up to `max_period_length` days, the maximum period of the endpoint,
+    and shrink towards half of `max_results` results per window over dense periods.
+
+    With `max_workers`, independent parts of the history are fetched concurrently, and requests are paced by
+    `weight_limiter`. Results are always yielded in chronological order.
     """
     start_date = start_date if start_date is not None else datetime(2018, 1, 1)
     end_date = (end_date if end_date is not None else datetime.now()).replace(hour=23, minute=59, second=59)
-    while start_date.date() < end_date.date():
+
+    def fetch_window(window_start: datetime, window_end: datetime):
+        return _fetch_window(fetch_function, window_start, window_end, weight_limiter, request_weight)
+
+    if max_period_length is None:
+        # Every window of `period_length` days is independent of the others
+        segments = _get_segments(start_date, end_date, period_length)
+
+        def walk_segment(segment: tuple[datetime, datetime]) -> Iterator:
+            return _walk_fixed_windows(fetch_window, *segment, period_length)
+
+    else:
+        # Windows are sized from the previous window, so only long segments are independent
+        segments = _get_segments(start_date, end_date, max_period_length, max_segments=max_workers)
+
+        def walk_segment(segment: tuple[datetime, datetime]) -> Iterator:
+            return _walk_adaptive_windows(fetch_window, *segment, period_length, max_period_length, max_results)
+
+    if max_workers <= 1 or len(segments) <= 1:
+        for segment in segments:
+            yield from walk_segment(segment)
+        return
+
+    yield from _walk_segments_concurrently(walk_segment, segments, max_workers)
+
+
+def _walk_segments_concurrently(
+    walk_segment: Callable[[tuple[datetime, datetime]], Iterator],
+    segments: list[tuple[datetime, datetime]],
+    max_workers: int,
+    queue_size: int = 4,
+) -> Iterator:
+    """
+    Walk the segments in worker threads, and yield their results in the order of the segments.
+    Each segment is fetched up to `queue_size` windows ahead, so results are yielded as soon as the first windows
+    of the first segment are fetched, and the memory usage doesn't depend on the length of the segments.
+    """
+    cancelled = threading.Event()
+    queues: list[queue.Queue] = [queue.Queue(maxsize=queue_size) for _ in segments]
+
+    def put(segment_queue: queue.Queue, item) -> bool:
+        """Put an item to the queue, unless the iterator is closed while waiting for it to be read."""
+        while not cancelled.is_set():
+            try:
+                segment_queue.put(item, timeout=0.1)
+            except queue.Full:
+                continue
+            else:
+                return True
+        return False
+
+    def fetch_segment(segment: tuple[datetime, datetime], segment_queue: queue.Queue) -> None:
         try:
+            for results in walk_segment(segment):
+                if not put(segment_queue, (results, None)):
+                    return
+            put(segment_queue, (None, None))
+        except BaseException as e:
+            put(segment_queue, (None, e))
+
+    # Segments are started in order, so the segment being read is always being fetched or already fetched
+    executor = ThreadPoolExecutor(max_workers=max_workers)
+    try:
+        for segment, segment_queue in zip(segments, queues, strict=True):
+            executor.submit(fetch_segment, segment, segment_queue)
+        for segment_queue in queues:
             while True:
-                try:
-                    yield fetch_function(
-                        startTime=to_timestamp(start_date),
-                        endTime=to_timestamp(min(start_date + timedelta(days=period_length), end_date)),
-                    )
+                results, exception = segment_queue.get()
+                if exception is not None:
+                    raise exception
+                if results is None:
                     break
-                except BinanceAPIException as err:
-                    if "Too much request weight used" in str(err):
-                        logger.info("Too much Binance API weight used, on cooldown")
-                        time.sleep(15)  # API cool down time is not accessible. Try again soon
-
-        except TooManyResultsError:
-            # Too many results returned in fetch_function so not all data may be included.
-            # Try again with a smaller period
-            yield from binance_history_iterator(
-                fetch_function=fetch_function,
-                period_length=int(period_length / 2),
-                start_date=start_date,
-                end_date=(min(start_date + timedelta(days=period_length) * _depth, end_date)).replace(
-                    hour=23, minute=59, second=59
-                ),
-                _depth=_depth + 1,
-            )
+                yield results
+    finally:
+        # If the iterator is closed early, stop fetching the remaining segments
+        cancelled.set()
+        executor.shutdown(cancel_futures=True)
 
-            # Break in order to not query the endpoint with dates that are already queried previously
-            if _depth > 1:
-                break
 
-        start_date += timedelta(days=period_length)
+_binance_client_lock = threading.Lock()
 
 
 @lru_cache
+def _create_binance_client() -> BinanceClient:
+    weight_limiter = RequestWeightLimiter(settings.BINANCE_REQUEST_WEIGHT_PER_MINUTE)
+    match settings.BINANCE_TRANSPORT:
+        case "binance":
+            return BinanceClient(
+                settings.BINANCE_API_KEY,
+                settings.BINANCE_API_SECRET,
+                weight_limiter=weight_limiter,
+                response_archive=get_response_archive(),
+            )
+        case "fake":
+            return BinanceClient(
+                "fake",
+                "fake",
+                weight_limiter=weight_limiter,
+                response_archive=get_response_archive(),
+                adapter=get_fake_binance_adapter(),
+            )
+    raise ValueError(f"Unknown Binance transport `{settings.BINANCE_TRANSPORT}`.")
+
+
 def get_binance_client() -> BinanceClient:
-    client = BinanceClient(settings.BINANCE_API_KEY, settings.BINANCE_API_SECRET)
-    return client
+    """
+    Return the client shared by every thread, so that all requests are paced by the same weight limiter.
+    `lru_cache` doesn't serialize concurrent misses, and creating the client is slow as it sends a request,
+    so the client is created behind a lock.
+    """
+    with _binance_client_lock:
+        return _create_binance_client()
+
+
+def clear_binance_client() -> None:
+    """Forget the shared client, so that the next one is created from the current settings"""
+    _create_binance_client.cache_clear()
+
+
+def get_binance_pair_trades(symbol: str, from_id: int = 0) -> list[dict]:
+    """
+    Return all trades of the pair starting from the trade id `from_id`, paging forward until the trades are exhausted.
+    Requests are paced by the request weight limiter of the client, and retried when rate limited.
+
+    https://binance-docs.github.io/apidocs/spot/en/#account-trade-list-user_data
+    """
+    client = get_binance_client()
+    trades: list[dict] = []
+    while True:
+        client.weight_limiter.acquire(MY_TRADES_WEIGHT)
+        try:
+            page = client.get_my_trades(symbol=symbol, fromId=from_id, limit=MY_TRADES_LIMIT)
+        except BinanceAPIException as e:
+            if e.status_code not in (418, 429):
+                raise
+            # The limiter waits for the `Retry-After` of the response before the next request
+            logger.info("Too much Binance API weight used, on cooldown")
+            continue
+
+        trades.extend(page)
+        if len(page) < MY_TRADES_LIMIT:
+            return trades
+        from_id = page[-1]["id"] + 1
 
 
 def get_binance_deposits(start_date: datetime | None = None) -> Iterator[list[dict]]:
+    """https://binance-docs.github.io/apidocs/spot/en/#deposit-history-supporting-network-user_data"""
+
+    def deposits(startTime: int, endTime: int) -> list[dict]:
+        rows = client.get_deposit_history(startTime=startTime, endTime=endTime, limit=DEPOSIT_HISTORY_LIMIT)
+        # Deposits beyond the limit are not returned
+        if len(rows) >= DEPOSIT_HISTORY_LIMIT:
+            raise TooManyResultsError
+        return rows
+
     client = get_binance_client()
-    return binance_history_iterator(client.get_deposit_history, start_date=start_date)
+    return binance_history_iterator(
+        deposits,
+        start_date=start_date,
+        max_period_length=DEPOSIT_HISTORY_MAX_DAYS,
+        max_results=DEPOSIT_HISTORY_LIMIT,
+        max_workers=settings.BINANCE_MAX_WORKERS,
+        weight_limiter=client.weight_limiter,
+        request_weight=DEPOSIT_HISTORY_WEIGHT,
+    )
 
 
 def get_binance_withdraws(start_date: datetime | None = None) -> Iterator[list[dict]]:
+    """https://binance-docs.github.io/apidocs/spot/en/#withdraw-history-supporting-network-user_data"""
+
+    def withdrawals(startTime: int, endTime: int) -> list[dict]:
+        rows = client.get_withdraw_history(startTime=startTime, endTime=endTime, limit=WITHDRAW_HISTORY_LIMIT)
+        # Withdrawals beyond the limit are not returned
+        if len(rows) >= WITHDRAW_HISTORY_LIMIT:
+            raise TooManyResultsError
+        return rows
+
     client = get_binance_client()
-    return binance_history_iterator(client.get_withdraw_history, start_date=start_date)
+    return binance_history_iterator(
+        withdrawals,
+        start_date=start_date,
+        max_period_length=DEPOSIT_HISTORY_MAX_DAYS,
+        max_results=WITHDRAW_HISTORY_LIMIT,
+        max_workers=settings.BINANCE_MAX_WORKERS,
+        weight_limiter=client.weight_limiter,
+        request_weight=WITHDRAW_HISTORY_WEIGHT,
+    )
+
+
+def get_binance_account_snapshots() -> list[dict]:
+    """
+    Return the daily SPOT account snapshots of the last month, which is as far back as Binance keeps them.
+
+    https://developers.binance.com/docs/wallet/account/daily-account-snapshoot
+    """
+
+    def account_snapshots(startTime: int, endTime: int) -> list[dict]:
+        response = client.get_account_snapshot(
+            type="SPOT", startTime=startTime, endTime=endTime, limit=ACCOUNT_SNAPSHOT_LIMIT
+        )
+        return response["snapshotVos"]
+
+    client = get_binance_client()
+    end_date = datetime.now(UTC)
+    start_date = end_date - timedelta(days=ACCOUNT_SNAPSHOT_MAX_DAYS)
+    return _fetch_window(account_snapshots, start_date, end_date, client.weight_limiter, ACCOUNT_SNAPSHOT_WEIGHT)
 
 
 def get_convert_trade_history(start_date: datetime | None = None) -> Iterator[list[dict]]:
+    """https://binance-docs.github.io/apidocs/spot/en/#get-convert-trade-history-user_data"""
+
+    def converts(startTime: int, endTime: int) -> list[dict]:
+        response = client.get_convert_trade_history(
+            startTime=startTime, endTime=endTime, limit=CONVERT_TRADE_FLOW_LIMIT
+        )
+        if response["moreData"]:
+            raise TooManyResultsError
+        return response["list"]
+
     client = get_binance_client()
-    return binance_history_iterator(client.get_convert_trade_history, start_date=start_date, period_length=30)
+    return binance_history_iterator(
+        converts,
+        period_length=30,
+        start_date=start_date,
+        max_period_length=30,
+        max_results=CONVERT_TRADE_FLOW_LIMIT,
+        max_workers=settings.BINANCE_MAX_WORKERS,
+        weight_limiter=client.weight_limiter,
+        request_weight=CONVERT_TRADE_FLOW_WEIGHT,
+    )
 
 
-def get_binance_dust_log() -> list:
+def get_binance_dust_log(start_date: datetime | None = None) -> Iterator[list[dict]]:
     """
     Binance returns dust conversions only from the past ~1 year.
     To add and older dust conversions you must `Generate all statements` on the Binance website:
     https://www.binance.com/en/my/wallet/history/deposit-crypto
     Then manually import those converts using the json importer.
     You need to add `tx_id` to those transactions if converted multiple currencies in a single batch.
+
+    https://binance-docs.github.io/apidocs/spot/en/#dustlog-user_data
     """
+
+    def dust_log(startTime: int, endTime: int) -> list[dict]:
+        response = client.get_dust_log(startTime=startTime, endTime=endTime)
+        # Only the last 100 conversions of the period are returned
+        if response["total"] >= DUST_LOG_LIMIT:
+            raise TooManyResultsError
+        return response["userAssetDribblets"]
+
     client = get_binance_client()
-    return client.get_dust_log()["userAssetDribblets"]
+    return binance_history_iterator(
+        dust_log,
+        start_date=max(start_date, DUST_LOG_START_DATE) if start_date is not None else DUST_LOG_START_DATE,
+        max_period_length=90,
+        max_results=DUST_LOG_LIMIT,
+        max_workers=settings.BINANCE_MAX_WORKERS,
+        weight_limiter=client.weight_limiter,
+        request_weight=DUST_LOG_WEIGHT,
+    )
 
 
 def get_binance_dividends(start_date: datetime | None = None) -> Iterator[list[dict]]:
@@ -126,8 +470,13 @@ def get_binance_dividends(start_date: datetime | None = None) -> Iterator[list[d
     client = get_binance_client()
     return binance_history_iterator(
         dividends,
-        period_length=60,  # Documented value is 90 but in reality it seems to be 60
+        period_length=60,
         start_date=start_date,
+        max_period_length=60,  # Documented value is 90 but in reality it seems to be 60
+        max_results=500,
+        max_workers=settings.BINANCE_MAX_WORKERS,
+        weight_limiter=client.weight_limiter,
+        request_weight=ASSET_DIVIDEND_WEIGHT,
     )
 
 
@@ -153,7 +502,16 @@ def get_binance_flexible_interest_history(
         return output
 
     client = get_binance_client()
-    out = binance_history_iterator(interests, period_length=30, start_date=start_date)
+    out = binance_history_iterator(
+        interests,
+        period_length=30,
+        start_date=start_date,
+        max_period_length=90,
+        max_results=100,
+        max_workers=settings.BINANCE_MAX_WORKERS,
+        weight_limiter=client.weight_limiter,
+        request_weight=SIMPLE_EARN_HISTORY_WEIGHT * 3,  # One request per type
+    )
     return out
 
 
@@ -175,7 +533,16 @@ def get_binance_locked_interest_history(start_date: datetime | None = None) -> I
         return output
 
     client = get_binance_client()
-    out = binance_history_iterator(interests, period_length=30, start_date=start_date)
+    out = binance_history_iterator(
+        interests,
+        period_length=30,
+        start_date=start_date,
+        max_period_length=90,
+        max_results=100,
+        max_workers=settings.BINANCE_MAX_WORKERS,
+        weight_limiter=client.weight_limiter,
+        request_weight=SIMPLE_EARN_HISTORY_WEIGHT,
+    )
     return out
 
 
@@ -197,5 +564,14 @@ def get_binance_beth_interest_history(start_date: datetime | None = None) -> Ite
         return output
 
     client = get_binance_client()
-    out = binance_history_iterator(interests, period_length=30, start_date=start_date)
+    out = binance_history_iterator(
+        interests,
+        period_length=30,
+        start_date=start_date,
+        max_period_length=90,
+        max_results=100,
+        max_workers=settings.BINANCE_MAX_WORKERS,
+        weight_limiter=client.weight_limiter,
+        request_weight=ETH_STAKING_HISTORY_WEIGHT,
+    )
     return out
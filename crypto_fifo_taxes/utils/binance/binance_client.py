@@ -1,7 +1,47 @@
 from binance import Client
+from requests.adapters import BaseAdapter
+
+from crypto_fifo_taxes.utils.binance.request_weight import RequestWeightLimiter
+from crypto_fifo_taxes.utils.binance.response_archive import ResponseArchive
 
 
 class BinanceClient(Client):
+    weight_limiter: RequestWeightLimiter | None = None
+    response_archive: ResponseArchive | None = None
+    adapter: BaseAdapter | None = None
+
+    def __init__(
+        self,
+        *args,
+        weight_limiter: RequestWeightLimiter | None = None,
+        response_archive: ResponseArchive | None = None,
+        adapter: BaseAdapter | None = None,
+        **kwargs,
+    ):
+        # Set before initializing the client, as it already sends a request
+        self.weight_limiter = weight_limiter
+        self.response_archive = response_archive
+        self.adapter = adapter
+        super().__init__(*args, **kwargs)
+
+    def _init_session(self):
+        session = super()._init_session()
+        if self.adapter is not None:
+            # Send all requests with the adapter, e.g. `FakeBinanceAdapter`
+            session.mount("https://", self.adapter)
+        return session
+
+    def _handle_response(self, response):
+        if self.weight_limiter is not None:
+            self.weight_limiter.update(response.headers)
+            if response.status_code in (418, 429):
+                retry_after = response.headers.get("Retry-After")
+                self.weight_limiter.rate_limited(int(retry_after) if retry_after is not None else None)
+        data = super()._handle_response(response)
+        if self.response_archive is not None:
+            self.response_archive.append(response.request.url, data)
+        return data
+
     # FIAT
     def get_fiat_deposits(self, **params):
         """https://binance-docs.github.io/apidocs/spot/en/#get-swap-history-user_data"""
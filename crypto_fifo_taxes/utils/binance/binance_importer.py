@@ -8,7 +8,7 @@ from crypto_fifo_taxes.models import CurrencyPair, Transaction, Wallet
 from crypto_fifo_taxes.utils.binance.binance_api import bstrptime, from_timestamp, to_timestamp
 from crypto_fifo_taxes.utils.binance.types import BinanceFlexibleInterest, BinanceLockedInterest
 from crypto_fifo_taxes.utils.currency import get_or_create_currency
-from crypto_fifo_taxes.utils.transaction_creator import TransactionCreator
+from crypto_fifo_taxes.utils.transaction_creator import TransactionBatch, TransactionCreator
 
 logger = logging.getLogger(__name__)
 
@@ -16,31 +16,35 @@ logger = logging.getLogger(__name__)
 def import_deposits(wallet: Wallet, deposits: list) -> None:
     """https://binance-docs.github.io/apidocs/spot/en/#deposit-history-supporting-network-user_data"""
     importable_txs = {t["txId"] for t in deposits}
-    existing_transactions = Transaction.objects.filter(tx_id__in=importable_txs).values_list("tx_id", flat=True)
+    existing_transactions = Transaction.objects.existing_tx_ids(importable_txs)
 
+    batch = TransactionBatch()
     for deposit in deposits:
         # If transaction has already been imported, skip it
         if deposit["txId"] in existing_transactions:
             continue
 
         currency = get_or_create_currency(deposit["coin"])
-        TransactionCreator(
-            timestamp=from_timestamp(deposit["insertTime"]),
-            description="Deposit (Imported from Binance API)",
-            tx_id=deposit["txId"],
-            fill_cost_basis=False,
-        ).create_deposit(
+        batch.add_deposit(
+            TransactionCreator(
+                timestamp=from_timestamp(deposit["insertTime"]),
+                description="Deposit (Imported from Binance API)",
+                tx_id=deposit["txId"],
+                fill_cost_basis=False,
+            ),
             wallet=wallet,
             currency=currency,
             quantity=Decimal(deposit["amount"]),
         )
+    batch.create()
 
 
 def import_withdrawals(wallet: Wallet, deposits: list) -> None:
     """https://binance-docs.github.io/apidocs/spot/en/#withdraw-history-supporting-network-user_data"""
     importable_txs = {t["txId"] for t in deposits}
-    existing_transactions = Transaction.objects.filter(tx_id__in=importable_txs).values_list("tx_id", flat=True)
+    existing_transactions = Transaction.objects.existing_tx_ids(importable_txs)
 
+    batch = TransactionBatch()
     for withdrawal in deposits:
         if withdrawal["transferType"] == 1:  # Internal transfer
             continue
@@ -56,20 +60,36 @@ def import_withdrawals(wallet: Wallet, deposits: list) -> None:
             tx_id=withdrawal["txId"],
             fill_cost_basis=False,
         )
-        tx_creator.create_withdrawal(
+        batch.add_withdrawal(
+            tx_creator,
             wallet=wallet,
             currency=currency,
             # Binance maye have withdrawal fees, which are additionally deducted from the wallet balance
             # This fee is separate from network transfer fees
             quantity=Decimal(withdrawal["amount"]) + Decimal(withdrawal["transactionFee"]),
         )
+    batch.create()
+
+
+def _get_existing_tx_ids(tx_ids: set[str], known_tx_ids: set[str] | None) -> set[str]:
+    """
+    Return the given tx_ids which have already been imported.
+    With `known_tx_ids`, a set of already imported tx_ids, no query is made. The given tx_ids are added to it,
+    as they are imported next.
+    """
+    if known_tx_ids is None:
+        return Transaction.objects.existing_tx_ids(tx_ids)
+    existing_tx_ids = tx_ids & known_tx_ids
+    known_tx_ids |= tx_ids
+    return existing_tx_ids
 
 
-def import_convert_trade_history(wallet: Wallet, converts: list) -> None:
+def import_convert_trade_history(wallet: Wallet, converts: list, known_tx_ids: set[str] | None = None) -> None:
     """https://binance-docs.github.io/apidocs/spot/en/#query-limit-open-orders-user_data"""
     importable_txs_ids = {str(t["orderId"]) for t in converts}
-    existing_transactions = Transaction.objects.filter(tx_id__in=importable_txs_ids).values_list("tx_id", flat=True)
+    existing_transactions = _get_existing_tx_ids(importable_txs_ids, known_tx_ids)
 
+    batch = TransactionBatch()
     for trade in converts:
         if trade["orderStatus"] != "SUCCESS":
             continue
@@ -87,7 +107,8 @@ def import_convert_trade_history(wallet: Wallet, converts: list) -> None:
         to_currency = get_or_create_currency(trade["toAsset"])
         tx_creator.add_from_detail(wallet=wallet, currency=from_currency, quantity=Decimal(trade["fromAmount"]))
         tx_creator.add_to_detail(wallet=wallet, currency=to_currency, quantity=Decimal(trade["toAmount"]))
-        tx_creator.create_trade()
+        batch.add_trade(tx_creator)
+    batch.create()
 
 
 def import_pair_trades(wallet: Wallet, trading_pair: CurrencyPair, trades: list) -> None:
@@ -96,8 +117,9 @@ def import_pair_trades(wallet: Wallet, trading_pair: CurrencyPair, trades: list)
     assert trading_pair is not None
 
     importable_orders = {str(t["orderId"]) for t in trades}
-    existing_orders = Transaction.objects.filter(tx_id__in=importable_orders).values_list("tx_id", flat=True)
+    existing_orders = Transaction.objects.existing_tx_ids(importable_orders)
 
+    batch = TransactionBatch()
     for trade in trades:
         # If order has already been imported, skip it
         if str(trade["orderId"]) in existing_orders:
@@ -118,16 +140,18 @@ def import_pair_trades(wallet: Wallet, trading_pair: CurrencyPair, trades: list)
             tx_creator.add_from_detail(wallet=wallet, currency=trading_pair.buy, quantity=Decimal(trade["qty"]))
             tx_creator.add_to_detail(wallet=wallet, currency=trading_pair.sell, quantity=Decimal(trade["quoteQty"]))
         tx_creator.add_fee_detail(wallet=wallet, currency=fee_currency, quantity=Decimal(trade["commission"]))
-        tx_creator.create_trade()
+        batch.add_trade(tx_creator)
+    batch.create()
 
 
-def import_dust(wallet: Wallet, converts: list) -> None:
+def import_dust(wallet: Wallet, converts: list, known_tx_ids: set[str] | None = None) -> None:
     """https://binance-docs.github.io/apidocs/spot/en/#dustlog-user_data"""
     convert_ids = {str(t["transId"]) for t in converts}
-    existing_converts = Transaction.objects.filter(tx_id__in=convert_ids).values_list("tx_id", flat=True)
+    existing_converts = _get_existing_tx_ids(convert_ids, known_tx_ids)
 
     bnb = get_or_create_currency("BNB")
 
+    batch = TransactionBatch()
     for convert in converts:
         # If order has already been imported, skip it
         if str(convert["transId"]) in existing_converts:
@@ -145,7 +169,8 @@ def import_dust(wallet: Wallet, converts: list) -> None:
             tx_creator.add_from_detail(wallet=wallet, currency=from_currency, quantity=Decimal(detail["amount"]))
             tx_creator.add_to_detail(wallet=wallet, currency=bnb, quantity=Decimal(detail["transferedAmount"]))
             tx_creator.add_fee_detail(wallet=wallet, currency=bnb, quantity=Decimal(detail["serviceChargeAmount"]))
-            tx_creator.create_trade()
+            batch.add_trade(tx_creator)
+    batch.create()
 
 
 def import_dividends(wallet: Wallet, dividends: list) -> None:
@@ -156,8 +181,9 @@ def import_dividends(wallet: Wallet, dividends: list) -> None:
         return f"{wallet.name}_{timestamp}_{row['amount']}_{row['asset']}"
 
     dividend_ids = {build_transaction_id(t) for t in dividends}
-    existing_dividends = Transaction.objects.filter(tx_id__in=dividend_ids).values_list("tx_id", flat=True)
+    existing_dividends = Transaction.objects.existing_tx_ids(dividend_ids)
 
+    batch = TransactionBatch()
     for row in dividends:
         tx_id = build_transaction_id(row)
         if tx_id in existing_dividends:
@@ -181,10 +207,11 @@ def import_dividends(wallet: Wallet, dividends: list) -> None:
             tx_creator.add_from_detail(
                 wallet=wallet, currency=get_or_create_currency("VEN"), quantity=Decimal(row["amount"]) / 100
             )
-            tx_creator.create_swap()
+            batch.add_swap(tx_creator)
             continue
 
-        tx_creator.create_deposit()
+        batch.add_deposit(tx_creator)
+    batch.create()
 
 
 def _get_interest_quantity(row: BinanceFlexibleInterest | BinanceLockedInterest) -> str:
@@ -212,8 +239,9 @@ def _build_transaction_id(wallet: Wallet, row: BinanceFlexibleInterest | Binance
 
 def import_interest(wallet: Wallet, interests: list[BinanceFlexibleInterest] | list[BinanceLockedInterest]) -> None:
     interest_ids = {_build_transaction_id(wallet, i) for i in interests}
-    existing_interests = Transaction.objects.filter(tx_id__in=interest_ids).values_list("tx_id", flat=True)
+    existing_interests = Transaction.objects.existing_tx_ids(interest_ids)
 
+    batch = TransactionBatch()
     for row in interests:
         tx_id = _build_transaction_id(wallet, row)
         if tx_id in existing_interests:
@@ -236,4 +264,5 @@ def import_interest(wallet: Wallet, interests: list[BinanceFlexibleInterest] | l
             fill_cost_basis=False,
         )
         tx_creator.add_to_detail(wallet=wallet, currency=currency, quantity=quantity)
-        tx_creator.create_deposit()
+        batch.add_deposit(tx_creator)
+    batch.create()
@@ -1,17 +1,20 @@
 from decimal import Decimal
 
 from django.conf import settings
+from django.utils import timezone
 
 from crypto_fifo_taxes.models import Wallet
-from crypto_fifo_taxes.utils.binance.binance_api import get_binance_client
+from crypto_fifo_taxes.utils.balance_reconciliation import save_wallet_balance_snapshot
+from crypto_fifo_taxes.utils.binance.binance_api import (
+    from_timestamp,
+    get_binance_account_snapshots,
+    get_binance_client,
+)
 
 
-def get_binance_wallet_balance() -> dict[str:Decimal]:
-    client = get_binance_client()
+def _get_spot_balances(rows: list[dict]) -> dict[str, Decimal]:
     balances: dict[str, Decimal] = {}
-
-    # SPOT Wallet
-    for row in client.get_account()["balances"]:
+    for row in rows:
         symbol = row["asset"]
         if not Decimal(row["free"]) and not Decimal(row["locked"]):
             continue
@@ -21,6 +24,14 @@ def get_binance_wallet_balance() -> dict[str:Decimal]:
         if len(symbol) >= 5 and symbol.startswith("LD"):
             continue
         balances[symbol] = Decimal(row["free"]) + Decimal(row["locked"])
+    return balances
+
+
+def get_binance_wallet_balance() -> dict[str:Decimal]:
+    client = get_binance_client()
+
+    # SPOT Wallet
+    balances = _get_spot_balances(client.get_account()["balances"])
 
     # EARN Wallet (Flexible)
     for row in client.get_earn_flexible_position(size=100)["rows"]:
@@ -65,3 +76,28 @@ def get_binance_wallet_differences() -> dict[str, Decimal]:
             balance_diff[symbol] = quantity
 
     return balance_diff
+
+
+def save_binance_balance_snapshot() -> None:
+    """
+    Store the live Binance wallet balance as a snapshot, to be reconciled with `find_balance_divergences`.
+    Snapshots are only as good as their history, so they should be saved periodically, e.g. daily.
+    """
+    save_wallet_balance_snapshot(Wallet.objects.get(name="Binance"), get_binance_wallet_balance(), timezone.now())
+
+
+def import_binance_account_snapshots() -> int:
+    """
+    Store the daily SPOT account snapshots of the last month as balance snapshots of the Binance wallet,
+    so that a new install has a history to reconcile. Binance doesn't keep older snapshots.
+    The snapshots don't include the EARN wallet, so balances in EARN products show up as divergences.
+    Returns the number of snapshots stored.
+    """
+    wallet = Wallet.objects.get(name="Binance")
+    snapshots = sorted(get_binance_account_snapshots(), key=lambda snapshot: snapshot["updateTime"])
+    # Stored in chronological order, as the previously held currencies are stored with zero balances
+    for snapshot in snapshots:
+        save_wallet_balance_snapshot(
+            wallet, _get_spot_balances(snapshot["data"]["balances"]), from_timestamp(snapshot["updateTime"])
+        )
+    return len(snapshots)
@@ -0,0 +1,27 @@
+from crypto_fifo_taxes.models import TransactionDetail, Wallet
+from crypto_fifo_taxes.utils.binance.binance_wallet import get_binance_wallet_balance
+
+__all__ = [
+    "get_candidate_pairs",
+    "get_held_assets",
+]
+
+
+def get_held_assets(wallet: Wallet) -> set[str]:
+    """
+    Return the symbols of all assets ever held in the wallet.
+
+    Assets are read from the imported transactions of the wallet, which include deposits, dust and convert history,
+    and from the current balances in Binance, which include assets received in ways that are not imported.
+    """
+    assets = set(TransactionDetail.objects.filter(wallet=wallet).values_list("currency__symbol", flat=True).distinct())
+    assets.update(get_binance_wallet_balance())
+    return assets
+
+
+def get_candidate_pairs(all_pairs: list[dict], assets: set[str]) -> list[dict]:
+    """
+    Return the trading pairs that may have trades: a trade spends one side of the pair and receives the other,
+    so both sides of a traded pair have been held at some point.
+    """
+    return [pair for pair in all_pairs if pair["baseAsset"] in assets and pair["quoteAsset"] in assets]
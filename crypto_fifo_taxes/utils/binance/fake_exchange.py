@@ -0,0 +1,417 @@
+import json
+import random
+import threading
+import time
+from collections.abc import Callable
+from dataclasses import dataclass
+from datetime import UTC, datetime, timedelta
+from functools import lru_cache
+from urllib.parse import parse_qsl, urlsplit
+
+import requests
+from django.conf import settings
+from requests.adapters import BaseAdapter
+from requests.structures import CaseInsensitiveDict
+
+__all__ = [
+    "FakeBinanceAdapter",
+    "FakeBinanceExchange",
+    "FakeBinanceVolumes",
+    "get_fake_binance_adapter",
+]
+
+QUOTE_ASSETS = ["USDT", "BTC", "ETH", "BNB"]
+BASE_ASSETS = ["ADA", "DOT", "SOL", "XRP", "LTC", "LINK", "ATOM", "TRX", "XLM", "EOS", "VET", "NEO"]
+ASSETS = QUOTE_ASSETS + BASE_ASSETS
+
+# Request weights of the endpoints served, unknown endpoints weigh 1
+ENDPOINT_WEIGHTS = {
+    "/api/v3/exchangeInfo": 20,
+    "/api/v3/account": 20,
+    "/api/v3/myTrades": 20,
+    "/sapi/v1/asset/assetDividend": 10,
+    "/sapi/v1/simple-earn/flexible/history/rewardsRecord": 150,
+    "/sapi/v1/simple-earn/locked/history/rewardsRecord": 150,
+    "/sapi/v1/eth-staking/eth/history/rewardsHistory": 150,
+    "/sapi/v1/simple-earn/flexible/position": 150,
+    "/sapi/v1/simple-earn/locked/position": 150,
+    "/sapi/v1/convert/tradeFlow": 100,
+}
+# The dust log has no records before this date
+DUST_LOG_START_DATE = datetime(2020, 12, 1, tzinfo=UTC)
+TOO_MUCH_WEIGHT_MESSAGE = (
+    "Too much request weight used; current limit is {limit} request weight per 1 MINUTE. "
+    "Please use WebSocket Streams for live updates to avoid polling the API."
+)
+
+
+def _to_ms(dt: datetime) -> int:
+    return int(dt.timestamp() * 1000)
+
+
+@dataclass(frozen=True)
+class FakeBinanceVolumes:
+    """Number of synthetic records served by the fake exchange"""
+
+    pairs: int = 20  # Traded pairs
+    untraded_pairs: int = 1000  # Listed in the exchange info, but never traded
+    trades_per_pair: int = 200
+    deposits: int = 200
+    withdrawals: int = 50
+    dividends: int = 500
+    interest: int = 2000
+    converts: int = 100
+    dust: int = 20
+
+
+class FakeBinanceExchange:
+    """
+    Synthetic account history, served by `FakeBinanceAdapter` in the format of the Binance API.
+
+    Records are spread randomly between `start_date` and `end_date`, and are the same for the same `seed`.
+    """
+
+    def __init__(
+        self,
+        volumes: FakeBinanceVolumes | None = None,
+        start_date: datetime = datetime(2018, 1, 1, tzinfo=UTC),
+        end_date: datetime | None = None,
+        seed: int = 0,
+    ) -> None:
+        self.volumes = volumes or FakeBinanceVolumes()
+        self._random = random.Random(seed)
+        self._start_ms = _to_ms(start_date)
+        self._end_ms = _to_ms(end_date or datetime.now(UTC) - timedelta(days=1))
+
+        all_pairs = [(base, quote) for quote in QUOTE_ASSETS for base in BASE_ASSETS]
+        self.traded_pairs = all_pairs[: self.volumes.pairs]
+        # Untraded pairs have a base asset that has never been held
+        self.untraded_pairs = [(f"TKN{i}", "USDT") for i in range(self.volumes.untraded_pairs)]
+
+        self.trades = {f"{base}{quote}": self._build_trades(base, quote) for base, quote in self.traded_pairs}
+        self.deposits = sorted(
+            (self._build_deposit(i) for i in range(self.volumes.deposits)), key=lambda row: row["insertTime"]
+        )
+        self.withdrawals = sorted(
+            (self._build_withdrawal(i) for i in range(self.volumes.withdrawals)), key=lambda row: row["time"]
+        )
+        self.dividends = sorted(
+            (self._build_dividend(i) for i in range(self.volumes.dividends)), key=lambda row: row["divTime"]
+        )
+        self.interest = sorted(
+            (self._build_interest() for _ in range(self.volumes.interest)), key=lambda row: row["time"]
+        )
+        self.converts = sorted(
+            (self._build_convert(i) for i in range(self.volumes.converts)), key=lambda row: row["createTime"]
+        )
+        self.dust = sorted((self._build_dust(i) for i in range(self.volumes.dust)), key=lambda row: row["operateTime"])
+        # Like in a real account, only a few assets are left, the rest have been traded away or withdrawn
+        self.balances = sorted(self._random.sample(ASSETS, 3))
+
+    def _timestamp(self, start_ms: int | None = None) -> int:
+        return self._random.randint(max(self._start_ms, start_ms or 0), self._end_ms)
+
+    def _quantity(self) -> str:
+        return f"{self._random.uniform(0.001, 100):.8f}"
+
+    def _build_trades(self, base: str, quote: str) -> list[dict]:
+        timestamps = sorted(self._timestamp() for _ in range(self.volumes.trades_per_pair))
+        trades = []
+        for trade_id, timestamp in enumerate(timestamps, start=1):
+            qty = self._random.uniform(0.01, 10)
+            price = self._random.uniform(0.0001, 100)
+            trades.append(
+                {
+                    "symbol": f"{base}{quote}",
+                    "id": trade_id,
+                    "orderId": timestamp * 100 + trade_id % 100,
+                    "price": f"{price:.8f}",
+                    "qty": f"{qty:.8f}",
+                    "quoteQty": f"{qty * price:.8f}",
+                    "commission": f"{qty * 0.001:.8f}",
+                    "commissionAsset": base,
+                    "time": timestamp,
+                    "isBuyer": self._random.random() < 0.5,
+                }
+            )
+        return trades
+
+    def _build_deposit(self, i: int) -> dict:
+        return {
+            "amount": self._quantity(),
+            "coin": self._random.choice(ASSETS),
+            "status": 1,
+            "txId": f"fake-deposit-{i}",
+            "insertTime": self._timestamp(),
+            "transferType": 0,
+        }
+
+    def _build_withdrawal(self, i: int) -> dict:
+        timestamp = self._timestamp()
+        return {
+            "amount": self._quantity(),
+            "transactionFee": "0.0001",
+            "coin": self._random.choice(ASSETS),
+            "status": 6,
+            "txId": f"fake-withdrawal-{i}",
+            "applyTime": datetime.fromtimestamp(timestamp / 1000, UTC).strftime("%Y-%m-%d %H:%M:%S"),
+            "transferType": 0,
+            # Not in the response, used to filter by time
+            "time": timestamp,
+        }
+
+    def _build_dividend(self, i: int) -> dict:
+        return {
+            "id": i,
+            "amount": self._quantity(),
+            "asset": self._random.choice(ASSETS),
+            "divTime": self._timestamp(),
+            "enInfo": "BNB Vault",
+            "tranId": i,
+        }
+
+    def _build_interest(self) -> dict:
+        kind = self._random.choice(["flexible", "locked", "eth"])
+        row = {"time": self._timestamp(), "asset": self._random.choice(ASSETS), "kind": kind}
+        if kind == "flexible":
+            row.update(rewards=self._quantity(), type=self._random.choice(["BONUS", "REALTIME", "REWARDS"]))
+        else:
+            row.update(amount=self._quantity())
+        return row
+
+    def _build_convert(self, i: int) -> dict:
+        from_asset, to_asset = self._random.sample(ASSETS, 2)
+        return {
+            "quoteId": f"fake-quote-{i}",
+            "orderId": 10**12 + i,
+            "orderStatus": "SUCCESS",
+            "fromAsset": from_asset,
+            "fromAmount": self._quantity(),
+            "toAsset": to_asset,
+            "toAmount": self._quantity(),
+            "createTime": self._timestamp(),
+        }
+
+    def _build_dust(self, i: int) -> dict:
+        timestamp = self._timestamp(_to_ms(DUST_LOG_START_DATE))
+        details = [
+            {
+                "transId": 2 * 10**12 + i,
+                "serviceChargeAmount": "0.00000100",
+                "amount": self._quantity(),
+                "operateTime": timestamp,
+                "transferedAmount": "0.00005000",
+                "fromAsset": asset,
+            }
+            for asset in self._random.sample(BASE_ASSETS, 2)
+        ]
+        return {
+            "operateTime": timestamp,
+            "totalTransferedAmount": "0.00010000",
+            "totalServiceChargeAmount": "0.00000200",
+            "transId": 2 * 10**12 + i,
+            "userAssetDribbletDetails": details,
+        }
+
+    def get_balances(self) -> list[dict]:
+        """
+        Current balances of the account. Most traded assets have no balance, so the pairs to sync in FULL mode
+        are mostly planned from the imported history.
+        """
+        return [{"asset": asset, "free": "1.00000000", "locked": "0.00000000"} for asset in self.balances]
+
+
+def _in_range(rows: list[dict], key: str, params: dict) -> list[dict]:
+    start_time = int(params.get("startTime", 0))
+    end_time = int(params.get("endTime", 2**63))
+    return [row for row in rows if start_time <= row[key] <= end_time]
+
+
+def _strip(rows: list[dict], *keys: str) -> list[dict]:
+    return [{key: value for key, value in row.items() if key not in keys} for row in rows]
+
+
+class FakeBinanceAdapter(BaseAdapter):
+    """
+    `requests` transport serving `FakeBinanceExchange` like the Binance API, to benchmark syncing and to test the
+    rate limit handling without network access. Mount it to the session of `BinanceClient` with its `adapter` kwarg.
+
+    Every response has the `X-MBX-USED-WEIGHT-1M` header of the weight used within the current minute.
+    When a request would use more than `weight_per_minute`, or on every `rate_limit_every`th request,
+    the response is HTTP 429 with a `Retry-After` header, like the real API.
+    """
+
+    def __init__(
+        self,
+        exchange: FakeBinanceExchange,
+        weight_per_minute: int = 6000,
+        latency: float = 0.0,
+        rate_limit_every: int | None = None,
+        retry_after: int = 1,
+        clock: Callable[[], float] = time.time,
+    ) -> None:
+        super().__init__()
+        self.exchange = exchange
+        self.weight_per_minute = weight_per_minute
+        self.latency = latency
+        self.rate_limit_every = rate_limit_every
+        self.retry_after = retry_after
+        self._clock = clock
+
+        self.request_count = 0
+        self.rate_limited_count = 0
+        self.rows_served = 0
+        self._minute = 0
+        self._used_weight = 0
+        self._lock = threading.Lock()
+
+        self._routes: dict[str, Callable[[dict], dict | list]] = {
+            "/api/v3/ping": lambda params: {},
+            "/api/v3/time": lambda params: {"serverTime": int(self._clock() * 1000)},
+            "/api/v3/exchangeInfo": self._exchange_info,
+            "/api/v3/account": lambda params: {"balances": self.exchange.get_balances()},
+            "/sapi/v1/accountSnapshot": self._account_snapshot,
+            "/api/v3/myTrades": self._my_trades,
+            "/sapi/v1/capital/deposit/hisrec": self._deposits,
+            "/sapi/v1/capital/withdraw/history": self._withdrawals,
+            "/sapi/v1/asset/assetDividend": self._dividends,
+            "/sapi/v1/simple-earn/flexible/history/rewardsRecord": self._interest("flexible"),
+            "/sapi/v1/simple-earn/locked/history/rewardsRecord": self._interest("locked"),
+            "/sapi/v1/eth-staking/eth/history/rewardsHistory": self._interest("eth"),
+            "/sapi/v1/simple-earn/flexible/position": lambda params: {"rows": [], "total": 0},
+            "/sapi/v1/simple-earn/locked/position": lambda params: {"rows": [], "total": 0},
+            "/sapi/v1/asset/dribblet": self._dust_log,
+            "/sapi/v1/convert/tradeFlow": self._convert_trade_flow,
+        }
+
+    def _exchange_info(self, params: dict) -> dict:
+        pairs = self.exchange.traded_pairs + self.exchange.untraded_pairs
+        return {
+            "symbols": [
+                {"symbol": f"{base}{quote}", "baseAsset": base, "quoteAsset": quote, "status": "TRADING"}
+                for base, quote in pairs
+            ]
+        }
+
+    def _account_snapshot(self, params: dict) -> dict:
+        # A snapshot is taken at the end of every day, with the current balances
+        day_ms = 24 * 60 * 60 * 1000
+        start_time, end_time = int(params["startTime"]), int(params["endTime"])
+        update_times = range(start_time // day_ms * day_ms + day_ms - 1000, end_time + 1, day_ms)
+        snapshots = [
+            {"type": "spot", "updateTime": update_time, "data": {"balances": self.exchange.get_balances()}}
+            for update_time in update_times
+            if update_time >= start_time
+        ]
+        return {"code": 200, "msg": "", "snapshotVos": snapshots[: int(params.get("limit", 7))]}
+
+    def _my_trades(self, params: dict) -> list[dict]:
+        trades = self.exchange.trades.get(params["symbol"], [])
+        from_id = int(params.get("fromId", 0))
+        return [trade for trade in trades if trade["id"] >= from_id][: int(params.get("limit", 500))]
+
+    def _deposits(self, params: dict) -> list[dict]:
+        return _in_range(self.exchange.deposits, "insertTime", params)[: int(params.get("limit", 1000))]
+
+    def _withdrawals(self, params: dict) -> list[dict]:
+        rows = _in_range(self.exchange.withdrawals, "time", params)[: int(params.get("limit", 1000))]
+        return _strip(rows, "time")
+
+    def _dividends(self, params: dict) -> dict:
+        rows = _in_range(self.exchange.dividends, "divTime", params)
+        return {"rows": rows[: int(params.get("limit", 20))], "total": len(rows)}
+
+    def _interest(self, kind: str) -> Callable[[dict], dict]:
+        def interest(params: dict) -> dict:
+            rows = [
+                row
+                for row in _in_range(self.exchange.interest, "time", params)
+                if row["kind"] == kind and ("type" not in params or row.get("type") == params["type"])
+            ]
+            return {"rows": _strip(rows[: int(params.get("size", 10))], "kind"), "total": len(rows)}
+
+        return interest
+
+    def _convert_trade_flow(self, params: dict) -> dict:
+        rows = _in_range(self.exchange.converts, "createTime", params)
+        limit = int(params.get("limit", 100))
+        return {
+            "list": rows[:limit],
+            "startTime": params.get("startTime"),
+            "endTime": params.get("endTime"),
+            "limit": limit,
+            "moreData": len(rows) > limit,
+        }
+
+    def _dust_log(self, params: dict) -> dict:
+        rows = _in_range(self.exchange.dust, "operateTime", params)
+        # Only the last 100 conversions are returned
+        return {"total": len(rows), "userAssetDribblets": rows[-100:]}
+
+    def _use_weight(self, weight: int) -> int | None:
+        """Count the weight of a request, and return the `Retry-After` seconds if the request is rate limited"""
+        with self._lock:
+            self.request_count += 1
+            now = self._clock()
+            if int(now // 60) != self._minute:
+                self._minute = int(now // 60)
+                self._used_weight = 0
+
+            if self.rate_limit_every and self.request_count % self.rate_limit_every == 0:
+                self.rate_limited_count += 1
+                return self.retry_after
+            if self._used_weight + weight > self.weight_per_minute:
+                self.rate_limited_count += 1
+                return max(1, int((self._minute + 1) * 60 - now))
+            self._used_weight += weight
+            return None
+
+    def _build_response(
+        self, request: requests.PreparedRequest, status_code: int, body: dict | list, headers: dict | None = None
+    ) -> requests.Response:
+        response = requests.Response()
+        response.status_code = status_code
+        response._content = json.dumps(body).encode()
+        response.headers = CaseInsensitiveDict(
+            {"Content-Type": "application/json", "X-MBX-USED-WEIGHT-1M": str(self._used_weight), **(headers or {})}
+        )
+        response.encoding = "utf-8"
+        response.url = request.url
+        response.request = request
+        return response
+
+    def send(self, request: requests.PreparedRequest, *args, **kwargs) -> requests.Response:
+        if self.latency:
+            time.sleep(self.latency)
+
+        split_url = urlsplit(request.url)
+        endpoint = split_url.path
+        retry_after = self._use_weight(ENDPOINT_WEIGHTS.get(endpoint, 1))
+        if retry_after is not None:
+            body = {"code": -1003, "msg": TOO_MUCH_WEIGHT_MESSAGE.format(limit=self.weight_per_minute)}
+            return self._build_response(request, 429, body, {"Retry-After": str(retry_after)})
+
+        if endpoint not in self._routes:
+            return self._build_response(request, 404, {"code": -1, "msg": f"Unknown endpoint `{endpoint}`."})
+
+        body = self._routes[endpoint](dict(parse_qsl(split_url.query)))
+        rows = (
+            body if isinstance(body, list) else body.get("rows", body.get("list", body.get("userAssetDribblets", [])))
+        )
+        with self._lock:
+            self.rows_served += len(rows)
+        return self._build_response(request, 200, body)
+
+    def close(self) -> None:
+        pass
+
+
+@lru_cache
+def get_fake_binance_adapter() -> FakeBinanceAdapter:
+    """Return the fake transport used when `BINANCE_TRANSPORT` is "fake", configured by `BINANCE_FAKE_EXCHANGE`"""
+    options = dict(settings.BINANCE_FAKE_EXCHANGE)
+    adapter_options = {
+        key: options.pop(key) for key in ("weight_per_minute", "latency", "rate_limit_every") if key in options
+    }
+    exchange = FakeBinanceExchange(FakeBinanceVolumes(**options))
+    return FakeBinanceAdapter(exchange, **adapter_options)
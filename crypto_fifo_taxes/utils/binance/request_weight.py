@@ -0,0 +1,85 @@
+import logging
+import threading
+import time
+from collections.abc import Mapping
+
+logger = logging.getLogger(__name__)
+
+__all__ = [
+    "RequestWeightLimiter",
+]
+
+USED_WEIGHT_HEADER = "x-mbx-used-weight-1m"
+
+
+class RequestWeightLimiter:
+    """
+    Pace requests to the Binance API against the request weight budget of the IP address.
+
+    Binance limits the total weight of the requests sent within each clock minute, and reports the weight used so far
+    in the `X-MBX-USED-WEIGHT-1M` response header. Requests reserve their weight with `acquire` before they are sent,
+    which blocks until the current minute has enough budget left. The reported weight is authoritative, as it also
+    includes requests sent by other threads and processes.
+    """
+
+    def __init__(self, weight_per_minute: int, clock=time.time, sleep=time.sleep) -> None:
+        self.weight_per_minute = weight_per_minute
+        self._clock = clock
+        self._sleep = sleep
+        self._lock = threading.Lock()
+        self._minute = self._get_minute()
+        self._used_weight = 0
+        self._paused_until = 0.0
+
+    def _get_minute(self) -> int:
+        return int(self._clock() // 60)
+
+    def _refresh_minute(self) -> None:
+        minute = self._get_minute()
+        if minute != self._minute:
+            self._minute = minute
+            self._used_weight = 0
+
+    @property
+    def used_weight(self) -> int:
+        with self._lock:
+            self._refresh_minute()
+            return self._used_weight
+
+    def acquire(self, weight: int = 1) -> None:
+        """Reserve `weight` from the budget of the current minute, waiting for the next minute if necessary."""
+        while True:
+            with self._lock:
+                self._refresh_minute()
+                now = self._clock()
+                if now < self._paused_until:
+                    wait_time = self._paused_until - now
+                elif self._used_weight + weight <= self.weight_per_minute:
+                    self._used_weight += weight
+                    return
+                else:
+                    wait_time = (self._minute + 1) * 60 - now
+            logger.debug(f"Binance request weight budget used, waiting {wait_time:.1f}s")
+            self._sleep(wait_time)
+
+    def update(self, headers: Mapping[str, str]) -> None:
+        """Update the used weight of the current minute from the headers of a response."""
+        used_weight = next((value for key, value in headers.items() if key.lower() == USED_WEIGHT_HEADER), None)
+        if used_weight is None:
+            return
+        with self._lock:
+            self._refresh_minute()
+            # Responses to concurrent requests arrive out of order, and don't include requests still in flight
+            self._used_weight = max(self._used_weight, int(used_weight))
+
+    def rate_limited(self, retry_after: float | None = None) -> None:
+        """
+        Stop all requests after Binance has responded with HTTP 429 or 418:
+        for `retry_after` seconds, or until the next minute if the response had no `Retry-After`.
+        """
+        with self._lock:
+            self._refresh_minute()
+            if retry_after is None:
+                self._used_weight = self.weight_per_minute
+            else:
+                self._paused_until = max(self._paused_until, self._clock() + retry_after)
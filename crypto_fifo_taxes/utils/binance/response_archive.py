@@ -0,0 +1,86 @@
+import atexit
+import gzip
+import json
+import logging
+import os
+import threading
+from collections.abc import Iterator
+from datetime import UTC, datetime
+from functools import lru_cache
+from urllib.parse import parse_qsl, urlsplit
+
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+__all__ = [
+    "ResponseArchive",
+    "get_response_archive",
+    "read_response_archive",
+]
+
+# Request parameters that differ on every request, and are not needed to replay the response
+_VOLATILE_PARAMS = {"timestamp", "signature", "recvWindow"}
+
+
+class ResponseArchive:
+    """
+    Append every raw Binance API response to a gzip compressed JSONL file.
+
+    Each run writes to a new file in `archive_dir`, named by the time the run started. Each line has the
+    `endpoint` (URL path), the request `params`, the `fetched_at` time and the decoded `response`.
+    The file is flushed after every response, so an interrupted run leaves a readable archive.
+    """
+
+    def __init__(self, archive_dir: str) -> None:
+        self.archive_dir = archive_dir
+        self.path = os.path.join(archive_dir, f"binance-{datetime.now(UTC):%Y%m%dT%H%M%S%f}.jsonl.gz")
+        self._file: gzip.GzipFile | None = None
+        self._lock = threading.Lock()
+
+    def append(self, url: str, response: dict | list) -> None:
+        """Archive the response to the request of `url`"""
+        split_url = urlsplit(url)
+        record = {
+            "endpoint": split_url.path,
+            "params": {key: value for key, value in parse_qsl(split_url.query) if key not in _VOLATILE_PARAMS},
+            "fetched_at": datetime.now(UTC).isoformat(),
+            "response": response,
+        }
+        line = json.dumps(record, separators=(",", ":")).encode() + b"\n"
+        with self._lock:
+            if self._file is None:
+                os.makedirs(self.archive_dir, exist_ok=True)
+                self._file = gzip.open(self.path, "ab")
+            self._file.write(line)
+            self._file.flush()
+
+    def close(self) -> None:
+        with self._lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+
+
+@lru_cache
+def get_response_archive() -> ResponseArchive | None:
+    """Return the archive of the current run, or None if archiving is disabled with an empty `BINANCE_ARCHIVE_DIR`"""
+    if not settings.BINANCE_ARCHIVE_DIR:
+        return None
+    archive = ResponseArchive(settings.BINANCE_ARCHIVE_DIR)
+    atexit.register(archive.close)
+    return archive
+
+
+def read_response_archive(archive_dir: str) -> Iterator[dict]:
+    """Yield every archived response in `archive_dir`, in the order they were fetched"""
+    for file_name in sorted(os.listdir(archive_dir)):
+        if not (file_name.startswith("binance-") and file_name.endswith(".jsonl.gz")):
+            continue
+        with gzip.open(os.path.join(archive_dir, file_name), "rb") as archive_file:
+            try:
+                for line in archive_file:
+                    yield json.loads(line)
+            except EOFError:
+                # The run was interrupted before the file was closed, everything flushed before that is readable
+                logger.warning(f"Binance response archive `{file_name}` is truncated.")
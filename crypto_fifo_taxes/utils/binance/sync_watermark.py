@@ -0,0 +1,51 @@
+from datetime import datetime, timedelta
+
+from django.conf import settings
+
+from crypto_fifo_taxes.models import SyncWatermark, Wallet
+
+__all__ = [
+    "get_sync_start_date",
+    "get_sync_watermarks",
+    "is_watermark_covered",
+    "save_sync_watermark",
+]
+
+
+def _to_local_naive(dt: datetime) -> datetime:
+    """`binance_history_iterator` handles dates as naive local datetimes"""
+    return dt.astimezone().replace(tzinfo=None)
+
+
+def get_sync_watermarks(wallet: Wallet) -> dict[str, datetime]:
+    """Return the watermarks of all endpoints of the wallet, by endpoint"""
+    return dict(SyncWatermark.objects.filter(wallet=wallet).values_list("endpoint", "synced_until"))
+
+
+def get_sync_start_date(synced_until: datetime | None, start_date: datetime | None = None) -> datetime | None:
+    """
+    Return the date the history of an endpoint is synced from.
+
+    An explicit `start_date` is always used. Otherwise the sync resumes `BINANCE_SYNC_OVERLAP_DAYS` before the
+    watermark, as records may appear in the history with a delay. Duplicates in the overlap are skipped on import.
+    Returns None if the endpoint has never been synced, i.e. the whole history is synced.
+    """
+    if start_date is not None:
+        return start_date
+    if synced_until is None:
+        return None
+    return _to_local_naive(synced_until - timedelta(days=settings.BINANCE_SYNC_OVERLAP_DAYS))
+
+
+def is_watermark_covered(start_date: datetime | None, synced_until: datetime | None) -> bool:
+    """
+    Return True if a sync from `start_date` leaves no gap after the watermark, so it may be advanced.
+    A sync starting after the watermark skips records, and must not advance it.
+    """
+    if start_date is None:
+        return True
+    return synced_until is not None and start_date <= _to_local_naive(synced_until)
+
+
+def save_sync_watermark(endpoint: str, wallet: Wallet, synced_until: datetime) -> None:
+    SyncWatermark.objects.update_or_create(endpoint=endpoint, wallet=wallet, defaults={"synced_until": synced_until})
@@ -1,44 +1,34 @@
 import datetime
 import logging
-import time
 from decimal import Decimal
 from functools import lru_cache
 from typing import TypedDict
 
-import requests
 from django.conf import settings
-from django.utils import timezone
+from django.db.models import Min
 
-from crypto_fifo_taxes.exceptions import CoinGeckoAPIException, MissingPriceHistoryError
-from crypto_fifo_taxes.models import Currency, CurrencyPrice
+from crypto_fifo_taxes.exceptions import MissingPriceHistoryError
+from crypto_fifo_taxes.models import Currency, CurrencyPrice, FiatExchangeRate
 from crypto_fifo_taxes.utils.binance.binance_api import from_timestamp
-from crypto_fifo_taxes.utils.currency import get_fiat_currency
+from crypto_fifo_taxes.utils.currency import (
+    bulk_upsert_currency_prices,
+    get_currency,
+    get_fiat_currency,
+    get_or_create_currency,
+)
+from crypto_fifo_taxes.utils.date_utils import utc_date, utc_end_of_day, utc_start_of_day
+from crypto_fifo_taxes.utils.price_fetch_planner import (
+    PriceCoverage,
+    PriceFetchRequest,
+    get_price_coverage,
+    group_missing_dates,
+    plan_price_fetch_requests,
+)
+from crypto_fifo_taxes.utils.price_providers import get_price_provider
 
 logger = logging.getLogger(__name__)
 
 
-def retry_get_request_until_ok(url: str) -> dict | None:
-    while True:
-        logger.debug(f"Fetching {url}")
-
-        response = requests.get(url, timeout=10)
-
-        if response.status_code == 200:
-            return response.json()
-        elif response.status_code == 429:
-            # CoinGecko has a rate limit of 50 calls/minute, but In reality it seems to be more than that
-            # If requests are throttled, wait and retry later
-            # For some reason the `"Retry-After"` is not always returned with a HTTP 429 response
-            sleep_time = int(response.headers["Retry-After"]) if "Retry-After" in response.headers else 5
-            logger.warning(f"Too Many Requests sent to CoinGecko API. Waiting {sleep_time}s until trying again")
-            time.sleep(sleep_time)
-            continue
-        elif response.status_code >= 400:
-            raise CoinGeckoAPIException(f"Bad request to CoinGecko API url '{url}': {response.json()}")
-        # Do not loop forever if response status is unexpected
-        return None
-
-
 @lru_cache
 def coingecko_get_currency_list() -> dict:
     """
@@ -47,19 +37,14 @@ def coingecko_get_currency_list() -> dict:
     Data format:
     {'id': 'bitcoin', 'symbol': 'btc', 'name': 'Bitcoin'}
     """
-    api_url = "https://api.coingecko.com/api/v3/coins/list?include_platform=false"
-    return retry_get_request_until_ok(api_url)
+    return get_price_provider().get_currency_list()
 
 
 @lru_cache
 def coingecko_request_price_history(currency: Currency, date: datetime.date) -> dict | None:
     """Requests and returns all data for given currency and date from CoinGecko API"""
     assert currency.cg_id is not None
-    api_url = "https://api.coingecko.com/api/v3/coins/{id}/history?date={date}&localization=false".format(
-        id=currency.cg_id,
-        date=date.strftime("%d-%m-%Y"),
-    )
-    return retry_get_request_until_ok(api_url)
+    return get_price_provider().get_price_history(currency.cg_id, date)
 
 
 class CoingeckoMarketChart(TypedDict):
@@ -80,32 +65,31 @@ def coingecko_request_market_chart(
     currency: Currency,
     vs_currency: Currency,
     start_date: datetime.date,
+    end_date: datetime.date,
 ) -> CoingeckoMarketChart:
+    """Request the market chart of a currency for the given dates (inclusive)."""
     assert currency.cg_id is not None
     assert vs_currency.cg_id is not None
 
-    days = (timezone.now().date() - start_date).days + 1  # Add 1 to include end date (today)
-    if days <= 0:
-        raise ValueError("Start date should be before today.")
-    if days > 365:
-        logger.warning(f"Trying to fetch {days} days of data from CoinGecko API, but the maximum is 365 days.")
-        days = 365
-
-    api_url = (
-        f"https://api.coingecko.com/api/v3/coins/{currency.cg_id}/market_chart?"
-        f"vs_currency={vs_currency.cg_id}&days={days}&interval=daily"
-    )
     logger.debug(
         f"Fetching market chart prices for {currency.symbol} "
-        f"starting from {start_date} ({days} days) in {vs_currency.symbol}."
+        f"from {start_date} to {end_date} ({(end_date - start_date).days + 1} days) in {vs_currency.symbol}."
     )
 
-    response_json = retry_get_request_until_ok(api_url)
+    from_timestamp_s = int(utc_start_of_day(start_date).timestamp())
+    to_timestamp_s = int(utc_end_of_day(end_date).timestamp())
+
+    price_provider = get_price_provider()
+    response_json = price_provider.get_market_chart_range(
+        currency.cg_id, vs_currency.cg_id, from_timestamp_s, to_timestamp_s
+    )
 
     # Coin was unable to retrieved for some reason. e.g. deprecated (VEN)
     if response_json is None:
         # Retry once, as sometimes there are errors fetching data
-        response_json = retry_get_request_until_ok(api_url)
+        response_json = price_provider.get_market_chart_range(
+            currency.cg_id, vs_currency.cg_id, from_timestamp_s, to_timestamp_s
+        )
         if response_json is None:
             raise MissingPriceHistoryError(f"Market chart not returned for {currency} starting from {start_date}.")
 
@@ -115,106 +99,190 @@ def coingecko_request_market_chart(
     return response_json
 
 
-def fetch_currency_market_chart(currency: Currency) -> None:
-    """Update historical prices for given currency and date using the CoinGecko API"""
-    if (
-        currency.is_fiat
-        or currency.symbol in settings.COINGECKO_DEPRECATED_TOKENS
-        or currency.symbol in settings.IGNORED_TOKENS
+def parse_market_chart(response_json: CoingeckoMarketChart) -> dict[datetime.date, MarketChartData]:
+    """
+    Parse the market chart to one data point per date.
+
+    Shorter ranges are returned with hourly data points, in which case the first data point of each date is used,
+    as it is the closest one to the daily price at 00:00 UTC.
+    """
+    daily_data: dict[datetime.date, MarketChartData] = {}
+    for (stamp, price), (__, market_cap), (__, volume) in zip(
+        response_json["prices"], response_json["market_caps"], response_json["total_volumes"]
     ):
-        logger.debug(f"Skipping currency {currency}.")
-        return
+        timestamp = from_timestamp(stamp)
+        if timestamp.date() not in daily_data:
+            daily_data[timestamp.date()] = MarketChartData(
+                timestamp=timestamp, price=price, market_cap=market_cap, volume=volume
+            )
+    return daily_data
 
-    # First transaction date for the currency
-    first_transaction_details = currency.transaction_details.order_by_timestamp().first()
-    if first_transaction_details is None:
-        logger.debug(f"Currency {currency} has no transactions, so we don't need to fetch historical prices for it.")
-        return
 
-    first_transaction_date = first_transaction_details.tx_timestamp.date()
+def _save_missing_days(currency: Currency, missing_dates: list[datetime.date]) -> None:
+    """
+    Save the runs of dates the API returned no prices for to `num_missing_days` of the price preceding the run,
+    so that those dates are not requested again.
+
+    Today's price may still be added later, so today is never saved as missing.
+    """
+    for missing_range in group_missing_dates(date for date in missing_dates if date < utc_date()):
+        previous_price = CurrencyPrice.objects.filter(
+            currency=currency, date=missing_range.start_date - datetime.timedelta(days=1)
+        )
+        if not previous_price.update(num_missing_days=missing_range.days):
+            logger.error(
+                f"No prices were returned for {currency} from {missing_range.start_date} to {missing_range.end_date}. "
+                f"Consider adding it to `COINGECKO_FLAKY_PRICES` list."
+            )
+
 
+def execute_price_fetch_request(fetch_request: PriceFetchRequest, missing_dates: set[datetime.date]) -> int:
+    """
+    Fetch and save the prices of a single request. `missing_dates` are the dates within the request
+    that don't have a price saved yet. Return the number of new prices saved.
+    """
+    currency = get_currency(fetch_request.currency_id)
     fiat_currency = get_fiat_currency()
-    currency_price_qs = CurrencyPrice.objects.filter(
-        currency=currency,
-        date__gte=first_transaction_date,
+
+    response_json = coingecko_request_market_chart(
+        currency, fiat_currency, fetch_request.start_date, fetch_request.end_date
     )
+    daily_data = {
+        date: data
+        for date, data in parse_market_chart(response_json).items()
+        if fetch_request.start_date <= date <= fetch_request.end_date
+    }
+
+    bulk_upsert_currency_prices(
+        CurrencyPrice(
+            currency=currency,
+            date=date,
+            price=Decimal(str(market_chart_data["price"])),
+            market_cap=Decimal(str(market_chart_data["market_cap"])),
+            volume=Decimal(str(market_chart_data["volume"])),
+        )
+        for date, market_chart_data in daily_data.items()
+    )
+
+    not_returned_dates = missing_dates - daily_data.keys()
+    if not_returned_dates:
+        logger.warning(
+            f"{len(not_returned_dates)} prices were not returned for {currency} in {fiat_currency.symbol} "
+            f"between {fetch_request.start_date} and {fetch_request.end_date}."
+        )
+        _save_missing_days(currency, list(not_returned_dates))
+
+    created_count = len(missing_dates & daily_data.keys())
+    logger.info(f"Created {created_count} new prices for {currency} in {fiat_currency.symbol}.")
+    return created_count
 
-    # Days between first transaction and today
-    total_num_days_required = (timezone.now().date() - first_transaction_date).days + 1  # Add 1 to include end date
 
-    currency_prices_count = currency_price_qs.count()
-    # If we have as many prices saved as the number of days between first transaction and today, we have all prices.
-    if currency_prices_count == total_num_days_required:
-        logger.debug(f"Already have all prices for {currency} in {fiat_currency.symbol}.")
+def fetch_prices_for_coverage(coverage: PriceCoverage) -> int:
+    """Fetch all missing prices of a currency. Return the number of new prices saved."""
+    missing_dates = {
+        missing_range.start_date + datetime.timedelta(days=day)
+        for missing_range in coverage.missing_ranges
+        for day in range(missing_range.days)
+    }
+
+    created_count = 0
+    for fetch_request in plan_price_fetch_requests(coverage):
+        request_missing_dates = {
+            date for date in missing_dates if fetch_request.start_date <= date <= fetch_request.end_date
+        }
+        created_count += execute_price_fetch_request(fetch_request, request_missing_dates)
+    return created_count
+
+
+def fetch_currency_market_chart(currency: Currency) -> None:
+    """Update historical prices for given currency and date using the CoinGecko API"""
+    coverage = get_price_coverage(currency_ids=[currency.pk]).get(currency.pk)
+
+    # Fiat, deprecated and ignored currencies, and currencies without any transactions
+    if coverage is None:
+        logger.debug(f"Skipping currency {currency}.")
         return
 
-    # By default, start fetching prices from the first transaction date to get the prices for every single date.
-    start_date = first_transaction_date
-
-    # We have some prices saved, but not all. Check if we can fetch fewer days from the API.
-    if currency_prices_count > 0:
-        latest_currency_price: CurrencyPrice = currency_price_qs.order_by("-date").first()
-
-        # If the CurrencyPrice has `num_missing_days`, we can deduct that from the total number of days required.
-        # The prices were not returned from the API before, so they are not expected to be returned now,
-        # making it pointless to try to fetch them again.
-        adjusted_num_days_required = total_num_days_required - latest_currency_price.num_missing_days
-        if currency_prices_count >= adjusted_num_days_required:
-            logger.debug(f"Already have all prices for {currency} in {fiat_currency.symbol}.")
-            return
-
-        # Number of days we should have saved in the database.
-        num_expected_prices_in_db = (latest_currency_price.date - first_transaction_date).days
-        num_expected_prices_in_db -= latest_currency_price.num_missing_days
-
-        # All dates between first_transaction_date and latest saved CurrencyPrice are in DB.
-        if currency_prices_count >= num_expected_prices_in_db:
-            # We can safely fetch currency prices starting from the first missing date.
-            start_date = latest_currency_price.date + datetime.timedelta(days=1)
-
-    try:
-        response_json: CoingeckoMarketChart = coingecko_request_market_chart(currency, fiat_currency, start_date)
-    except ValueError:
+    if not coverage.missing_ranges:
+        logger.debug(f"Already have all prices for {currency} in {get_fiat_currency().symbol}.")
         return
 
-    # Parse the response and to MarketChartData objects
-    combined_market_chart_data = [
-        MarketChartData(timestamp=from_timestamp(stamp), price=price, market_cap=market_cap, volume=volume)
-        for (stamp, price), (__, market_cap), (__, volume) in zip(
-            response_json["prices"], response_json["market_caps"], response_json["total_volumes"]
+    fetch_prices_for_coverage(coverage)
+
+
+def fetch_fiat_exchange_rates(fiat: Currency) -> int:
+    """
+    Fetch the missing daily exchange rates from the default FIAT currency to `fiat`,
+    from the first saved price until today. Return the number of new exchange rates saved.
+
+    CoinGecko doesn't provide exchange rates between FIAT currencies, so they are derived from the prices of
+    `FIAT_EXCHANGE_RATE_REFERENCE_SYMBOL` in both currencies. Prices in the default FIAT currency are usually saved
+    already, so a single price series is fetched per reporting currency, regardless of the number of currencies.
+    """
+    base_fiat = get_fiat_currency()
+    if fiat == base_fiat:
+        return 0
+
+    first_price_date = CurrencyPrice.objects.aggregate(first_date=Min("date"))["first_date"]
+    if first_price_date is None:
+        logger.debug(f"No prices saved, skipping exchange rates to {fiat.symbol}.")
+        return 0
+
+    existing_dates = set(
+        FiatExchangeRate.objects.filter(base=base_fiat, quote=fiat, date__gte=first_price_date).values_list(
+            "date", flat=True
         )
+    )
+    total_days = (utc_date() - first_price_date).days + 1
+    missing_dates = [
+        date
+        for date in (first_price_date + datetime.timedelta(days=day) for day in range(total_days))
+        if date not in existing_dates
     ]
+    if not missing_dates:
+        logger.debug(f"Already have all exchange rates to {fiat.symbol}.")
+        return 0
+
+    reference = get_or_create_currency(settings.FIAT_EXCHANGE_RATE_REFERENCE_SYMBOL)
+    coverage = PriceCoverage(
+        currency_id=reference.pk,
+        first_transaction_date=first_price_date,
+        last_transaction_date=utc_date(),
+        missing_ranges=group_missing_dates(missing_dates),
+    )
 
     created_count = 0
-    for market_chart_data in combined_market_chart_data:
-        _, created = CurrencyPrice.objects.update_or_create(
-            currency=currency,
-            date=market_chart_data["timestamp"],
-            defaults={
-                "price": Decimal(str(market_chart_data["price"])),
-                "market_cap": Decimal(str(market_chart_data["market_cap"])),
-                "volume": Decimal(str(market_chart_data["volume"])),
-            },
-        )
-        if created:
-            created_count += 1
-    if created_count > 0:
-        logger.info(f"Created {created_count} new prices for {currency} in {fiat_currency.symbol}.")
-    else:
-        expected_created_count = (timezone.now().date() - start_date).days
-        logger.warning(
-            f"No new prices were created for {currency} in {fiat_currency.symbol}, "
-            f"but {expected_created_count} new prices was expected. "
-            f"Saving this result to reduce useless future price fetches."
+    for fetch_request in plan_price_fetch_requests(coverage):
+        start_date, end_date = fetch_request.start_date, fetch_request.end_date
+        quote_prices = {
+            date: Decimal(str(data["price"]))
+            for date, data in parse_market_chart(
+                coingecko_request_market_chart(reference, fiat, start_date, end_date)
+            ).items()
+            if start_date <= date <= end_date
+        }
+        base_prices = dict(reference.prices.filter(date__range=(start_date, end_date)).values_list("date", "price"))
+
+        # The reference currency might not have transactions, in which case its prices need to be fetched as well
+        if quote_prices.keys() - base_prices.keys():
+            execute_price_fetch_request(
+                PriceFetchRequest(reference.pk, start_date, end_date),
+                set(quote_prices.keys() - base_prices.keys()),
+            )
+            base_prices = dict(reference.prices.filter(date__range=(start_date, end_date)).values_list("date", "price"))
+
+        exchange_rates = [
+            FiatExchangeRate(base=base_fiat, quote=fiat, date=date, rate=quote_price / base_prices[date])
+            for date, quote_price in quote_prices.items()
+            if base_prices.get(date)
+        ]
+        FiatExchangeRate.objects.bulk_create(
+            exchange_rates,
+            update_conflicts=True,
+            unique_fields=["base", "quote", "date"],
+            update_fields=["rate"],
         )
+        created_count += len({rate.date for rate in exchange_rates} - existing_dates)
 
-        latest_currency_price: CurrencyPrice = currency_price_qs.order_by("-date").first()
-        if latest_currency_price is not None:
-            latest_currency_price.num_missing_days = expected_created_count
-            latest_currency_price.save()
-        else:
-            logger.error(
-                f"No prices was returned for {currency} in {fiat_currency.symbol}. "
-                f"Consider adding it to `COINGECKO_ASSUME_ZERO_PRICE_TOKENS` list."
-            )
-            return
+    logger.info(f"Created {created_count} new exchange rates from {base_fiat.symbol} to {fiat.symbol}.")
+    return created_count
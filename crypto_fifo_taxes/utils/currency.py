@@ -1,11 +1,12 @@
 import logging
+from collections.abc import Iterable
 from functools import lru_cache
 
 from django.conf import settings
 from django.db import IntegrityError
 
 from crypto_fifo_taxes.exceptions import CoinGeckoMissingCurrency, CoinGeckoMultipleMatchingCurrenciesCurrency
-from crypto_fifo_taxes.models import Currency, CurrencyPair
+from crypto_fifo_taxes.models import Currency, CurrencyPair, CurrencyPrice
 
 logger = logging.getLogger(__name__)
 
@@ -24,6 +25,20 @@ def get_fiat_currency() -> Currency:
     return fiat
 
 
+@lru_cache
+def get_or_create_fiat_currency(symbol: str) -> Currency:
+    """Return the currency object for a FIAT currency, creating it if it doesn't exist."""
+    symbol = symbol.upper()
+    if symbol == settings.DEFAULT_FIAT_SYMBOL:
+        return get_fiat_currency()
+
+    fiat, _ = Currency.objects.get_or_create(
+        symbol=symbol,
+        defaults={"name": symbol, "cg_id": symbol.lower(), "is_fiat": True},
+    )
+    return fiat
+
+
 @lru_cache
 def get_currency(currency: Currency | str | int) -> Currency:
     """
@@ -147,3 +162,25 @@ def get_or_create_currency_pair(symbol: str, buy: str, sell: str) -> CurrencyPai
             "sell": get_or_create_currency(sell),
         },
     )[0]
+
+
+def bulk_upsert_currency_prices(currency_prices: Iterable[CurrencyPrice], batch_size: int = 5000) -> int:
+    """
+    Insert or update the given prices with a single `INSERT ... ON CONFLICT` statement per batch.
+
+    Only one price per currency and date can be written in a single statement,
+    so if the same date is given multiple times, the last given price is used.
+    Returns the number of distinct prices written.
+    """
+    unique_prices = {(price.currency_id, price.date): price for price in currency_prices}
+    if not unique_prices:
+        return 0
+
+    CurrencyPrice.objects.bulk_create(
+        unique_prices.values(),
+        batch_size=batch_size,
+        update_conflicts=True,
+        unique_fields=["currency", "date"],
+        update_fields=["price", "market_cap", "volume"],
+    )
+    return len(unique_prices)
@@ -1,10 +1,19 @@
 import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
 from functools import lru_cache
 
 import requests
 from django.conf import settings
+from django.db.models import Min
+from django.db.transaction import atomic
+from django.utils import timezone
 
+from crypto_fifo_taxes.enums import TransactionLabel, TransactionType
 from crypto_fifo_taxes.exceptions import EtherscanException
+from crypto_fifo_taxes.models import EthereumTransactionSender, MiningPoolAddress, Snapshot, Transaction
 
 logger = logging.getLogger(__name__)
 
@@ -15,38 +24,126 @@ def get_ethplorer_client():
     if api_key is None:
         api_key = "freekey"
         logger.warning("'ETHPLORER_API_KEY' environment variable is missing. Using 'freekey' instead.")
-    return EtherscanClient(api_key)
+    return EtherscanClient(api_key, requests_per_second=settings.ETHPLORER_REQUESTS_PER_SECOND)
+
+
+def is_real_tx_id(tx_id: str) -> bool:
+    return len(tx_id) == 66 and tx_id.startswith("0x")
 
 
 class EtherscanClient:
     api_key = None
-    known_pool_addresses = []
 
-    def __init__(self, api_key: str) -> None:
+    def __init__(self, api_key: str, requests_per_second: float = 2) -> None:
         self.api_key = api_key
-        self._get_known_pool_addresses()
+        self.request_interval = 1 / requests_per_second
+        self._next_request_time = 0.0
+        self._lock = threading.Lock()
+
+    def _wait_for_rate_limit(self) -> None:
+        """Space the requests of all threads evenly, to stay within the rate limit of the API key."""
+        with self._lock:
+            now = time.monotonic()
+            wait_time = self._next_request_time - now
+            self._next_request_time = max(now, self._next_request_time) + self.request_interval
+        if wait_time > 0:
+            time.sleep(wait_time)
 
-    def _get_known_pool_addresses(self) -> None:
+    def get_known_pool_addresses(self) -> list[str]:
         """Ethplorer private API endpoint to get addresses with `miner` tag"""
         url = "https://ethplorer.io/service/service.php?search=miner&sm=spt"
         results = requests.get(url, timeout=10).json()["results"]
-        self.known_pool_addresses = [result[2] for result in results]
+        return [result[2] for result in results]
 
     def get_tx_info(self, tx_id: str) -> dict:
+        self._wait_for_rate_limit()
         url = f"https://api.ethplorer.io/getTxInfo/{tx_id}?apiKey={self.api_key}"
         return requests.get(url, timeout=10).json()
 
-    def _is_real_tx_id(self, tx_id: str) -> bool:
-        return len(tx_id) == 66 and tx_id.startswith("0x")
-
-    def is_tx_from_mining_pool(self, tx_id: str) -> bool:
-        if not self._is_real_tx_id(tx_id):
-            return False
-
+    def get_tx_sender(self, tx_id: str) -> str:
         tx_info = self.get_tx_info(tx_id)
         if "error" in tx_info:
             raise EtherscanException(tx_info, tx_id)
-        if "from" in tx_info:
-            from_address = tx_info["from"]
-            return from_address in self.known_pool_addresses
-        return False
+        return tx_info.get("from", "")
+
+
+def get_known_pool_addresses() -> set[str]:
+    """
+    Return the addresses of known mining pools from the cache table.
+    The addresses are fetched again, when they are older than `ETHPLORER_POOL_ADDRESSES_MAX_AGE_DAYS`.
+    """
+    max_age = timedelta(days=settings.ETHPLORER_POOL_ADDRESSES_MAX_AGE_DAYS)
+    fetched_at = MiningPoolAddress.objects.aggregate(fetched_at=Min("fetched_at"))["fetched_at"]
+    if fetched_at is None or timezone.now() - fetched_at > max_age:
+        addresses = get_ethplorer_client().get_known_pool_addresses()
+        with atomic():
+            MiningPoolAddress.objects.all().delete()
+            now = timezone.now()
+            MiningPoolAddress.objects.bulk_create(
+                [MiningPoolAddress(address=address, fetched_at=now) for address in set(addresses)]
+            )
+        logger.info(f"Fetched {len(addresses)} mining pool addresses from Ethplorer.")
+    return set(MiningPoolAddress.objects.values_list("address", flat=True))
+
+
+def fetch_tx_senders(tx_ids: list[str], max_workers: int | None = None) -> int:
+    """
+    Fetch the senders of the transactions concurrently, and save them to the cache table.
+    Failed requests are logged and skipped, so that they are retried by the next labeling pass.
+    Returns the number of senders saved.
+    """
+    client = get_ethplorer_client()
+
+    def fetch_sender(tx_id: str) -> EthereumTransactionSender | None:
+        try:
+            return EthereumTransactionSender(tx_id=tx_id, from_address=client.get_tx_sender(tx_id))
+        except (EtherscanException, requests.RequestException, ValueError):
+            logger.warning(f"Could not fetch the sender of the transaction `{tx_id}` from Ethplorer.", exc_info=True)
+            return None
+
+    with ThreadPoolExecutor(max_workers=max_workers or settings.ETHPLORER_MAX_WORKERS) as executor:
+        senders = [sender for sender in executor.map(fetch_sender, tx_ids) if sender is not None]
+
+    EthereumTransactionSender.objects.bulk_create(senders, ignore_conflicts=True)
+    return len(senders)
+
+
+def label_mining_deposits() -> int:
+    """
+    Label ETH deposits sent from a known mining pool as mining, after the deposits have been imported.
+
+    Senders are only fetched for transactions that are not in the cache table yet,
+    and all matching deposits are labeled with a single update. Returns the number of deposits labeled.
+    Fetched senders and pool addresses are saved outside the transaction of the update,
+    so they are kept even if labeling fails.
+    """
+    deposits = Transaction.objects.filter(
+        transaction_type=TransactionType.DEPOSIT,
+        to_detail__currency__symbol="ETH",
+        tx_id__startswith="0x",
+    ).exclude(transaction_label=TransactionLabel.MINING)
+
+    tx_ids = {tx_id for tx_id in deposits.values_list("tx_id", flat=True) if is_real_tx_id(tx_id)}
+    if not tx_ids:
+        return 0
+
+    cached_tx_ids = set(EthereumTransactionSender.objects.filter(tx_id__in=tx_ids).values_list("tx_id", flat=True))
+    if missing_tx_ids := sorted(tx_ids - cached_tx_ids):
+        logger.info(f"Fetching the senders of {len(missing_tx_ids)} ETH deposits from Ethplorer...")
+        fetch_tx_senders(missing_tx_ids)
+
+    pool_addresses = get_known_pool_addresses()
+    mining_tx_ids = EthereumTransactionSender.objects.filter(tx_id__in=tx_ids, from_address__in=pool_addresses)
+    mining_deposits = deposits.filter(tx_id__in=mining_tx_ids.values("tx_id"))
+    with atomic():
+        first_timestamp = mining_deposits.aggregate(first_timestamp=Min("timestamp"))["first_timestamp"]
+        if first_timestamp is None:
+            return 0
+
+        labeled = Transaction.objects.filter(pk__in=mining_deposits.values("pk")).update(
+            transaction_label=TransactionLabel.MINING
+        )
+        # Mining income is counted as deposits in snapshots
+        Snapshot.objects.filter(date__gte=first_timestamp.date()).delete()
+    logger.info(f"Labeled {labeled} ETH deposits as mining.")
+    return labeled
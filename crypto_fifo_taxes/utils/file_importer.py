@@ -0,0 +1,125 @@
+import io
+import logging
+import os
+from collections.abc import Iterator
+
+from django.conf import settings
+from django.core.management import BaseCommand
+from django.db.transaction import atomic
+
+from crypto_fifo_taxes.models import Transaction
+from crypto_fifo_taxes.utils.ethplorer import label_mining_deposits
+from crypto_fifo_taxes.utils.import_pipeline import ImportSource
+from crypto_fifo_taxes.utils.import_spec import ImportSpec
+from crypto_fifo_taxes.utils.staging_importer import StagingImporter, StagingRow
+from crypto_fifo_taxes.utils.streaming import chunked, iter_json_array
+from crypto_fifo_taxes.utils.transaction_creator import TransactionBatch
+
+logger = logging.getLogger(__name__)
+
+__all__ = [
+    "FileImportCommand",
+]
+
+
+class FileImportCommand(BaseCommand):
+    """
+    Base for commands that import transactions from an exported file.
+
+    The file is streamed in chunks of `--chunk-size` rows: each chunk is parsed, checked for already imported
+    transactions with a single query, and created with a single `TransactionBatch`,
+    so the memory usage doesn't depend on the size of the file.
+    The whole file is imported in one database transaction, also as a source of `run_import_pipeline`.
+    When run as a command, ETH mining deposits are labeled with `label_mining_deposits` after the transaction.
+
+    Subclasses implement `build_transaction_id`, and either declare an `import_spec`, which parses each chunk
+    column by column, or implement `import_row`. `iter_rows` can be overridden for other than JSON array files.
+    `iter_rows` is only used to parse the file, and must not use the database,
+    so that the file can be parsed in a worker thread of `run_import_pipeline`.
+
+    Commands with an `import_spec` have a `--staging` option, which imports the rows parsed with it with set-based SQL
+    by `StagingImporter` instead, which is much faster for very large files.
+    """
+
+    default_filename: str
+    default_chunk_size = 1000
+    import_spec: ImportSpec | None = None
+
+    def add_arguments(self, parser):
+        parser.add_argument("--file", type=str)
+        parser.add_argument("--chunk-size", type=int, default=self.default_chunk_size)
+        if self.import_spec is not None:
+            # Only rows parsed with an import spec can be copied to the staging table
+            parser.add_argument(
+                "--staging", action="store_true", help="Import the file through a SQL staging table (large files)"
+            )
+
+    def iter_rows(self, file: io.TextIOBase) -> Iterator[dict]:
+        return iter_json_array(file)
+
+    def build_transaction_id(self, row: dict) -> str:
+        raise NotImplementedError
+
+    def import_row(self, row: dict, tx_id: str, batch: TransactionBatch) -> None:
+        """Add the transaction of a row that hasn't been imported yet to the batch."""
+        raise NotImplementedError
+
+    def to_staging_rows(self, rows: list[dict], tx_ids: list[str]) -> list[StagingRow]:
+        if self.import_spec is None:
+            raise NotImplementedError(f"`{self.__module__}` has no import spec.")
+        return self.import_spec.parse(rows, tx_ids)
+
+    def get_existing_transaction_ids(self, tx_ids: set[str]) -> set[str]:
+        return Transaction.objects.existing_tx_ids(tx_ids)
+
+    def import_chunk(self, rows: list[dict]) -> None:
+        tx_ids = [self.build_transaction_id(row) for row in rows]
+        existing_tx_ids = self.get_existing_transaction_ids(set(tx_ids))
+
+        # Skip already imported transactions
+        new_rows = [(row, tx_id) for row, tx_id in zip(rows, tx_ids, strict=True) if tx_id not in existing_tx_ids]
+
+        batch = TransactionBatch()
+        if self.import_spec is not None:
+            batch.add_staging_rows(self.to_staging_rows([row for row, _ in new_rows], [tx_id for _, tx_id in new_rows]))
+        else:
+            for row, tx_id in new_rows:
+                self.import_row(row, tx_id, batch)
+        batch.create()
+
+    def get_filepath(self, filename: str | None) -> str:
+        return os.path.join(settings.BASE_DIR, filename or self.default_filename)
+
+    def get_import_source(self, file: str | None = None, chunk_size: int | None = None) -> ImportSource:
+        """Return the file as an import source, which parses the file in chunks and imports each chunk."""
+        filepath = self.get_filepath(file)
+        chunk_size = chunk_size or self.default_chunk_size
+
+        def parse_chunks() -> Iterator[list[dict]]:
+            with open(filepath, newline="") as file:
+                yield from chunked(self.iter_rows(file), chunk_size)
+
+        return ImportSource(
+            name=self.__module__.rsplit(".", 1)[-1], fetch=parse_chunks, write=self.import_chunk, atomic=True
+        )
+
+    def handle(self, *args, **kwargs):
+        transactions_count = Transaction.objects.count()
+
+        source = self.get_import_source(kwargs.pop("file", None), kwargs.pop("chunk_size", None))
+        with atomic():
+            if kwargs.pop("staging", False):
+                # Already imported rows are skipped by the staging importer
+                staging_importer = StagingImporter(source.name)
+                for rows in source.fetch():
+                    staging_importer.copy_rows(
+                        self.to_staging_rows(rows, [self.build_transaction_id(row) for row in rows])
+                    )
+                staging_importer.transform()
+            else:
+                for rows in source.fetch():
+                    source.write(rows)
+
+        logger.info(f"New transactions created: {Transaction.objects.count() - transactions_count}")
+        # Imported ETH deposits from mining pools are labeled after the import transaction, as it requests Ethplorer
+        label_mining_deposits()
@@ -62,7 +62,11 @@ class BalanceDelta:
 
 
 class MassCurrencyPriceHelper:
-    """Prefetch and cache currency prices for a given period."""
+    """
+    Prefetch and cache currency prices for a given period.
+
+    Prices are always read from the database, not from the price store, which only has float approximations of them.
+    """
 
     price_dict: dict[CurrencyID, dict[datetime.date, Decimal]]
 
@@ -89,6 +93,15 @@ class MassCurrencyPriceHelper:
                 return None
         return price
 
+    def get_latest_price(self, currency: Currency, date: datetime.date) -> Decimal | None:
+        """Return the latest known price of a currency on or before `date`."""
+        return (
+            CurrencyPrice.objects.filter(currency=currency, date__lte=date)
+            .order_by("-date")
+            .values_list("price", flat=True)
+            .first()
+        )
+
 
 ########################################################################################################################
 
@@ -295,16 +308,11 @@ class SnapshotWorthHelperMixin:
                 sum_cost_basis += balance.quantity * (balance.cost_basis or Decimal(0))
             else:
                 # If the price is missing, find the latest price before the snapshot date
-                latest_known_price = (
-                    CurrencyPrice.objects.filter(currency=balance.currency, date__lte=snapshot.date)
-                    .order_by("-date")
-                    .values_list("price", flat=True)
-                    .first()
-                )
+                latest_known_price = self.mass_price_helper.get_latest_price(balance.currency, snapshot.date)
                 if latest_known_price is None:
                     # If there is no known price, calculate the worth from the cost basis as the best assumption.
                     sum_worth += balance.total_value
-                    sum_cost_basis += (balance.cost_basis or Decimal(0))
+                    sum_cost_basis += balance.cost_basis or Decimal(0)
                 else:
                     # Assume the latest known price is still right and calculate the worth from it.
                     sum_worth += latest_known_price * balance.quantity
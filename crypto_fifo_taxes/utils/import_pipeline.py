@@ -0,0 +1,133 @@
+import logging
+import queue
+import threading
+from collections.abc import Callable, Iterable
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import nullcontext
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+from typing import Any
+
+from django.db import connections, transaction
+
+logger = logging.getLogger(__name__)
+
+__all__ = [
+    "ImportSource",
+    "run_import_pipeline",
+]
+
+
+@dataclass
+class ImportSource:
+    """
+    A source of transactions, split to a fetch stage and a write stage.
+
+    `fetch` fetches and parses the records of the source, and yields them in batches. It is run in a worker thread,
+    so it must not use the database: its connection doesn't see the writes of a transaction open in the writer.
+    `write` saves a single batch to the database. It is always called from the thread running the pipeline.
+    `prepare` is called from the same thread when the writer reaches the source, after all previous sources have
+    been written. With `wait_for_previous`, fetching starts only after `prepare`, so the fetch can be planned
+    in `prepare` from what the previous sources wrote.
+    `finish` is called from the same thread after all batches of the source have been written successfully.
+    With `atomic`, the batches and `finish` of the source are written in one database transaction,
+    so a failure leaves nothing of the source in the database.
+    """
+
+    name: str
+    fetch: Callable[[], Iterable[Any]]
+    write: Callable[[Any], None]
+    prepare: Callable[[], None] | None = None
+    finish: Callable[[], None] | None = None
+    wait_for_previous: bool = False
+    atomic: bool = False
+
+
+class _SourceFinished:
+    pass
+
+
+@dataclass
+class _SourceFailed:
+    exception: BaseException
+
+
+def run_import_pipeline(sources: list[ImportSource], queue_size: int = 8) -> None:
+    """
+    Fetch all sources concurrently, and write their batches with a single writer.
+
+    Batches are written strictly in the order of the sources, and in the order each source yields them,
+    so the created transactions, their staggered timestamps and the skipped duplicates are the same as if the sources
+    were imported one after another. Up to `queue_size` batches of each source are fetched ahead of the writer.
+    An exception raised while fetching a source is re-raised by the writer, once it reaches that source.
+    """
+    if not sources:
+        return
+
+    cancelled = threading.Event()
+    queues: list[queue.Queue] = [queue.Queue(maxsize=queue_size) for _ in sources]
+    # Set when the writer reaches the source
+    writing = [threading.Event() for _ in sources]
+
+    def put(source_queue: queue.Queue, item: Any) -> bool:
+        """Put an item to the queue, unless the pipeline is cancelled while waiting for the writer."""
+        while not cancelled.is_set():
+            try:
+                source_queue.put(item, timeout=0.1)
+            except queue.Full:
+                continue
+            else:
+                return True
+        return False
+
+    def fetch(source: ImportSource, source_queue: queue.Queue, source_writing: threading.Event) -> None:
+        try:
+            if source.wait_for_previous:
+                while not source_writing.wait(timeout=0.1):
+                    if cancelled.is_set():
+                        return
+            for batch in source.fetch():
+                if not put(source_queue, batch):
+                    return
+            put(source_queue, _SourceFinished())
+        except BaseException as e:
+            put(source_queue, _SourceFailed(e))
+        finally:
+            # Database connections are per thread, don't leave any open
+            connections.close_all()
+
+    with ThreadPoolExecutor(max_workers=len(sources), thread_name_prefix="import") as executor:
+        for source, source_queue, source_writing in zip(sources, queues, writing, strict=True):
+            executor.submit(fetch, source, source_queue, source_writing)
+
+        try:
+            for source, source_queue, source_writing in zip(sources, queues, writing, strict=True):
+                if source.prepare is not None:
+                    source.prepare()
+                source_writing.set()
+                start_time = datetime.now()
+                waited = timedelta()
+                batches = 0
+                with transaction.atomic() if source.atomic else nullcontext():
+                    while True:
+                        wait_start_time = datetime.now()
+                        item = source_queue.get()
+                        waited += datetime.now() - wait_start_time
+
+                        if isinstance(item, _SourceFinished):
+                            break
+                        if isinstance(item, _SourceFailed):
+                            raise item.exception
+                        source.write(item)
+                        batches += 1
+
+                    if source.finish is not None:
+                        source.finish()
+
+                logger.info(
+                    f"`{source.name}` imported {batches} batches. "
+                    f"Time elapsed: {datetime.now() - start_time}, of which waiting for the fetch: {waited}."
+                )
+        finally:
+            # Stop the remaining fetches, if the writer failed
+            cancelled.set()
@@ -0,0 +1,182 @@
+import sys
+from collections.abc import Callable
+from dataclasses import dataclass
+from datetime import UTC, datetime
+from decimal import Decimal
+from functools import lru_cache
+
+from crypto_fifo_taxes.enums import TransactionLabel, TransactionType
+from crypto_fifo_taxes.utils.binance.binance_api import from_timestamp
+from crypto_fifo_taxes.utils.staging_importer import StagingRow
+
+__all__ = [
+    "UNIX_MILLISECONDS",
+    "ImportSpec",
+    "get_timestamp_parser",
+    "parse_decimals",
+    "parse_symbols",
+    "parse_timestamps",
+]
+
+UNIX_MILLISECONDS = "unix_ms"
+
+# Formats `datetime.fromisoformat` parses much faster than `strptime`
+_ISO_FORMATS = {
+    "%Y-%m-%d %H:%M:%S",
+    "%Y-%m-%dT%H:%M:%S",
+    "%Y-%m-%dT%H:%M:%SZ",
+    "%Y-%m-%dT%H:%M:%S.%fZ",
+}
+
+
+@lru_cache
+def get_timestamp_parser(timestamp_format: str) -> Callable[[str | int], datetime]:
+    """
+    Return a function that parses a timestamp in the given format to an UTC datetime.
+    Timestamps without a timezone are in UTC. A literal suffix after the last directive, e.g. ` GMT`, is ignored.
+    """
+    if timestamp_format == UNIX_MILLISECONDS:
+        return lambda value: from_timestamp(int(value))
+
+    suffix = timestamp_format[timestamp_format.rindex("%") + 2 :] if "%" in timestamp_format else ""
+    if suffix and timestamp_format not in _ISO_FORMATS:
+        base_parser = get_timestamp_parser(timestamp_format.removesuffix(suffix))
+        return lambda value: base_parser(value.removesuffix(suffix))
+
+    if timestamp_format in _ISO_FORMATS:
+        return lambda value: datetime.fromisoformat(value).replace(tzinfo=UTC)
+    return lambda value: datetime.strptime(value, timestamp_format).replace(tzinfo=UTC)
+
+
+def parse_timestamps(values: list[str | int], timestamp_format: str) -> list[datetime]:
+    """Parse a column of timestamps. Repeated values, e.g. dates of daily rows, are only parsed once."""
+    parse = get_timestamp_parser(timestamp_format)
+    parsed: dict[str | int, datetime] = {}
+    return [parsed[value] if value in parsed else parsed.setdefault(value, parse(value)) for value in values]
+
+
+def parse_decimals(values: list[str | int | float], absolute: bool = False) -> list[Decimal]:
+    """Parse a column of quantities. Floats are converted through `str`, to not get their binary representation."""
+    decimals = [Decimal(value) if isinstance(value, str) else Decimal(str(value)) for value in values]
+    if absolute:
+        return [abs(value) for value in decimals]
+    return decimals
+
+
+def parse_symbols(values: list[str]) -> list[str]:
+    """Parse a column of symbols. The symbols are interned, so repeated symbols are a single string object."""
+    interned: dict[str, str] = {}
+    return [
+        interned[value] if value in interned else interned.setdefault(value, sys.intern(value.upper()))
+        for value in values
+    ]
+
+
+@dataclass(frozen=True)
+class ImportSpec:
+    """
+    Declarative description of how the rows of an exported file are turned to transactions.
+
+    Whole columns of a chunk are parsed at once with `parse`, and emitted as `StagingRow`s,
+    which can be imported with `TransactionBatch.add_staging_rows` or `StagingImporter`.
+
+    Deposits and withdrawals move `quantity_column` of `symbol_column` (or the fixed `symbol`).
+    Trades are read from a pair column, e.g. `ETH-EUR`: `quantity_column` is the quantity of the base currency,
+    the quote quantity is `quantity_column * price_column`, and rows with `buy_side` in `side_column` are buys.
+    With `absolute_quantities`, negative quantities (e.g. fees in some reports) are made positive.
+    """
+
+    wallet: str
+    description: str
+    transaction_type: TransactionType
+    timestamp_column: str
+    timestamp_format: str
+    quantity_column: str
+    label: TransactionLabel = TransactionLabel.UNKNOWN
+    symbol_column: str | None = None
+    symbol: str | None = None
+    absolute_quantities: bool = False
+    # Trades
+    pair_column: str | None = None
+    pair_separator: str = "-"
+    side_column: str | None = None
+    buy_side: str = "BUY"
+    price_column: str | None = None
+    # Fees, only rows with a positive fee have a fee detail
+    fee_column: str | None = None
+    fee_symbol_column: str | None = None
+    fee_symbol: str | None = None
+
+    def __post_init__(self):
+        if self.transaction_type == TransactionType.TRADE:
+            assert self.pair_column, "Trades require a pair column."
+            assert self.side_column, "Trades require a side column."
+            assert self.price_column, "Trades require a price column."
+        else:
+            assert (self.symbol_column is None) != (self.symbol is None), "Either a symbol column or symbol required."
+        if self.fee_column is not None:
+            assert (self.fee_symbol_column is None) != (self.fee_symbol is None), "Fee requires a symbol."
+
+    def _get_symbols(self, rows: list[dict], column: str | None, symbol: str | None) -> list[str]:
+        if column is None:
+            return [sys.intern(symbol.upper())] * len(rows)
+        return parse_symbols([row[column] for row in rows])
+
+    def _get_details(self, rows: list[dict]) -> list[dict]:
+        """Return the detail fields of each row, e.g. `to_symbol` and `to_quantity`."""
+        quantities = parse_decimals([row[self.quantity_column] for row in rows], self.absolute_quantities)
+
+        if self.transaction_type != TransactionType.TRADE:
+            prefix = "from" if self.transaction_type == TransactionType.WITHDRAW else "to"
+            symbols = self._get_symbols(rows, self.symbol_column, self.symbol)
+            return [
+                {f"{prefix}_wallet": self.wallet, f"{prefix}_symbol": symbol, f"{prefix}_quantity": quantity}
+                for symbol, quantity in zip(symbols, quantities, strict=True)
+            ]
+
+        pairs = parse_symbols([row[self.pair_column] for row in rows])
+        prices = parse_decimals([row[self.price_column] for row in rows])
+        details = []
+        for pair, quantity, price, row in zip(pairs, quantities, prices, rows, strict=True):
+            base, quote = pair.split(self.pair_separator)
+            sides = ((quote, quantity * price), (base, quantity))
+            if row[self.side_column] != self.buy_side:
+                sides = sides[::-1]
+            (from_symbol, from_quantity), (to_symbol, to_quantity) = sides
+            details.append(
+                {
+                    "from_wallet": self.wallet,
+                    "from_symbol": from_symbol,
+                    "from_quantity": from_quantity,
+                    "to_wallet": self.wallet,
+                    "to_symbol": to_symbol,
+                    "to_quantity": to_quantity,
+                }
+            )
+        return details
+
+    def _add_fees(self, rows: list[dict], details: list[dict]) -> None:
+        if self.fee_column is None:
+            return
+        fees = parse_decimals([row[self.fee_column] for row in rows], self.absolute_quantities)
+        fee_symbols = self._get_symbols(rows, self.fee_symbol_column, self.fee_symbol)
+        for row_details, fee, fee_symbol in zip(details, fees, fee_symbols, strict=True):
+            if fee > 0:
+                row_details.update(fee_wallet=self.wallet, fee_symbol=fee_symbol, fee_quantity=fee)
+
+    def parse(self, rows: list[dict], tx_ids: list[str]) -> list[StagingRow]:
+        """Parse a chunk of rows column by column."""
+        timestamps = parse_timestamps([row[self.timestamp_column] for row in rows], self.timestamp_format)
+        details = self._get_details(rows)
+        self._add_fees(rows, details)
+        return [
+            StagingRow(
+                timestamp=timestamp,
+                tx_id=tx_id,
+                description=self.description,
+                transaction_type=self.transaction_type,
+                transaction_label=self.label,
+                **row_details,
+            )
+            for timestamp, tx_id, row_details in zip(timestamps, tx_ids, details, strict=True)
+        ]
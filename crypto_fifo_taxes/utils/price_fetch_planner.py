@@ -0,0 +1,189 @@
+import datetime
+from collections.abc import Iterable
+from dataclasses import dataclass, field
+
+from django.conf import settings
+from django.db import connection
+
+from crypto_fifo_taxes.models import Currency, CurrencyPrice, Transaction, TransactionDetail
+from crypto_fifo_taxes.utils.date_utils import utc_date
+
+__all__ = [
+    "MissingPriceRange",
+    "PriceCoverage",
+    "PriceFetchRequest",
+    "get_price_coverage",
+    "group_missing_dates",
+    "plan_price_fetch_requests",
+]
+
+
+@dataclass(frozen=True)
+class MissingPriceRange:
+    """Consecutive dates (inclusive) without a saved price."""
+
+    start_date: datetime.date
+    end_date: datetime.date
+
+    @property
+    def days(self) -> int:
+        return (self.end_date - self.start_date).days + 1
+
+
+@dataclass
+class PriceCoverage:
+    """Transaction dates of a currency and the dates that are missing prices between the first one and today."""
+
+    currency_id: int
+    first_transaction_date: datetime.date
+    last_transaction_date: datetime.date
+    missing_ranges: list[MissingPriceRange] = field(default_factory=list)
+
+    @property
+    def missing_days(self) -> int:
+        return sum(missing_range.days for missing_range in self.missing_ranges)
+
+
+@dataclass(frozen=True)
+class PriceFetchRequest:
+    """A single market chart request to the price API."""
+
+    currency_id: int
+    start_date: datetime.date
+    end_date: datetime.date
+
+    @property
+    def days(self) -> int:
+        return (self.end_date - self.start_date).days + 1
+
+
+def group_missing_dates(dates: Iterable[datetime.date]) -> list[MissingPriceRange]:
+    """Group dates to ranges of consecutive dates."""
+    ranges: list[MissingPriceRange] = []
+    for date in sorted(set(dates)):
+        if ranges and (date - ranges[-1].end_date).days == 1:
+            ranges[-1] = MissingPriceRange(ranges[-1].start_date, date)
+        else:
+            ranges.append(MissingPriceRange(date, date))
+    return ranges
+
+
+_PRICE_COVERAGE_SQL = """
+WITH tx_details AS (
+    SELECT from_detail_id AS detail_id, "timestamp" FROM {transaction} WHERE from_detail_id IS NOT NULL
+    UNION ALL
+    SELECT to_detail_id, "timestamp" FROM {transaction} WHERE to_detail_id IS NOT NULL
+    UNION ALL
+    SELECT fee_detail_id, "timestamp" FROM {transaction} WHERE fee_detail_id IS NOT NULL
+),
+currency_ranges AS (
+    SELECT
+        detail.currency_id,
+        MIN(tx_details."timestamp" AT TIME ZONE 'UTC')::date AS first_date,
+        MAX(tx_details."timestamp" AT TIME ZONE 'UTC')::date AS last_date
+    FROM tx_details
+    JOIN {transaction_detail} detail ON detail.id = tx_details.detail_id
+    JOIN {currency} currency ON currency.id = detail.currency_id
+    WHERE NOT currency.is_fiat
+        AND NOT (currency.symbol = ANY(%(skipped_symbols)s::varchar[]))
+        AND (%(all_currencies)s OR currency.id = ANY(%(currency_ids)s::bigint[]))
+    GROUP BY detail.currency_id
+),
+missing_dates AS (
+    SELECT currency_ranges.currency_id, day::date AS date
+    FROM currency_ranges
+    CROSS JOIN LATERAL generate_series(currency_ranges.first_date, %(end_date)s::date, interval '1 day') AS day
+    WHERE NOT EXISTS (
+        SELECT 1 FROM {currency_price} price
+        WHERE price.currency_id = currency_ranges.currency_id AND price.date = day::date
+    )
+    -- Dates the API has previously been known not to return a price for
+    AND NOT EXISTS (
+        SELECT 1 FROM {currency_price} price
+        WHERE price.currency_id = currency_ranges.currency_id
+            AND price.num_missing_days > 0
+            AND day::date > price.date
+            AND day::date <= price.date + price.num_missing_days
+    )
+),
+islands AS (
+    -- Consecutive dates share the same `island` value
+    SELECT currency_id, date, date - (ROW_NUMBER() OVER (PARTITION BY currency_id ORDER BY date))::int AS island
+    FROM missing_dates
+)
+SELECT
+    currency_ranges.currency_id,
+    currency_ranges.first_date,
+    currency_ranges.last_date,
+    MIN(islands.date) AS missing_start,
+    MAX(islands.date) AS missing_end
+FROM currency_ranges
+LEFT JOIN islands ON islands.currency_id = currency_ranges.currency_id
+GROUP BY currency_ranges.currency_id, currency_ranges.first_date, currency_ranges.last_date, islands.island
+ORDER BY currency_ranges.currency_id, missing_start
+"""
+
+
+def get_price_coverage(
+    currency_ids: Iterable[int] | None = None,
+    end_date: datetime.date | None = None,
+) -> dict[int, PriceCoverage]:
+    """
+    Return the transaction date range and the missing price dates of every priced currency, with a single query.
+
+    Prices are required for every date from the first transaction of a currency until `end_date` (today by default).
+    Fiat, deprecated and ignored currencies are not included, as their prices are not fetched.
+    """
+    sql = _PRICE_COVERAGE_SQL.format(
+        transaction=Transaction._meta.db_table,
+        transaction_detail=TransactionDetail._meta.db_table,
+        currency=Currency._meta.db_table,
+        currency_price=CurrencyPrice._meta.db_table,
+    )
+    params = {
+        "skipped_symbols": [*settings.COINGECKO_DEPRECATED_TOKENS, *settings.IGNORED_TOKENS],
+        "all_currencies": currency_ids is None,
+        "currency_ids": list(currency_ids) if currency_ids is not None else [],
+        "end_date": end_date or utc_date(),
+    }
+
+    coverages: dict[int, PriceCoverage] = {}
+    with connection.cursor() as cursor:
+        cursor.execute(sql, params)
+        for currency_id, first_date, last_date, missing_start, missing_end in cursor.fetchall():
+            if currency_id not in coverages:
+                coverages[currency_id] = PriceCoverage(
+                    currency_id=currency_id,
+                    first_transaction_date=first_date,
+                    last_transaction_date=last_date,
+                )
+            if missing_start is not None:
+                coverages[currency_id].missing_ranges.append(MissingPriceRange(missing_start, missing_end))
+    return coverages
+
+
+def plan_price_fetch_requests(coverage: PriceCoverage, max_days: int | None = None) -> list[PriceFetchRequest]:
+    """
+    Cover all missing dates of a currency with as few requests as possible, each at most `max_days` long.
+
+    Each request starts from the first date not yet covered and reaches as far as `max_days` allows,
+    but ends at the last missing date it covers. Short runs of already saved prices between missing ranges
+    are fetched again when it saves a request.
+    """
+    max_days = max_days or settings.COINGECKO_MAX_DAYS_PER_REQUEST
+
+    requests: list[PriceFetchRequest] = []
+    for missing_range in coverage.missing_ranges:
+        start_date = missing_range.start_date
+
+        # Extend the previous request if this range starts within its reach
+        if requests and (start_date - requests[-1].start_date).days < max_days:
+            previous = requests.pop()
+            start_date = previous.start_date
+
+        while start_date <= missing_range.end_date:
+            end_date = min(start_date + datetime.timedelta(days=max_days - 1), missing_range.end_date)
+            requests.append(PriceFetchRequest(coverage.currency_id, start_date, end_date))
+            start_date = end_date + datetime.timedelta(days=1)
+
+    return requests
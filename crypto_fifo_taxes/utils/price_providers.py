@@ -0,0 +1,221 @@
+import datetime
+import hashlib
+import json
+import logging
+import os
+import random
+import threading
+import time
+from collections import deque
+from dataclasses import dataclass, field
+from functools import lru_cache
+from urllib.parse import urlencode
+
+import requests
+from django.conf import settings
+
+from crypto_fifo_taxes.exceptions import CoinGeckoAPIException
+
+logger = logging.getLogger(__name__)
+
+__all__ = [
+    "CoinGeckoPriceProvider",
+    "PriceProvider",
+    "PriceProviderResponse",
+    "RecordingPriceProvider",
+    "ReplayPriceProvider",
+    "get_price_provider",
+]
+
+
+@dataclass
+class PriceProviderResponse:
+    status_code: int
+    body: dict | list | None
+    headers: dict[str, str] = field(default_factory=dict)
+
+
+class PriceProvider:
+    """
+    Source of historical prices.
+
+    Responses are expected in the CoinGecko API format, as that is what the rest of the app consumes.
+    Subclasses only need to implement `send`, which performs a single request without any retries.
+    """
+
+    base_url = "https://api.coingecko.com/api/v3"
+
+    def send(self, path: str, params: dict) -> PriceProviderResponse:
+        raise NotImplementedError
+
+    def build_url(self, path: str, params: dict) -> str:
+        return f"{self.base_url}/{path}?{urlencode(params)}"
+
+    def request(self, path: str, params: dict) -> dict | list | None:
+        """Send the request, and retry it as long as the rate limit is exceeded."""
+        while True:
+            logger.debug(f"Fetching {self.build_url(path, params)}")
+
+            response = self.send(path, params)
+
+            if response.status_code == 200:
+                return response.body
+            elif response.status_code == 429:
+                # CoinGecko has a rate limit of 50 calls/minute, but In reality it seems to be more than that
+                # If requests are throttled, wait and retry later
+                # For some reason the `"Retry-After"` is not always returned with a HTTP 429 response
+                sleep_time = int(response.headers["Retry-After"]) if "Retry-After" in response.headers else 5
+                logger.warning(f"Too Many Requests sent to CoinGecko API. Waiting {sleep_time}s until trying again")
+                time.sleep(sleep_time)
+                continue
+            elif response.status_code >= 400:
+                raise CoinGeckoAPIException(
+                    f"Bad request to CoinGecko API url '{self.build_url(path, params)}': {response.body}"
+                )
+            # Do not loop forever if response status is unexpected
+            return None
+
+    def get_currency_list(self) -> list[dict]:
+        """Data format: [{'id': 'bitcoin', 'symbol': 'btc', 'name': 'Bitcoin'}, ...]"""
+        return self.request("coins/list", {"include_platform": "false"})
+
+    def get_price_history(self, cg_id: str, date: datetime.date) -> dict | None:
+        return self.request(f"coins/{cg_id}/history", {"date": date.strftime("%d-%m-%Y"), "localization": "false"})
+
+    def get_market_chart_range(
+        self, cg_id: str, vs_currency: str, from_timestamp: int, to_timestamp: int
+    ) -> dict | None:
+        """Timestamps are UNIX timestamps in seconds."""
+        return self.request(
+            f"coins/{cg_id}/market_chart/range",
+            {"vs_currency": vs_currency, "from": from_timestamp, "to": to_timestamp},
+        )
+
+
+class CoinGeckoPriceProvider(PriceProvider):
+    """Fetch prices from the public CoinGecko API."""
+
+    def send(self, path: str, params: dict) -> PriceProviderResponse:
+        response = requests.get(f"{self.base_url}/{path}", params=params, timeout=10)
+        try:
+            body = response.json()
+        except ValueError:
+            body = None
+        return PriceProviderResponse(status_code=response.status_code, body=body, headers=dict(response.headers))
+
+
+def _get_recording_path(recordings_dir: str, path: str, params: dict) -> str:
+    """Recordings are stored by the hash of the request, so that they can be looked up without an index."""
+    request_key = f"{path}?{urlencode(sorted(params.items()))}"
+    return os.path.join(recordings_dir, f"{hashlib.sha1(request_key.encode()).hexdigest()}.json")  # noqa: S324
+
+
+class RecordingPriceProvider(CoinGeckoPriceProvider):
+    """
+    Fetch prices from the CoinGecko API and save every final response to `recordings_dir`,
+    so that they can be served later by `ReplayPriceProvider`.
+    """
+
+    def __init__(self, recordings_dir: str) -> None:
+        self.recordings_dir = recordings_dir
+        os.makedirs(recordings_dir, exist_ok=True)
+
+    def send(self, path: str, params: dict) -> PriceProviderResponse:
+        response = super().send(path, params)
+
+        # Rate limited responses are not recorded, those are simulated by the replay provider instead
+        if response.status_code != 429:
+            recording = {"path": path, "params": params, "status_code": response.status_code, "body": response.body}
+            with open(_get_recording_path(self.recordings_dir, path, params), "w") as recording_file:
+                json.dump(recording, recording_file)
+
+        return response
+
+
+class ReplayPriceProvider(PriceProvider):
+    """
+    Serve responses recorded by `RecordingPriceProvider` from disk.
+
+    Allows simulating the timing of the real API to benchmark and load-test the price fetching offline:
+    - `latency`: Seconds each response takes, with up to `latency_jitter` seconds randomly added.
+    - `calls_per_minute`: Respond with HTTP 429 (and a `Retry-After` header) when more requests than this
+      have been made within the last minute, like the real API does when it is rate limited.
+    - `rate_limit_every`: Respond with HTTP 429 to every nth request, regardless of the request rate.
+
+    Requests that have not been recorded are responded to with HTTP 404.
+    """
+
+    def __init__(
+        self,
+        recordings_dir: str,
+        latency: float = 0.0,
+        latency_jitter: float = 0.0,
+        calls_per_minute: int | None = None,
+        rate_limit_every: int | None = None,
+        retry_after: int = 5,
+    ) -> None:
+        self.recordings_dir = recordings_dir
+        self.latency = latency
+        self.latency_jitter = latency_jitter
+        self.calls_per_minute = calls_per_minute
+        self.rate_limit_every = rate_limit_every
+        self.retry_after = retry_after
+
+        self.request_count = 0
+        self.rate_limited_count = 0
+        self._call_times: deque[float] = deque()
+        self._lock = threading.Lock()
+
+    def _get_rate_limit_retry_after(self) -> int | None:
+        """Return the `Retry-After` seconds, if this request should be rate limited."""
+        with self._lock:
+            self.request_count += 1
+            if self.rate_limit_every and self.request_count % self.rate_limit_every == 0:
+                self.rate_limited_count += 1
+                return self.retry_after
+
+            if self.calls_per_minute is None:
+                return None
+
+            now = time.monotonic()
+            while self._call_times and now - self._call_times[0] >= 60:
+                self._call_times.popleft()
+            if len(self._call_times) >= self.calls_per_minute:
+                self.rate_limited_count += 1
+                return max(1, int(60 - (now - self._call_times[0])) + 1)
+            self._call_times.append(now)
+            return None
+
+    def send(self, path: str, params: dict) -> PriceProviderResponse:
+        if self.latency or self.latency_jitter:
+            time.sleep(self.latency + random.uniform(0, self.latency_jitter))
+
+        retry_after = self._get_rate_limit_retry_after()
+        if retry_after is not None:
+            return PriceProviderResponse(status_code=429, body=None, headers={"Retry-After": str(retry_after)})
+
+        recording_path = _get_recording_path(self.recordings_dir, path, params)
+        if not os.path.exists(recording_path):
+            logger.warning(f"No recorded response for {self.build_url(path, params)}")
+            return PriceProviderResponse(status_code=404, body={"error": "Response not recorded"})
+
+        with open(recording_path) as recording_file:
+            recording = json.load(recording_file)
+        return PriceProviderResponse(status_code=recording["status_code"], body=recording["body"])
+
+
+@lru_cache
+def get_price_provider() -> PriceProvider:
+    """Return the price provider selected with the `PRICE_PROVIDER` setting."""
+    match settings.PRICE_PROVIDER:
+        case "coingecko":
+            return CoinGeckoPriceProvider()
+        case "record":
+            return RecordingPriceProvider(settings.PRICE_PROVIDER_RECORDINGS_DIR)
+        case "replay":
+            return ReplayPriceProvider(
+                settings.PRICE_PROVIDER_RECORDINGS_DIR,
+                latency=settings.PRICE_PROVIDER_REPLAY_LATENCY,
+                calls_per_minute=settings.PRICE_PROVIDER_REPLAY_CALLS_PER_MINUTE,
+            )
+    raise ValueError(f"Unknown price provider `{settings.PRICE_PROVIDER}`.")
@@ -0,0 +1,235 @@
+import array
+import datetime
+import json
+import logging
+import math
+import mmap
+import os
+from dataclasses import dataclass
+from functools import lru_cache
+
+from django.conf import settings
+
+from crypto_fifo_taxes.models import Currency, CurrencyPrice
+from crypto_fifo_taxes.utils.date_utils import utc_datetime
+
+logger = logging.getLogger(__name__)
+
+__all__ = [
+    "PriceStore",
+    "PriceStoreSeries",
+    "clear_price_store",
+    "export_price_store",
+    "get_price_store",
+]
+
+MANIFEST_FILENAME = "manifest.json"
+MANIFEST_VERSION = 2
+
+
+@dataclass(frozen=True)
+class PriceStoreSeries:
+    """Location of the prices of a single currency in the data file of the store."""
+
+    currency_id: int
+    symbol: str
+    offset: int  # Index of the first price in the data file
+    start_date: datetime.date
+    days: int
+
+    @property
+    def end_date(self) -> datetime.date:
+        return self.start_date + datetime.timedelta(days=self.days - 1)
+
+
+def _read_manifest(directory: str) -> dict | None:
+    try:
+        with open(os.path.join(directory, MANIFEST_FILENAME)) as manifest_file:
+            return json.load(manifest_file)
+    except FileNotFoundError:
+        return None
+
+
+def export_price_store(directory: str | None = None) -> int:
+    """
+    Export all saved prices to a columnar price store in `directory` (`PRICE_STORE_DIR` by default).
+
+    The prices of each currency are contiguous float64 values in a single data file, one for each day from its first
+    to its last saved price, with NaN for the dates without a price.
+    Every export writes a new data file, and the manifest naming it is written last, so a reader never sees
+    a partial export and a data file is never changed while it is mapped. The data file of the previous export
+    is kept for readers that have just read the previous manifest, older ones are deleted.
+    Returns the number of currencies exported.
+    """
+    directory = directory or settings.PRICE_STORE_DIR
+    os.makedirs(directory, exist_ok=True)
+    previous_manifest = _read_manifest(directory)
+
+    generated_at = utc_datetime()
+    filename = f"prices-{generated_at:%Y%m%d%H%M%S%f}.f64"
+    symbols = dict(Currency.objects.values_list("id", "symbol"))
+    series: dict[int, PriceStoreSeries] = {}
+    offset = 0
+
+    tmp_path = os.path.join(directory, f"{filename}.tmp")
+    with open(tmp_path, "wb") as data_file:
+
+        def write_series(currency_id: int, start_date: datetime.date, prices: array.array) -> None:
+            nonlocal offset
+            prices.tofile(data_file)
+            series[currency_id] = PriceStoreSeries(currency_id, symbols[currency_id], offset, start_date, len(prices))
+            offset += len(prices)
+
+        current_id: int | None = None
+        start_date: datetime.date | None = None
+        prices = array.array("d")
+        price_qs = CurrencyPrice.objects.order_by("currency_id", "date").values_list("currency_id", "date", "price")
+        for currency_id, date, price in price_qs.iterator(chunk_size=10000):
+            if currency_id != current_id:
+                if current_id is not None:
+                    write_series(current_id, start_date, prices)
+                current_id, start_date, prices = currency_id, date, array.array("d")
+
+            # Fill the dates without a price with NaN
+            prices.extend([math.nan] * ((date - start_date).days - len(prices)))
+            prices.append(float(price))
+        if current_id is not None:
+            write_series(current_id, start_date, prices)
+    os.replace(tmp_path, os.path.join(directory, filename))
+
+    manifest = {
+        "version": MANIFEST_VERSION,
+        "generated_at": generated_at.isoformat(),
+        "file": filename,
+        "currencies": {
+            str(currency_id): {
+                "symbol": currency_series.symbol,
+                "offset": currency_series.offset,
+                "start_date": currency_series.start_date.isoformat(),
+                "days": currency_series.days,
+            }
+            for currency_id, currency_series in series.items()
+        },
+    }
+    tmp_manifest_path = os.path.join(directory, f"{MANIFEST_FILENAME}.tmp")
+    with open(tmp_manifest_path, "w") as manifest_file:
+        json.dump(manifest, manifest_file)
+    os.replace(tmp_manifest_path, os.path.join(directory, MANIFEST_FILENAME))
+
+    # Mapped files stay readable after they are deleted
+    kept_files = {filename, (previous_manifest or {}).get("file")}
+    for stale_file in os.listdir(directory):
+        if stale_file.endswith(".f64") and stale_file not in kept_files:
+            os.remove(os.path.join(directory, stale_file))
+
+    logger.info(f"Exported prices of {len(series)} currencies to the price store `{directory}`.")
+    return len(series)
+
+
+class PriceStore:
+    """
+    Read-only, memory-mapped access to a price store exported with `export_price_store`.
+
+    The data file named in the manifest is mapped when the store is opened, so later exports don't affect it.
+    The mapping is shared with every other process reading the same store,
+    so lookups don't need database queries or `CurrencyPrice` instances.
+    Prices are stored as floats, accurate to 15 significant digits, so the store is only meant for charts.
+    Calculations use the exact prices in the database.
+    """
+
+    def __init__(self, directory: str) -> None:
+        self.directory = directory
+        manifest = _read_manifest(directory)
+        if manifest is None:
+            raise FileNotFoundError(f"Price store `{directory}` has no manifest.")
+        if manifest.get("version") != MANIFEST_VERSION:
+            raise ValueError(f"Unsupported price store version `{manifest.get('version')}` in `{directory}`.")
+
+        self.generated_at = datetime.datetime.fromisoformat(manifest["generated_at"])
+        self.series: dict[int, PriceStoreSeries] = {
+            int(currency_id): PriceStoreSeries(
+                currency_id=int(currency_id),
+                symbol=data["symbol"],
+                offset=data["offset"],
+                start_date=datetime.date.fromisoformat(data["start_date"]),
+                days=data["days"],
+            )
+            for currency_id, data in manifest["currencies"].items()
+        }
+        self._prices = memoryview(array.array("d"))
+        if self.series:
+            with open(os.path.join(directory, manifest["file"]), "rb") as data_file:
+                # The mapping stays valid after the file is closed
+                mapped = mmap.mmap(data_file.fileno(), 0, access=mmap.ACCESS_READ)
+            self._prices = memoryview(mapped).cast("d")
+
+    def _get_prices(self, currency_id: int) -> memoryview | None:
+        if currency_id not in self.series:
+            return None
+        currency_series = self.series[currency_id]
+        return self._prices[currency_series.offset : currency_series.offset + currency_series.days]
+
+    def get_series(
+        self, currency_id: int, start_date: datetime.date, end_date: datetime.date | None = None
+    ) -> memoryview | None:
+        """
+        Return the prices of a currency from `start_date` to `end_date` (inclusive, last saved date by default),
+        without copying them. Dates without a price are NaN. Returns None if the currency has no prices in the store.
+        """
+        prices = self._get_prices(currency_id)
+        if prices is None:
+            return None
+
+        currency_series = self.series[currency_id]
+        start = max((start_date - currency_series.start_date).days, 0)
+        end = currency_series.days if end_date is None else max((end_date - currency_series.start_date).days + 1, 0)
+        return prices[start:end]
+
+    def get_price(self, currency_id: int, date: datetime.date) -> float | None:
+        prices = self._get_prices(currency_id)
+        if prices is None:
+            return None
+
+        offset = (date - self.series[currency_id].start_date).days
+        if offset < 0 or offset >= len(prices) or math.isnan(prices[offset]):
+            return None
+        return prices[offset]
+
+    def get_latest_price(self, currency_id: int, date: datetime.date) -> float | None:
+        """Return the latest price of a currency on or before `date`."""
+        prices = self._get_prices(currency_id)
+        if prices is None:
+            return None
+
+        offset = min((date - self.series[currency_id].start_date).days, len(prices) - 1)
+        while offset >= 0:
+            if not math.isnan(prices[offset]):
+                return prices[offset]
+            offset -= 1
+        return None
+
+
+@lru_cache(maxsize=1)
+def _open_price_store(directory: str, manifest_id: tuple[int, int]) -> PriceStore:
+    return PriceStore(directory)
+
+
+def get_price_store() -> PriceStore | None:
+    """
+    Return the price store in `PRICE_STORE_DIR`, or None if it's not enabled or hasn't been exported yet.
+    The store is opened again when the manifest has been replaced by an export, also by another process.
+    """
+    if not settings.PRICE_STORE_DIR:
+        return None
+    try:
+        manifest_stat = os.stat(os.path.join(settings.PRICE_STORE_DIR, MANIFEST_FILENAME))
+    except FileNotFoundError:
+        logger.warning(f"Price store `{settings.PRICE_STORE_DIR}` has not been exported yet.")
+        return None
+    # Every export replaces the manifest with a new file
+    return _open_price_store(settings.PRICE_STORE_DIR, (manifest_stat.st_ino, manifest_stat.st_mtime_ns))
+
+
+def clear_price_store() -> None:
+    """Forget the opened price store, so that it is opened again from the current settings"""
+    _open_price_store.cache_clear()
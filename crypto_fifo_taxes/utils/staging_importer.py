@@ -0,0 +1,250 @@
+import csv
+import io
+import logging
+from collections.abc import Iterable
+from dataclasses import dataclass
+from datetime import datetime
+from decimal import Decimal
+
+from django.db import connection
+
+from crypto_fifo_taxes.enums import TransactionLabel, TransactionType
+from crypto_fifo_taxes.exceptions import TimestampConflictError
+from crypto_fifo_taxes.models import Snapshot, Transaction, TransactionDetail, Wallet
+from crypto_fifo_taxes.utils.currency import get_or_create_currency
+
+logger = logging.getLogger(__name__)
+
+__all__ = [
+    "StagingImporter",
+    "StagingRow",
+]
+
+# Unquoted `\N` is NULL in the copied CSV, so that quoted and unquoted empty strings are both empty strings
+_COPY_NULL = "\\N"
+_DETAIL_PREFIXES = ("from", "to", "fee")
+
+
+@dataclass
+class StagingRow:
+    """A source row normalized to a transaction, with wallets and currencies referenced by name and symbol."""
+
+    timestamp: datetime
+    tx_id: str
+    description: str
+    transaction_type: TransactionType
+    transaction_label: TransactionLabel = TransactionLabel.UNKNOWN
+    from_wallet: str | None = None
+    from_symbol: str | None = None
+    from_quantity: Decimal | None = None
+    to_wallet: str | None = None
+    to_symbol: str | None = None
+    to_quantity: Decimal | None = None
+    fee_wallet: str | None = None
+    fee_symbol: str | None = None
+    fee_quantity: Decimal | None = None
+
+
+def _copy_value(value) -> str:
+    if value is None:
+        return _COPY_NULL
+    if isinstance(value, datetime):
+        return value.isoformat()
+    if isinstance(value, TransactionType | TransactionLabel):
+        return str(value.value)
+    return str(value)
+
+
+class StagingImporter:
+    """
+    Import transactions with set-based SQL, instead of creating them row by row in Python.
+
+    Rows are COPYed to a temporary staging table of the source, and `transform` turns all of them to
+    `TransactionDetail` and `Transaction` rows with a few `INSERT ... SELECT` statements:
+    - Rows with an already imported tx_id are removed from the staging table.
+    - Timestamps are staggered by a millisecond with `row_number()`, in the order the rows were copied,
+      until they are unique among themselves and the existing transactions.
+    - Wallets are mapped by name, and currencies by symbol. Missing currencies are created with
+      `get_or_create_currency`, once per distinct symbol.
+
+    Must be used inside a database transaction, as the staging tables are dropped on commit.
+    Like with `TransactionBatch`, ETH mining deposits are labeled afterwards with `label_mining_deposits`.
+    """
+
+    max_stagger_rounds = 1000
+
+    def __init__(self, source: str) -> None:
+        if not source.isidentifier():
+            raise ValueError(f"Invalid staging source name `{source}`.")
+        self.table = connection.ops.quote_name(f"staging_{source}")
+        self.currency_table = connection.ops.quote_name(f"staging_{source}_currency")
+        self.rows_copied = 0
+        self._table_created = False
+
+    def _create_table(self) -> None:
+        assert connection.in_atomic_block, "Staging tables must be used inside a database transaction."
+        detail_columns = ", ".join(
+            f"{prefix}_wallet text, {prefix}_symbol text, {prefix}_quantity numeric, {prefix}_detail_id bigint"
+            for prefix in _DETAIL_PREFIXES
+        )
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f"CREATE TEMPORARY TABLE {self.table} ("
+                "position bigint NOT NULL, "
+                "timestamp timestamp with time zone NOT NULL, "
+                "tx_id varchar(256) NOT NULL, "
+                "description text NOT NULL, "
+                "transaction_type integer NOT NULL, "
+                "transaction_label integer NOT NULL, "
+                f"{detail_columns}"
+                ") ON COMMIT DROP"
+            )
+        self._table_created = True
+
+    def copy_rows(self, rows: Iterable[StagingRow]) -> int:
+        """COPY the rows to the staging table. Returns the number of rows copied."""
+        if not self._table_created:
+            self._create_table()
+
+        columns = ["position", "timestamp", "tx_id", "description", "transaction_type", "transaction_label"]
+        for prefix in _DETAIL_PREFIXES:
+            columns += [f"{prefix}_wallet", f"{prefix}_symbol", f"{prefix}_quantity"]
+
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        start_count = self.rows_copied
+        for row in rows:
+            self.rows_copied += 1
+            values = [self.rows_copied, row.timestamp, row.tx_id, row.description]
+            values += [row.transaction_type, row.transaction_label]
+            for prefix in _DETAIL_PREFIXES:
+                symbol = getattr(row, f"{prefix}_symbol")
+                values += [
+                    getattr(row, f"{prefix}_wallet"),
+                    symbol.upper() if symbol is not None else None,
+                    getattr(row, f"{prefix}_quantity"),
+                ]
+            writer.writerow([_copy_value(value) for value in values])
+
+        buffer.seek(0)
+        with connection.cursor() as cursor:
+            cursor.copy_expert(
+                f"COPY {self.table} ({', '.join(columns)}) FROM STDIN WITH (FORMAT csv, NULL '{_COPY_NULL}')", buffer
+            )
+        return self.rows_copied - start_count
+
+    def _select_detail_values(self, column: str) -> str:
+        """Select the values of a column of all details, e.g. `from_symbol`, `to_symbol` and `fee_symbol`."""
+        return " UNION ALL ".join(f"SELECT {prefix}_{column} AS value FROM {self.table}" for prefix in _DETAIL_PREFIXES)
+
+    def _check_wallets(self, cursor) -> None:
+        cursor.execute(
+            f"SELECT DISTINCT value FROM ({self._select_detail_values('wallet')}) AS wallet_names "
+            f"WHERE value IS NOT NULL AND value NOT IN (SELECT name FROM {Wallet._meta.db_table})"
+        )
+        if missing_names := sorted(name for (name,) in cursor.fetchall()):
+            raise Wallet.DoesNotExist(f"Wallets {missing_names} do not exist.")
+
+    def _map_currencies(self, cursor) -> None:
+        cursor.execute(
+            f"SELECT DISTINCT value FROM ({self._select_detail_values('symbol')}) AS symbols WHERE value IS NOT NULL"
+        )
+        currency_ids = [(symbol, get_or_create_currency(symbol).pk) for (symbol,) in cursor.fetchall()]
+
+        cursor.execute(
+            f"CREATE TEMPORARY TABLE {self.currency_table} (symbol text PRIMARY KEY, currency_id bigint NOT NULL) "
+            "ON COMMIT DROP"
+        )
+        cursor.executemany(f"INSERT INTO {self.currency_table} (symbol, currency_id) VALUES (%s, %s)", currency_ids)
+
+    def _remove_imported(self, cursor) -> None:
+        cursor.execute(
+            f"DELETE FROM {self.table} AS staging USING {Transaction._meta.db_table} AS tx "
+            "WHERE staging.tx_id <> '' AND tx.tx_id = staging.tx_id"
+        )
+        logger.info(f"Skipped {cursor.rowcount} already imported rows.")
+
+    def _stagger_timestamps(self, cursor) -> None:
+        """
+        Shift each timestamp taken by an earlier row, or by an existing transaction, by a millisecond per taken row.
+        Shifted timestamps can collide with later rows, so repeat until all timestamps are unique.
+        """
+        for _ in range(self.max_stagger_rounds):
+            cursor.execute(
+                f"UPDATE {self.table} AS staging "
+                "SET timestamp = staging.timestamp + interval '1 millisecond' * ranked.shift "
+                "FROM ("
+                "SELECT position, row_number() OVER (PARTITION BY timestamp ORDER BY position) - 1 "
+                f"+ (EXISTS (SELECT 1 FROM {Transaction._meta.db_table} AS tx WHERE tx.timestamp = staged.timestamp))"
+                "::integer AS shift "
+                f"FROM {self.table} AS staged"
+                ") AS ranked "
+                "WHERE staging.position = ranked.position AND ranked.shift > 0"
+            )
+            if cursor.rowcount == 0:
+                return
+        raise TimestampConflictError(f"Timestamps could not be staggered in {self.max_stagger_rounds} rounds.")
+
+    def _insert_details(self, cursor) -> int:
+        # Reserve the ids beforehand, so that they can be linked to the transactions without matching inserted rows
+        sequence = f"pg_get_serial_sequence('{TransactionDetail._meta.db_table}', 'id')"
+        cursor.execute(
+            f"UPDATE {self.table} SET "
+            + ", ".join(
+                f"{prefix}_detail_id = CASE WHEN {prefix}_symbol IS NOT NULL THEN nextval({sequence}) END"
+                for prefix in _DETAIL_PREFIXES
+            )
+        )
+
+        details = " UNION ALL ".join(
+            f"SELECT {prefix}_detail_id AS id, {prefix}_wallet AS wallet, {prefix}_symbol AS symbol, "
+            f"{prefix}_quantity AS quantity FROM {self.table} WHERE {prefix}_detail_id IS NOT NULL"
+            for prefix in _DETAIL_PREFIXES
+        )
+        cursor.execute(
+            f"INSERT INTO {TransactionDetail._meta.db_table} (id, wallet_id, currency_id, quantity, cost_basis) "
+            "SELECT detail.id, wallet.id, currency.currency_id, detail.quantity, NULL "
+            f"FROM ({details}) AS detail "
+            f"JOIN {Wallet._meta.db_table} AS wallet ON wallet.name = detail.wallet "
+            f"JOIN {self.currency_table} AS currency ON currency.symbol = detail.symbol"
+        )
+        return cursor.rowcount
+
+    def _insert_transactions(self, cursor) -> int:
+        cursor.execute(
+            f"INSERT INTO {Transaction._meta.db_table} ("
+            "timestamp, transaction_type, transaction_label, description, "
+            "from_detail_id, to_detail_id, fee_detail_id, gain, fee_amount, tx_id"
+            ") "
+            "SELECT timestamp, transaction_type, transaction_label, description, "
+            "from_detail_id, to_detail_id, fee_detail_id, NULL, NULL, tx_id "
+            f"FROM {self.table} ORDER BY position"
+        )
+        return cursor.rowcount
+
+    def transform(self) -> int:
+        """
+        Create the transactions of all copied rows, and drop the staging tables.
+        Returns the number of transactions created.
+        """
+        if not self._table_created:
+            return 0
+
+        with connection.cursor() as cursor:
+            self._check_wallets(cursor)
+            self._map_currencies(cursor)
+            self._remove_imported(cursor)
+            self._stagger_timestamps(cursor)
+            self._insert_details(cursor)
+            created = self._insert_transactions(cursor)
+
+            cursor.execute(f"SELECT min(timestamp) FROM {self.table}")
+            (first_timestamp,) = cursor.fetchone()
+            if first_timestamp is not None:
+                Snapshot.objects.filter(date__gte=first_timestamp.date()).delete()
+
+            cursor.execute(f"DROP TABLE {self.table}, {self.currency_table}")
+
+        self._table_created = False
+        self.rows_copied = 0
+        return created
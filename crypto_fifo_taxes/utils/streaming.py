@@ -0,0 +1,88 @@
+import io
+import json
+from collections.abc import Iterable, Iterator
+from itertools import islice
+from typing import Any
+
+__all__ = [
+    "chunked",
+    "iter_json_array",
+]
+
+_WHITESPACE = " \t\n\r"
+_SEPARATORS = ",]" + _WHITESPACE
+
+
+def chunked(iterable: Iterable[Any], size: int) -> Iterator[list[Any]]:
+    """Split an iterable to lists of `size` items, without reading more than one list ahead."""
+    iterator = iter(iterable)
+    while chunk := list(islice(iterator, size)):
+        yield chunk
+
+
+def iter_json_array(file: io.TextIOBase, read_size: int = 64 * 1024) -> Iterator[Any]:
+    """
+    Parse the items of a JSON array file one by one.
+
+    Only the item being parsed and the unparsed part of the current read are kept in memory,
+    so the memory usage is independent of the size of the file.
+    """
+    decoder = json.JSONDecoder()
+    buffer = ""
+    position = 0
+    started = False
+    eof = False
+
+    def read_more() -> bool:
+        nonlocal buffer, position, eof
+        data = file.read(read_size)
+        if not data:
+            eof = True
+            return False
+        buffer = buffer[position:] + data
+        position = 0
+        return True
+
+    def skip(characters: str) -> None:
+        nonlocal position
+        while True:
+            while position < len(buffer) and buffer[position] in characters:
+                position += 1
+            if position < len(buffer) or not read_more():
+                return
+
+    skip(_WHITESPACE)
+    if position >= len(buffer) or buffer[position] != "[":
+        raise ValueError("Expected a JSON array.")
+    position += 1
+
+    while True:
+        skip(_WHITESPACE)
+        if position >= len(buffer):
+            raise ValueError("Unexpected end of JSON array.")
+
+        if buffer[position] == "]":
+            return
+        if started:
+            if buffer[position] != ",":
+                raise ValueError(f"Expected `,` or `]` in JSON array, got `{buffer[position]}`.")
+            position += 1
+            skip(_WHITESPACE)
+
+        # Read until the whole item is in the buffer
+        while True:
+            try:
+                item, end = decoder.raw_decode(buffer, position)
+            except json.JSONDecodeError:
+                if eof or not read_more():
+                    raise
+                continue
+            # A number cut by the end of the buffer (e.g. `1.` of `1.5`) is decoded partially,
+            # so the item is only complete when it is followed by the next separator
+            if (end == len(buffer) or buffer[end] not in _SEPARATORS) and not eof and read_more():
+                continue
+            break
+
+        position = end
+        started = True
+        yield item
@@ -5,8 +5,10 @@ from decimal import Decimal
 from django.db.transaction import atomic
 
 from crypto_fifo_taxes.enums import TransactionLabel, TransactionType
+from crypto_fifo_taxes.exceptions import TimestampConflictError
 from crypto_fifo_taxes.models import Currency, Snapshot, Transaction, TransactionDetail, Wallet
-from crypto_fifo_taxes.utils.ethplorer import get_ethplorer_client
+from crypto_fifo_taxes.utils.currency import get_or_create_currency
+from crypto_fifo_taxes.utils.staging_importer import StagingRow
 
 logger = logging.getLogger(__name__)
 
@@ -155,14 +157,6 @@ class TransactionCreator:
             assert self.from_detail is not None
             assert self.to_detail is not None
 
-    def _set_mining_label(self) -> None:
-        """Set mining label for ETH deposits that originate from mining pools."""
-        if self.tx_id and self.transaction_type == TransactionType.DEPOSIT and self.to_detail.currency.symbol == "ETH":
-            client = get_ethplorer_client()
-            is_mining = client.is_tx_from_mining_pool(self.tx_id)
-            if is_mining:
-                self.transaction_label = TransactionLabel.MINING
-
     def _get_final_timestamp(self):
         # Ensure the timestamp is unique by adding milliseconds until it is
         while True:
@@ -176,7 +170,6 @@ class TransactionCreator:
         assert self.timestamp is not None
 
         self._validate_transaction_type()
-        self._set_mining_label()
 
         details = self._get_details()
         for _key, detail in details.items():
@@ -199,3 +192,199 @@ class TransactionCreator:
         Snapshot.objects.filter(date__gte=self.timestamp.date()).delete()
 
         return transaction
+
+
+class TimestampAllocator:
+    """
+    Allocate unique transaction timestamps in memory.
+
+    Timestamps already taken in the database are loaded once for the window being allocated, and taken timestamps
+    are staggered by a millisecond, like `TransactionCreator` does, without querying the database for each step.
+    If a timestamp outside the loaded window is allocated, only the missing part of the window is loaded.
+    Use `check_conflicts` right before saving to verify no other transactions took the timestamps in the meantime.
+    """
+
+    stagger = timedelta(milliseconds=1)
+
+    def __init__(self, start: datetime | None = None, end: datetime | None = None):
+        self.taken: set[datetime] = set()
+        self.allocated: list[datetime] = []
+        self.window_start: datetime | None = None
+        self.window_end: datetime | None = None
+        if start is not None:
+            # Load some extra, as the last timestamps might need to be staggered past the end of the window
+            self._load_window(start, (end or start) + self.stagger * 100)
+
+    def _load_taken_timestamps(self, start: datetime, end: datetime) -> None:
+        self.taken.update(Transaction.objects.filter(timestamp__range=(start, end)).values_list("timestamp", flat=True))
+
+    def _load_window(self, start: datetime, end: datetime) -> None:
+        if self.window_start is None:
+            self._load_taken_timestamps(start, end)
+            self.window_start, self.window_end = start, end
+            return
+
+        # Load only the parts that are not loaded yet
+        if start < self.window_start:
+            self._load_taken_timestamps(start, self.window_start - timedelta(microseconds=1))
+            self.window_start = start
+        if end > self.window_end:
+            self._load_taken_timestamps(self.window_end + timedelta(microseconds=1), end)
+            self.window_end = end
+
+    def allocate(self, timestamp: datetime) -> datetime:
+        """Return the first free timestamp starting from `timestamp`, and reserve it."""
+        while True:
+            if self.window_start is None or not self.window_start <= timestamp <= self.window_end:
+                # Load some extra here as well, to not query again for each staggered timestamp
+                self._load_window(timestamp, timestamp + self.stagger * 100)
+            if timestamp not in self.taken:
+                break
+            timestamp += self.stagger
+
+        self.taken.add(timestamp)
+        self.allocated.append(timestamp)
+        return timestamp
+
+    def check_conflicts(self) -> None:
+        """Verify with a single query that none of the allocated timestamps have been taken in the database."""
+        conflicts = list(Transaction.objects.filter(timestamp__in=self.allocated).values_list("timestamp", flat=True))
+        if conflicts:
+            raise TimestampConflictError(f"Allocated timestamps are already taken: {conflicts[:10]}")
+
+
+class TransactionBatch:
+    """
+    Create many transactions with a few bulk inserts, instead of saving each transaction separately.
+
+    Transactions are validated when they are added to the batch, and all of them are created in a single
+    database transaction with `create`. Snapshots are invalidated once for the whole batch.
+    `fill_cost_basis` is not supported, as it depends on the previous transactions being saved.
+
+    Example usage:
+    >>>batch = TransactionBatch()
+    >>>batch.add_deposit(TransactionCreator(timestamp=timezone.now()), wallet=wallet, currency=fiat, quantity=500)
+    >>>tx_creator = TransactionCreator(timestamp=timezone.now())
+    >>>tx_creator.add_from_detail(wallet=wallet, currency=fiat, quantity=Decimal(200))
+    >>>tx_creator.add_to_detail(wallet=wallet, currency=crypto, quantity=Decimal(20))
+    >>>batch.add_trade(tx_creator)
+    >>>batch.create()
+    """
+
+    def __init__(self, batch_size: int = 1000):
+        self.batch_size = batch_size
+        self.tx_creators: list[TransactionCreator] = []
+
+    def __len__(self) -> int:
+        return len(self.tx_creators)
+
+    def add(self, tx_creator: TransactionCreator) -> None:
+        assert tx_creator.timestamp is not None
+        assert not tx_creator.fill_cost_basis, "Filling cost basis is not supported in batches."
+
+        tx_creator._validate_transaction_type()
+        self.tx_creators.append(tx_creator)
+
+    def add_deposit(self, tx_creator: TransactionCreator, **kwargs) -> None:
+        tx_creator.transaction_type = TransactionType.DEPOSIT
+
+        # Accept to_details values in kwargs
+        if len(kwargs):
+            tx_creator.add_to_detail(**kwargs)
+        self.add(tx_creator)
+
+    def add_withdrawal(self, tx_creator: TransactionCreator, **kwargs) -> None:
+        tx_creator.transaction_type = TransactionType.WITHDRAW
+
+        # Accept from_details values in kwargs
+        if len(kwargs):
+            tx_creator.add_from_detail(**kwargs)
+        self.add(tx_creator)
+
+    def add_trade(self, tx_creator: TransactionCreator) -> None:
+        tx_creator.transaction_type = TransactionType.TRADE
+        self.add(tx_creator)
+
+    def add_transfer(self, tx_creator: TransactionCreator) -> None:
+        tx_creator.transaction_type = TransactionType.TRANSFER
+        self.add(tx_creator)
+
+    def add_swap(self, tx_creator: TransactionCreator) -> None:
+        tx_creator.transaction_type = TransactionType.SWAP
+        self.add(tx_creator)
+
+    def add_staging_rows(self, rows: list[StagingRow]) -> None:
+        """
+        Add normalized rows, e.g. parsed with an `ImportSpec`.
+        Wallets are fetched with a single query, and currencies are resolved once per symbol.
+        """
+        names = {getattr(row, f"{prefix}_wallet") for row in rows for prefix in ("from", "to", "fee")} - {None}
+        wallets = {wallet.name: wallet for wallet in Wallet.objects.filter(name__in=names)}
+        if missing_names := names - wallets.keys():
+            raise Wallet.DoesNotExist(f"Wallets {sorted(missing_names)} do not exist.")
+
+        currencies: dict[str, Currency] = {}
+        for row in rows:
+            tx_creator = TransactionCreator(
+                timestamp=row.timestamp,
+                description=row.description,
+                tx_id=row.tx_id,
+                type=row.transaction_type,
+                label=row.transaction_label,
+                fill_cost_basis=False,
+            )
+            for prefix in ("from", "to", "fee"):
+                symbol = getattr(row, f"{prefix}_symbol")
+                if symbol is None:
+                    continue
+                if symbol not in currencies:
+                    currencies[symbol] = get_or_create_currency(symbol)
+                tx_creator._add_detail(
+                    wallet=wallets[getattr(row, f"{prefix}_wallet")],
+                    currency=currencies[symbol],
+                    quantity=getattr(row, f"{prefix}_quantity"),
+                    prefix=prefix,
+                )
+            self.add(tx_creator)
+
+    def create(self) -> list[Transaction]:
+        """Create all transactions added to the batch, and empty the batch."""
+        # Batches of already imported rows are empty, and don't need a database transaction
+        if not self.tx_creators:
+            return []
+        return self._create()
+
+    @atomic()
+    def _create(self) -> list[Transaction]:
+        timestamps = [tx_creator.timestamp for tx_creator in self.tx_creators]
+        timestamp_allocator = TimestampAllocator(min(timestamps), max(timestamps))
+        for tx_creator in self.tx_creators:
+            tx_creator.timestamp = timestamp_allocator.allocate(tx_creator.timestamp)
+        timestamp_allocator.check_conflicts()
+
+        # PKs of the details are returned by the insert, and are required to link them to the transactions
+        all_details = [tx_creator._get_details() for tx_creator in self.tx_creators]
+        TransactionDetail.objects.bulk_create(
+            [detail for details in all_details for detail in details.values()],
+            batch_size=self.batch_size,
+        )
+
+        transactions = Transaction.objects.bulk_create(
+            [
+                Transaction(
+                    timestamp=tx_creator.timestamp,
+                    description=tx_creator.description,
+                    tx_id=tx_creator.tx_id,
+                    transaction_type=tx_creator.transaction_type,
+                    transaction_label=tx_creator.transaction_label,
+                    **details,
+                )
+                for tx_creator, details in zip(self.tx_creators, all_details, strict=True)
+            ],
+            batch_size=self.batch_size,
+        )
+
+        Snapshot.objects.filter(date__gte=min(timestamp_allocator.allocated).date()).delete()
+
+        self.tx_creators = []
+        return transactions
@@ -1,4 +1,5 @@
 import json
+import math
 from datetime import date, datetime
 from decimal import Decimal
 from typing import Any
@@ -12,6 +13,7 @@ from crypto_fifo_taxes.models import CurrencyPrice, Snapshot, Transaction
 from crypto_fifo_taxes.utils.currency import get_currency
 from crypto_fifo_taxes.utils.date_utils import utc_start_of_day
 from crypto_fifo_taxes.utils.db import CoalesceZero
+from crypto_fifo_taxes.utils.price_store import get_price_store
 
 
 def json_dumps(qs: QuerySet[Any]) -> str:
@@ -87,7 +89,21 @@ class GraphView(TemplateView):
         return cumulative_product(qs)
 
     # Currency prices
+    def get_stored_prices(self, symbol) -> list[float] | None:
+        """Read the prices from the price store if it's enabled, to avoid querying and serializing them."""
+        price_store = get_price_store()
+        if price_store is None:
+            return None
+
+        series = price_store.get_series(get_currency(symbol).pk, self.starting_date)
+        if series is None:
+            return None
+        return [price for price in series if not math.isnan(price)]
+
     def currency_price_returns(self, symbol) -> str:
+        if (prices := self.get_stored_prices(symbol)) is not None:
+            return json.dumps([(price - prices[0]) / prices[0] * 100 for price in prices] if prices else [])
+
         qs = self.base_currency_price_qs.filter(currency=get_currency(symbol))
         first_price = qs.first()
 
@@ -104,6 +120,9 @@ class GraphView(TemplateView):
         )
 
     def currency_price_values_list(self, symbol) -> str:
+        if (prices := self.get_stored_prices(symbol)) is not None:
+            return json.dumps(prices)
+
         qs = self.base_currency_price_qs.filter(currency=get_currency(symbol))
         return qs_values_list_to_float(qs, "price")
 
@@ -23,8 +23,48 @@ STATIC_ROOT = root(os.environ.get("STATIC_LOCATION", os.path.join(BASE_DIR, "sta
 
 BINANCE_API_KEY = os.environ.get("BINANCE_API_KEY", None)
 BINANCE_API_SECRET = os.environ.get("BINANCE_API_SECRET", None)
+# Binance allows 6000 request weight per minute per IP, leave some for other clients
+BINANCE_REQUEST_WEIGHT_PER_MINUTE = int(os.environ.get("BINANCE_REQUEST_WEIGHT_PER_MINUTE", 5000))
+# Trades of this many pairs are fetched concurrently
+BINANCE_MAX_WORKERS = int(os.environ.get("BINANCE_MAX_WORKERS", 8))
+# History endpoints are synced again from this many days before their watermark, to catch late records
+BINANCE_SYNC_OVERLAP_DAYS = int(os.environ.get("BINANCE_SYNC_OVERLAP_DAYS", 2))
+# Directory of the compressed archive of raw Binance API responses, which `sync_binance --replay` imports from.
+# Disabled if empty.
+BINANCE_ARCHIVE_DIR = os.environ.get("BINANCE_ARCHIVE_DIR", "")
+# Transport of Binance API requests. One of:
+# - "binance": Send requests to the Binance API
+# - "fake": Serve synthetic data from a local stand-in of the Binance API, without network access
+BINANCE_TRANSPORT = os.environ.get("BINANCE_TRANSPORT", "binance")
+# Volumes and options of the "fake" transport, see `FakeBinanceVolumes` and `FakeBinanceAdapter`
+BINANCE_FAKE_EXCHANGE: dict = {}
 
 ETHPLORER_API_KEY = os.environ.get("ETHPLORER_API_KEY", None)
+# Ethplorer requests are spread over this many threads, within the rate limit of the API key
+ETHPLORER_MAX_WORKERS = int(os.environ.get("ETHPLORER_MAX_WORKERS", 4))
+ETHPLORER_REQUESTS_PER_SECOND = float(os.environ.get("ETHPLORER_REQUESTS_PER_SECOND", 2))
+# Cached mining pool addresses are fetched again after this many days
+ETHPLORER_POOL_ADDRESSES_MAX_AGE_DAYS = int(os.environ.get("ETHPLORER_POOL_ADDRESSES_MAX_AGE_DAYS", 7))
+
+# Source of historical prices. One of:
+# - "coingecko": Fetch prices from the CoinGecko API
+# - "record": Fetch prices from the CoinGecko API and save the responses to `PRICE_PROVIDER_RECORDINGS_DIR`
+# - "replay": Serve previously recorded responses from `PRICE_PROVIDER_RECORDINGS_DIR` without network access
+PRICE_PROVIDER = os.environ.get("PRICE_PROVIDER", "coingecko")
+PRICE_PROVIDER_RECORDINGS_DIR = os.environ.get(
+    "PRICE_PROVIDER_RECORDINGS_DIR", os.path.join(BASE_DIR, "price_recordings")
+)
+# Simulated API timing for the "replay" price provider
+PRICE_PROVIDER_REPLAY_LATENCY = float(os.environ.get("PRICE_PROVIDER_REPLAY_LATENCY", 0))
+PRICE_PROVIDER_REPLAY_CALLS_PER_MINUTE = (
+    int(os.environ["PRICE_PROVIDER_REPLAY_CALLS_PER_MINUTE"])
+    if os.environ.get("PRICE_PROVIDER_REPLAY_CALLS_PER_MINUTE")
+    else None
+)
+
+# Directory of the memory-mapped price store, which is exported after fetching or importing prices.
+# Read-heavy valuations (snapshots, graphs) read prices from it instead of the database. Disabled if empty.
+PRICE_STORE_DIR = os.environ.get("PRICE_STORE_DIR", "")
 
 # Application definition
 
@@ -111,6 +151,16 @@ DEFAULT_AUTO_FIELD = "django.db.models.BigAutoField"
 DEFAULT_FIAT_SYMBOL = "EUR"
 DEFAULT_FIAT_CURRENCY = {"name": "Euro", "cg_id": "eur"}
 
+# Additional FIAT currencies to report prices in, seperated by comma. e.g. "USD, GBP"
+# Prices are only fetched in the default FIAT currency, and converted to these with daily exchange rates.
+REPORTING_FIAT_SYMBOLS = [
+    symbol.strip().upper() for symbol in os.environ.get("REPORTING_FIAT_SYMBOLS", "").split(",") if symbol.strip()
+]
+# Exchange rates are derived from the prices of this currency in both FIAT currencies
+FIAT_EXCHANGE_RATE_REFERENCE_SYMBOL = "BTC"
+
+# The public CoinGecko API returns at most 365 days of history per market chart request
+COINGECKO_MAX_DAYS_PER_REQUEST = 365
 
 # Due to CoinGecko allowing multiple ids for the same currency, we need to map the ids to the correct currency.
 # Not all currencies need to be mapped, but it helps to prevent errors when fetching prices.
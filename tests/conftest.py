@@ -5,7 +5,9 @@ from crypto_fifo_taxes.utils.currency import (
     get_fiat_currency,
     get_or_create_currency,
     get_or_create_currency_pair,
+    get_or_create_fiat_currency,
 )
+from crypto_fifo_taxes.utils.price_store import clear_price_store
 
 
 @pytest.fixture(autouse=True)
@@ -15,3 +17,5 @@ def _clear_cache_between_tests():
     get_currency.cache_clear()
     get_or_create_currency.cache_clear()
     get_or_create_currency_pair.cache_clear()
+    get_or_create_fiat_currency.cache_clear()
+    clear_price_store()
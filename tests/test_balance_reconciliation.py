@@ -0,0 +1,113 @@
+from datetime import UTC, datetime, timedelta
+from decimal import Decimal
+
+import pytest
+
+from crypto_fifo_taxes.models import WalletBalanceSnapshot
+from crypto_fifo_taxes.utils.balance_reconciliation import (
+    find_balance_divergences,
+    get_balance_histories,
+    save_wallet_balance_snapshot,
+)
+from tests.factories import CryptoCurrencyFactory, WalletFactory
+from tests.utils import WalletHelper
+
+
+def _end_of_day(day: int) -> datetime:
+    return datetime(2020, 1, day, 23, 59, tzinfo=UTC)
+
+
+@pytest.fixture()
+def wallet_helper():
+    for symbol in ("BTC", "ETH", "ADA"):
+        CryptoCurrencyFactory.create(symbol=symbol)
+    wallet = WalletFactory.create(name="Binance")
+    helper = WalletHelper(wallet, start_time=datetime(2020, 1, 1, 12, 0), increment=timedelta(days=1))
+
+    helper.deposit("BTC", 1)  # Jan 2nd
+    helper.trade("BTC", Decimal("0.5"), "ETH", 5, fee_currency="ETH", fee_currency_quantity=Decimal("0.1"))
+    helper.tx_time.next()  # Jan 4th, a deposit of 2 ETH is missing from the transactions
+    helper.withdraw("BTC", Decimal("0.2"))  # Jan 5th
+    return helper
+
+
+@pytest.mark.django_db()
+def test_get_balance_histories(wallet_helper):
+    histories = get_balance_histories(wallet_helper.wallet)
+
+    assert histories.keys() == {"BTC", "ETH"}
+    assert histories["BTC"].balances == [Decimal(1), Decimal("0.5"), Decimal("0.3")]
+    assert histories["BTC"].get_balance(_end_of_day(1)) == Decimal(0)
+    assert histories["BTC"].get_balance(_end_of_day(3)) == Decimal("0.5")
+    # Transactions exactly at the timestamp are included
+    assert histories["BTC"].get_balance(datetime(2020, 1, 2, 12, 0, tzinfo=UTC)) == Decimal(1)
+    assert histories["ETH"].get_balance(_end_of_day(5)) == Decimal("4.9")
+
+    current_balance = wallet_helper.wallet.get_current_balance()
+    assert {symbol: history.balances[-1] for symbol, history in histories.items()} == current_balance
+
+
+@pytest.mark.django_db()
+def test_find_balance_divergences(wallet_helper):
+    wallet = wallet_helper.wallet
+    assert find_balance_divergences(wallet) == []
+
+    exchange_balances = {
+        2: {"BTC": Decimal(1)},
+        3: {"BTC": Decimal("0.5"), "ETH": Decimal("4.9")},
+        4: {"BTC": Decimal("0.5"), "ETH": Decimal("6.9")},
+        5: {"BTC": Decimal("0.3"), "ETH": Decimal("6.9")},
+        6: {"BTC": Decimal("0.3"), "ETH": Decimal("6.9"), "ADA": Decimal("0.000001")},
+    }
+    for day, balances in exchange_balances.items():
+        save_wallet_balance_snapshot(wallet, balances, _end_of_day(day))
+
+    divergences = find_balance_divergences(wallet)
+    assert [divergence.symbol for divergence in divergences] == ["ADA", "ETH"]
+
+    ada, eth = divergences
+    assert eth.last_matching == _end_of_day(3)
+    assert eth.first_diverging == _end_of_day(4)
+    assert eth.snapshot_balance == Decimal("6.9")
+    assert eth.local_balance == Decimal("4.9")
+    assert eth.difference == Decimal(2)
+
+    # Currencies not in the transactions diverge from zero
+    assert ada.last_matching == _end_of_day(5)
+    assert ada.first_diverging == _end_of_day(6)
+    assert ada.difference == Decimal("0.000001")
+
+    # Differences within the tolerance are ignored
+    assert [divergence.symbol for divergence in find_balance_divergences(wallet, tolerance=Decimal("0.001"))] == ["ETH"]
+
+
+@pytest.mark.django_db()
+def test_find_balance_divergences_before_first_snapshot(wallet_helper):
+    wallet = wallet_helper.wallet
+    # The first snapshot already lacks the BTC deposited on Jan 2nd
+    save_wallet_balance_snapshot(wallet, {"ETH": Decimal("4.9")}, _end_of_day(3))
+
+    divergences = find_balance_divergences(wallet)
+    assert len(divergences) == 1
+    assert divergences[0].symbol == "BTC"
+    assert divergences[0].last_matching is None
+    assert divergences[0].first_diverging == _end_of_day(3)
+    assert divergences[0].difference == Decimal("-0.5")
+
+
+@pytest.mark.django_db()
+def test_save_wallet_balance_snapshot_zero_balances(wallet_helper):
+    wallet = wallet_helper.wallet
+    save_wallet_balance_snapshot(wallet, {"BTC": Decimal("0.3"), "ETH": Decimal(0)}, _end_of_day(5))
+    # Everything has been withdrawn, the snapshot is kept with zero balances of the previously held currencies
+    save_wallet_balance_snapshot(wallet, {"BTC": Decimal(0)}, _end_of_day(6))
+
+    assert dict(
+        WalletBalanceSnapshot.objects.filter(timestamp=_end_of_day(6)).values_list("currency__symbol", "quantity")
+    ) == {"BTC": Decimal(0)}
+
+    divergences = find_balance_divergences(wallet)
+    assert [(divergence.symbol, divergence.first_diverging) for divergence in divergences] == [
+        ("BTC", _end_of_day(6)),
+        ("ETH", _end_of_day(5)),
+    ]
@@ -0,0 +1,43 @@
+from decimal import Decimal
+
+import pytest
+from django.utils import timezone
+
+from crypto_fifo_taxes.utils.binance import candidate_pairs
+from crypto_fifo_taxes.utils.binance.candidate_pairs import get_candidate_pairs, get_held_assets
+from crypto_fifo_taxes.utils.transaction_creator import TransactionCreator
+from tests.factories import CryptoCurrencyFactory, WalletFactory
+
+ALL_PAIRS = [
+    {"symbol": "ETHBTC", "baseAsset": "ETH", "quoteAsset": "BTC"},
+    {"symbol": "BNBBTC", "baseAsset": "BNB", "quoteAsset": "BTC"},
+    {"symbol": "BNBETH", "baseAsset": "BNB", "quoteAsset": "ETH"},
+    {"symbol": "ADAUSDT", "baseAsset": "ADA", "quoteAsset": "USDT"},
+    {"symbol": "BTCUSDT", "baseAsset": "BTC", "quoteAsset": "USDT"},
+]
+
+
+@pytest.mark.django_db()
+def test_get_held_assets(monkeypatch):
+    wallet = WalletFactory.create(name="Binance")
+    other_wallet = WalletFactory.create(name="Other")
+    btc = CryptoCurrencyFactory.create(symbol="BTC")
+    eth = CryptoCurrencyFactory.create(symbol="ETH")
+    ada = CryptoCurrencyFactory.create(symbol="ADA")
+
+    TransactionCreator(timestamp=timezone.now()).create_deposit(wallet=wallet, currency=btc, quantity=1)
+    trade = TransactionCreator(timestamp=timezone.now())
+    trade.add_from_detail(wallet=wallet, currency=btc, quantity=1)
+    trade.add_to_detail(wallet=wallet, currency=eth, quantity=10)
+    trade.create_trade()
+    # Assets of other wallets are not included
+    TransactionCreator(timestamp=timezone.now()).create_deposit(wallet=other_wallet, currency=ada, quantity=1)
+    monkeypatch.setattr(candidate_pairs, "get_binance_wallet_balance", lambda: {"BNB": Decimal(1)})
+
+    assert get_held_assets(wallet) == {"BTC", "ETH", "BNB"}
+
+
+def test_get_candidate_pairs():
+    assert get_candidate_pairs(ALL_PAIRS, {"BTC", "ETH", "BNB"}) == ALL_PAIRS[:3]
+    assert get_candidate_pairs(ALL_PAIRS, {"BTC"}) == []
+    assert get_candidate_pairs(ALL_PAIRS, set()) == []
@@ -0,0 +1,258 @@
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from datetime import time
+
+import pytest
+from binance.exceptions import BinanceAPIException
+from django.core.management import call_command
+
+from crypto_fifo_taxes.enums import TransactionType
+from crypto_fifo_taxes.models import CurrencyPair, Transaction, WalletBalanceSnapshot
+from crypto_fifo_taxes.utils.binance import binance_api, candidate_pairs
+from crypto_fifo_taxes.utils.binance.binance_api import (
+    binance_history_iterator,
+    clear_binance_client,
+    get_binance_client,
+    get_binance_deposits,
+    get_binance_dust_log,
+    get_binance_withdraws,
+    get_convert_trade_history,
+)
+from crypto_fifo_taxes.utils.binance.binance_client import BinanceClient
+from crypto_fifo_taxes.utils.binance.binance_importer import import_convert_trade_history, import_dust
+from crypto_fifo_taxes.utils.binance.binance_wallet import import_binance_account_snapshots
+from crypto_fifo_taxes.utils.binance.fake_exchange import (
+    ASSETS,
+    FakeBinanceAdapter,
+    FakeBinanceExchange,
+    FakeBinanceVolumes,
+    get_fake_binance_adapter,
+)
+from crypto_fifo_taxes.utils.binance.request_weight import RequestWeightLimiter
+from tests.factories import CryptoCurrencyFactory, WalletFactory
+
+
+def get_fake_client(adapter: FakeBinanceAdapter, weight_limiter: RequestWeightLimiter | None = None) -> BinanceClient:
+    weight_limiter = weight_limiter or RequestWeightLimiter(6000)
+    return BinanceClient("fake", "fake", weight_limiter=weight_limiter, adapter=adapter, ping=False)
+
+
+def test_fake_binance_exchange():
+    exchange = FakeBinanceExchange(FakeBinanceVolumes(pairs=2, untraded_pairs=10, trades_per_pair=30))
+    adapter = FakeBinanceAdapter(exchange)
+    client = get_fake_client(adapter)
+
+    symbols = [s["symbol"] for s in client.get_exchange_info()["symbols"]]
+    assert len(symbols) == 12
+    trades = client.get_my_trades(symbol=symbols[0], fromId=11, limit=10)
+    assert [trade["id"] for trade in trades] == list(range(11, 21))
+    # Used weight is reported in the headers, and tracked by the limiter
+    assert client.weight_limiter.used_weight == 40
+
+    deposits = list(binance_history_iterator(client.get_deposit_history, period_length=90))
+    assert sum(len(page) for page in deposits) == exchange.volumes.deposits
+    assert adapter.rows_served == 10 + exchange.volumes.deposits
+
+
+def test_fake_binance_exchange_rate_limited():
+    sleeps = []
+
+    def sleep(seconds: float) -> None:
+        sleeps.append(seconds)
+        raise InterruptedError
+
+    adapter = FakeBinanceAdapter(FakeBinanceExchange(FakeBinanceVolumes(pairs=1)), weight_per_minute=50)
+    client = get_fake_client(adapter, RequestWeightLimiter(1000, sleep=sleep))
+
+    client.get_my_trades(symbol="ADAUSDT")
+    client.get_my_trades(symbol="ADAUSDT")
+    with pytest.raises(BinanceAPIException, match="Too much request weight used") as exc_info:
+        client.get_my_trades(symbol="ADAUSDT")
+
+    assert exc_info.value.status_code == 429
+    assert adapter.rate_limited_count == 1
+    # The limiter waits for the `Retry-After` of the response, the start of the next minute
+    with pytest.raises(InterruptedError):
+        client.weight_limiter.acquire(1)
+    assert 0 < sleeps[0] <= 60
+
+
+@pytest.mark.django_db()
+def test_benchmark_binance_sync(caplog):
+    caplog.set_level(logging.INFO)
+    call_command(
+        "benchmark_binance_sync",
+        pairs=3,
+        untraded_pairs=20,
+        trades_per_pair=10,
+        deposits=10,
+        withdrawals=5,
+        dividends=10,
+        interest=20,
+        converts=10,
+        dust=5,
+        weight_per_minute=1_000_000,
+    )
+
+    assert any(message.startswith("FULL: ") for message in caplog.messages)
+    # The traded pairs are found from the history imported by the same, uncommitted sync
+    assert "Syncing trades using FULL mode for 3 of 23 pairs..." in caplog.messages
+    assert any(message.startswith("FAST: ") for message in caplog.messages)
+    # The synced transactions are rolled back
+    assert Transaction.objects.count() == 0
+
+
+@pytest.fixture()
+def fake_binance(settings):
+    settings.BINANCE_TRANSPORT = "fake"
+    settings.BINANCE_FAKE_EXCHANGE = {
+        "pairs": 1,
+        "untraded_pairs": 0,
+        "converts": 40,
+        "dust": 15,
+        "weight_per_minute": 1_000_000,
+    }
+    settings.BINANCE_REQUEST_WEIGHT_PER_MINUTE = 1_000_000
+    settings.BINANCE_MAX_WORKERS = 4
+    settings.BINANCE_ARCHIVE_DIR = ""
+    clear_binance_client()
+    get_fake_binance_adapter.cache_clear()
+    yield get_fake_binance_adapter()
+    clear_binance_client()
+    get_fake_binance_adapter.cache_clear()
+
+
+@pytest.mark.django_db()
+def test_convert_and_dust_history(fake_binance, django_assert_num_queries):
+    exchange = fake_binance.exchange
+    wallet = WalletFactory.create(name="Binance")
+    for symbol in ASSETS:
+        CryptoCurrencyFactory.create(symbol=symbol)
+
+    converts = list(get_convert_trade_history())
+    dust = list(get_binance_dust_log())
+    # Fetched in windows, in chronological order
+    assert len(converts) > 1
+    assert [row["orderId"] for page in converts for row in page] == [row["orderId"] for row in exchange.converts]
+    assert [row["transId"] for page in dust for row in page] == [row["transId"] for row in exchange.dust]
+
+    known_tx_ids = Transaction.objects.imported_tx_ids()
+    for page in converts:
+        import_convert_trade_history(wallet, page, known_tx_ids=known_tx_ids)
+    for page in dust:
+        import_dust(wallet, page, known_tx_ids=known_tx_ids)
+    # Every dust conversion converts two assets
+    assert Transaction.objects.count() == len(exchange.converts) + 2 * len(exchange.dust)
+
+    # Re-imported pages are checked against the set, without a query for each page
+    known_tx_ids = Transaction.objects.imported_tx_ids()
+    with django_assert_num_queries(0):
+        for page in converts:
+            import_convert_trade_history(wallet, page, known_tx_ids=known_tx_ids)
+        for page in dust:
+            import_dust(wallet, page, known_tx_ids=known_tx_ids)
+    assert Transaction.objects.count() == len(exchange.converts) + 2 * len(exchange.dust)
+
+
+def test_get_binance_client_concurrently(fake_binance, monkeypatch):
+    created_clients = []
+
+    class CountedBinanceClient(BinanceClient):
+        def __init__(self, *args, **kwargs):
+            created_clients.append(self)
+            super().__init__(*args, **kwargs)
+
+    monkeypatch.setattr(binance_api, "BinanceClient", CountedBinanceClient)
+    # Creating the client pings Binance, which takes a while
+    fake_binance.latency = 0.2
+
+    with ThreadPoolExecutor(max_workers=9) as executor:
+        clients = list(executor.map(lambda _: get_binance_client(), range(9)))
+
+    # Every thread shares the same client, and its weight limiter
+    assert len(created_clients) == 1
+    assert all(client is created_clients[0] for client in clients)
+
+
+@pytest.mark.django_db()
+def test_sync_binance_full_pairs(fake_binance, settings, monkeypatch, caplog):
+    settings.BINANCE_FAKE_EXCHANGE = {
+        "pairs": 8,
+        "untraded_pairs": 3,
+        "trades_per_pair": 3,
+        "deposits": 12,
+        "withdrawals": 0,
+        "dividends": 0,
+        "interest": 0,
+        "converts": 0,
+        "dust": 0,
+        "weight_per_minute": 1_000_000,
+    }
+    get_fake_binance_adapter.cache_clear()
+    exchange = get_fake_binance_adapter().exchange
+    # Nothing is left in the account: the held assets are only found in the deposits imported by the same sync
+    monkeypatch.setattr(candidate_pairs, "get_binance_wallet_balance", dict)
+    WalletFactory.create(name="Binance")
+    for symbol in ASSETS:
+        CryptoCurrencyFactory.create(symbol=symbol)
+    caplog.set_level(logging.INFO)
+
+    # Like the benchmark, the sync runs in a transaction that is never committed
+    call_command("sync_binance", mode=1)
+
+    deposited = {row["coin"] for row in exchange.deposits}
+    expected_pairs = {f"{base}{quote}" for base, quote in exchange.traded_pairs if {base, quote} <= deposited}
+    assert 0 < len(expected_pairs) < len(exchange.traded_pairs)
+    assert set(CurrencyPair.objects.values_list("symbol", flat=True)) == expected_pairs
+    assert Transaction.objects.filter(transaction_type=TransactionType.TRADE).count() == 3 * len(expected_pairs)
+    assert any(message.startswith("Excluded 6 pairs") for message in caplog.messages)
+
+    call_command("sync_binance", mode=1, all_pairs=True)
+
+    traded_pairs = {f"{base}{quote}" for base, quote in exchange.traded_pairs}
+    assert set(CurrencyPair.objects.values_list("symbol", flat=True)) >= traded_pairs
+    assert Transaction.objects.filter(transaction_type=TransactionType.TRADE).count() == 3 * len(traded_pairs)
+
+
+def test_deposit_and_withdraw_history(fake_binance, monkeypatch):
+    exchange = fake_binance.exchange
+    # Periods with more rows than a page are split, instead of dropping the rows beyond the page
+    monkeypatch.setattr(binance_api, "DEPOSIT_HISTORY_LIMIT", 10)
+    monkeypatch.setattr(binance_api, "WITHDRAW_HISTORY_LIMIT", 10)
+    client = get_binance_client()
+    periods = []
+    get_deposit_history = client.get_deposit_history
+
+    def recorded_get_deposit_history(**params):
+        periods.append(params["endTime"] - params["startTime"])
+        return get_deposit_history(**params)
+
+    monkeypatch.setattr(client, "get_deposit_history", recorded_get_deposit_history)
+
+    deposits = [row["txId"] for page in get_binance_deposits() for row in page]
+    withdrawals = [row["txId"] for page in get_binance_withdraws() for row in page]
+
+    assert deposits == [row["txId"] for row in exchange.deposits]
+    assert withdrawals == [row["txId"] for row in exchange.withdrawals]
+    assert max(periods) < 90 * 24 * 60 * 60 * 1000
+
+
+@pytest.mark.django_db()
+def test_import_binance_account_snapshots(fake_binance):
+    exchange = fake_binance.exchange
+    wallet = WalletFactory.create(name="Binance")
+    for symbol in ASSETS:
+        CryptoCurrencyFactory.create(symbol=symbol)
+
+    count = import_binance_account_snapshots()
+
+    # Binance keeps the daily snapshots of the last month
+    assert 28 <= count <= 30
+    snapshots = WalletBalanceSnapshot.objects.filter(wallet=wallet)
+    assert snapshots.values("timestamp").distinct().count() == count
+    assert set(snapshots.values_list("currency__symbol", flat=True)) == set(exchange.balances)
+    assert all(timestamp.time() == time(23, 59, 59) for timestamp in snapshots.values_list("timestamp", flat=True))
+
+    # Snapshots already stored are skipped
+    assert import_binance_account_snapshots() == count
+    assert WalletBalanceSnapshot.objects.filter(wallet=wallet).count() == count * len(exchange.balances)
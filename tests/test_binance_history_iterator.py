@@ -1,10 +1,12 @@
+import time
 from collections import namedtuple
 from datetime import datetime, timedelta
+from itertools import pairwise
 
 import pytest
 
 from crypto_fifo_taxes.exceptions import TooManyResultsError
-from crypto_fifo_taxes.utils.binance.binance_api import binance_history_iterator, from_timestamp
+from crypto_fifo_taxes.utils.binance.binance_api import binance_history_iterator, from_timestamp, to_timestamp
 
 HistoryOutput = namedtuple("HistoryOutput", "start_time num_results")
 
@@ -60,3 +62,130 @@ def test_binance_history_iterator():
         end_date=start_date + timedelta(days=180),
     )
     assert len(list(output)) == 11
+
+
+def test_binance_history_iterator_adaptive_windows():
+    # Results on day 100 and 101, otherwise empty
+    results_by_day = {100: 3, 101: 3}
+    windows = []
+
+    def iterator_func(startTime: int, endTime: int):
+        start_day = (from_timestamp(startTime).replace(tzinfo=None) - datetime(2018, 1, 1)).days
+        end_day = (from_timestamp(endTime).replace(tzinfo=None) - datetime(2018, 1, 1)).days
+        windows.append((start_day, end_day))
+        results = [day for day, count in results_by_day.items() if start_day <= day < end_day for _ in range(count)]
+        if len(results) >= 4:
+            raise TooManyResultsError
+        return results
+
+    start_date = datetime(2018, 1, 1)
+    output = binance_history_iterator(
+        iterator_func,
+        period_length=10,
+        start_date=start_date,
+        end_date=start_date + timedelta(days=200),
+        max_period_length=80,
+        max_results=4,
+    )
+
+    assert sum(len(results) for results in output) == 6
+    assert windows == [
+        # Empty windows grow up to the maximum period
+        (0, 10),
+        (10, 30),
+        (30, 70),
+        # Too many results, split until the window fits
+        (70, 150),
+        (70, 110),
+        (70, 90),
+        # Don't grow into the window that had too many results
+        (90, 110),
+        (90, 100),
+        (100, 110),
+        (100, 105),
+        (100, 102),
+        # Dense windows are followed by windows of the same density
+        (100, 101),
+        (101, 102),
+        # Grow again over the empty period
+        (102, 103),
+        (103, 105),
+        (105, 109),
+        (109, 117),
+        (117, 133),
+        (133, 165),
+        (165, 200),
+    ]
+
+
+@pytest.mark.parametrize("max_period_length", [None, 60])
+def test_binance_history_iterator_concurrent(max_period_length):
+    start_date = datetime(2018, 1, 1)
+    end_date = start_date + timedelta(days=365)
+    # A record every 3 days, and a dense period of 40 records on days 200-204, which doesn't fit in a long window
+    records = [to_timestamp(start_date + timedelta(days=day, hours=12)) for day in range(0, 365, 3)]
+    records += [to_timestamp(start_date + timedelta(days=200, hours=i * 2)) for i in range(40)]
+    records.sort()
+    windows = []
+    too_many_results = []
+
+    def iterator_func(startTime: int, endTime: int):
+        time.sleep(0.005)
+        results = [record for record in records if startTime <= record < endTime]
+        if len(results) >= 25:
+            too_many_results.append((startTime, endTime))
+            raise TooManyResultsError
+        windows.append((startTime, endTime))
+        return results
+
+    kwargs = {
+        "period_length": 30,
+        "start_date": start_date,
+        "end_date": end_date,
+        "max_period_length": max_period_length,
+    }
+    sequential = list(binance_history_iterator(iterator_func, **kwargs))
+    assert [record for results in sequential for record in results] == records
+
+    windows.clear()
+    too_many_results.clear()
+    concurrent = list(binance_history_iterator(iterator_func, max_workers=4, **kwargs))
+
+    # Windows are fetched concurrently, but yielded in chronological order
+    assert [record for results in concurrent for record in results] == records
+    # The windows cover the whole period without gaps or overlaps, also where a segment split its windows
+    assert too_many_results
+    windows.sort()
+    assert windows[0][0] == to_timestamp(start_date)
+    assert windows[-1][1] == to_timestamp(end_date.replace(hour=23, minute=59, second=59))
+    assert all(previous[1] == window[0] for previous, window in pairwise(windows))
+
+
+def test_binance_history_iterator_concurrent_streamed():
+    fetched = []
+
+    def iterator_func(startTime: int, endTime: int):
+        time.sleep(0.01)
+        fetched.append(startTime)
+        return [startTime]
+
+    start_date = datetime(2018, 1, 1)
+    output = binance_history_iterator(
+        iterator_func,
+        period_length=1,
+        start_date=start_date,
+        end_date=start_date + timedelta(days=400),
+        max_period_length=10,
+        max_workers=2,
+    )
+    assert next(output) == [to_timestamp(start_date)]
+
+    # Each segment has over 20 windows, but only a few windows are fetched ahead of the reader
+    time.sleep(0.3)
+    assert len(fetched) <= 12
+
+    # Closing the iterator stops the fetches
+    output.close()
+    fetched_before_close = len(fetched)
+    time.sleep(0.1)
+    assert len(fetched) == fetched_before_close
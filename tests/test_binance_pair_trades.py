@@ -0,0 +1,56 @@
+import time
+
+from django.core.management import load_command_class
+
+from crypto_fifo_taxes.management.commands import sync_binance
+from crypto_fifo_taxes.utils.binance import binance_api
+from crypto_fifo_taxes.utils.binance.request_weight import RequestWeightLimiter
+
+
+class FakeTradesClient:
+    def __init__(self, trade_ids: list[int]) -> None:
+        self.trade_ids = trade_ids
+        self.requests: list[int] = []
+        self.weight_limiter = RequestWeightLimiter(1000)
+
+    def get_my_trades(self, symbol: str, fromId: int, limit: int) -> list[dict]:
+        self.requests.append(fromId)
+        return [{"id": trade_id, "symbol": symbol} for trade_id in self.trade_ids if trade_id >= fromId][:limit]
+
+
+def test_get_binance_pair_trades(monkeypatch):
+    client = FakeTradesClient(trade_ids=[1, 2, 5, 8, 9])
+    monkeypatch.setattr(binance_api, "get_binance_client", lambda: client)
+    monkeypatch.setattr(binance_api, "MY_TRADES_LIMIT", 2)
+
+    # Pages forward until a page is not full
+    trades = binance_api.get_binance_pair_trades("ETHBTC")
+    assert [trade["id"] for trade in trades] == [1, 2, 5, 8, 9]
+    assert client.requests == [0, 3, 9]
+
+    # Continues from a cursor
+    client.requests = []
+    assert [trade["id"] for trade in binance_api.get_binance_pair_trades("ETHBTC", from_id=9)] == [9]
+    assert client.requests == [9]
+
+
+def test_fetch_trades_closed(monkeypatch, settings):
+    settings.BINANCE_MAX_WORKERS = 2
+    fetched: list[str] = []
+
+    def get_binance_pair_trades(symbol: str, from_id: int = 0) -> list[dict]:
+        time.sleep(0.01)
+        fetched.append(symbol)
+        return []
+
+    monkeypatch.setattr(sync_binance, "get_binance_pair_trades", get_binance_pair_trades)
+    command = load_command_class("crypto_fifo_taxes", "sync_binance")
+    pairs = [f"PAIR{i}" for i in range(100)]
+
+    trades = command.fetch_trades(pairs, cursors={})
+    # Pairs are yielded in order
+    assert [next(trades)[0] for _ in range(3)] == pairs[:3]
+
+    # Closing the generator, e.g. when the pipeline is cancelled, doesn't fetch the queued pairs
+    trades.close()
+    assert len(fetched) < 10
@@ -0,0 +1,50 @@
+from crypto_fifo_taxes.utils.binance.request_weight import RequestWeightLimiter
+
+
+class FakeClock:
+    def __init__(self, now: float) -> None:
+        self.now = now
+        self.sleeps: list[float] = []
+
+    def time(self) -> float:
+        return self.now
+
+    def sleep(self, seconds: float) -> None:
+        self.sleeps.append(seconds)
+        self.now += seconds
+
+
+def test_request_weight_limiter():
+    clock = FakeClock(now=600)
+    limiter = RequestWeightLimiter(100, clock=clock.time, sleep=clock.sleep)
+
+    for _ in range(5):
+        limiter.acquire(20)
+    assert limiter.used_weight == 100
+    assert clock.sleeps == []
+
+    # Waits for the next minute, when the budget is used
+    clock.now += 15
+    limiter.acquire(20)
+    assert clock.sleeps == [45]
+    assert limiter.used_weight == 20
+
+    # The weight reported by Binance includes requests of other clients
+    limiter.update({"X-MBX-USED-WEIGHT-1M": "90"})
+    assert limiter.used_weight == 90
+    limiter.update({"x-mbx-used-weight-1m": "50"})  # Older response
+    assert limiter.used_weight == 90
+
+
+def test_request_weight_limiter_rate_limited():
+    clock = FakeClock(now=600)
+    limiter = RequestWeightLimiter(100, clock=clock.time, sleep=clock.sleep)
+
+    limiter.rate_limited(retry_after=10)
+    limiter.acquire(20)
+    assert clock.sleeps == [10]
+
+    # Without `Retry-After`, waits until the next minute
+    limiter.rate_limited()
+    limiter.acquire(20)
+    assert clock.sleeps == [10, 50]
@@ -0,0 +1,128 @@
+import gzip
+import os
+
+import pytest
+from django.core.management import load_command_class
+
+from crypto_fifo_taxes.enums import TransactionType
+from crypto_fifo_taxes.models import BinanceTradeCursor, Transaction
+from crypto_fifo_taxes.utils.binance.response_archive import ResponseArchive, read_response_archive
+from crypto_fifo_taxes.utils.import_pipeline import run_import_pipeline
+from tests.factories import CryptoCurrencyFactory, WalletFactory
+
+DEPOSIT = {"amount": "1.5", "coin": "BTC", "txId": "0x1", "insertTime": 1599621997000, "transferType": 0}
+TRADE = {
+    "id": 28457,
+    "orderId": 100234,
+    "symbol": "ETHBTC",
+    "price": "0.05",
+    "qty": "2",
+    "quoteQty": "0.1",
+    "commission": "0.002",
+    "commissionAsset": "ETH",
+    "time": 1599721997000,
+    "isBuyer": True,
+}
+EXCHANGE_INFO = {"symbols": [{"symbol": "ETHBTC", "baseAsset": "ETH", "quoteAsset": "BTC", "status": "TRADING"}]}
+
+
+def test_response_archive(tmp_path):
+    archive = ResponseArchive(str(tmp_path))
+    archive.append(
+        "https://api.binance.com/sapi/v1/capital/deposit/hisrec?startTime=1&endTime=2&timestamp=3&signature=abc",
+        [DEPOSIT],
+    )
+    archive.append("https://api.binance.com/api/v3/myTrades?symbol=ETHBTC&fromId=0&limit=1000", [TRADE])
+    archive.close()
+
+    records = list(read_response_archive(str(tmp_path)))
+    assert [record["endpoint"] for record in records] == ["/sapi/v1/capital/deposit/hisrec", "/api/v3/myTrades"]
+    # Parameters that change on every request are not archived
+    assert records[0]["params"] == {"startTime": "1", "endTime": "2"}
+    assert records[1]["params"] == {"symbol": "ETHBTC", "fromId": "0", "limit": "1000"}
+    assert records[0]["response"] == [DEPOSIT]
+    assert all("fetched_at" in record for record in records)
+
+
+def test_response_archive_truncated(tmp_path):
+    archive = ResponseArchive(str(tmp_path))
+    archive.append("https://api.binance.com/sapi/v1/capital/deposit/hisrec", [DEPOSIT])
+    archive.append("https://api.binance.com/sapi/v1/capital/deposit/hisrec", [DEPOSIT])
+
+    # Copy the archive of a run that was interrupted, before the archive was closed
+    with open(archive.path, "rb") as archive_file:
+        data = archive_file.read()
+    with open(os.path.join(tmp_path, "binance-0.jsonl.gz"), "wb") as truncated_file:
+        truncated_file.write(data)
+    archive.close()
+
+    with pytest.raises(EOFError), gzip.open(os.path.join(tmp_path, "binance-0.jsonl.gz")) as truncated_file:
+        truncated_file.read()
+    # Everything flushed before the interruption is read, followed by the complete archive
+    assert len(list(read_response_archive(str(tmp_path)))) == 4
+
+
+@pytest.mark.django_db()
+def test_replay_binance(tmp_path):
+    wallet = WalletFactory.create(name="Binance")
+    CryptoCurrencyFactory.create(symbol="BTC")
+    CryptoCurrencyFactory.create(symbol="ETH")
+
+    # Two runs with overlapping deposit history
+    for _ in range(2):
+        archive = ResponseArchive(str(tmp_path))
+        archive.append("https://api.binance.com/sapi/v1/capital/deposit/hisrec", [DEPOSIT])
+        archive.close()
+    archive = ResponseArchive(str(tmp_path))
+    archive.append("https://api.binance.com/api/v3/exchangeInfo", EXCHANGE_INFO)
+    archive.append("https://api.binance.com/api/v3/myTrades?symbol=ETHBTC&fromId=0&limit=1000", [TRADE])
+    archive.close()
+
+    command = load_command_class("crypto_fifo_taxes", "sync_binance")
+    command.wallet = wallet
+    run_import_pipeline(command.get_replay_sources(str(tmp_path)))
+
+    assert Transaction.objects.filter(transaction_type=TransactionType.DEPOSIT).count() == 1
+    trade = Transaction.objects.get(transaction_type=TransactionType.TRADE)
+    assert trade.tx_id == str(TRADE["orderId"])
+    assert trade.to_detail.currency.symbol == "ETH"
+    assert BinanceTradeCursor.objects.get(symbol="ETHBTC").last_trade_id == TRADE["id"]
+
+
+@pytest.mark.django_db()
+def test_replay_binance_order_split_across_pages(tmp_path):
+    wallet = WalletFactory.create(name="Binance")
+    CryptoCurrencyFactory.create(symbol="BTC")
+    CryptoCurrencyFactory.create(symbol="ETH")
+    # The cursor of a later sync than the archive
+    BinanceTradeCursor.objects.create(symbol="ETHBTC", last_trade_id=50000)
+
+    # The fills of an order continue on the next page, and pages of another pair are interleaved
+    first_fill = {**TRADE, "id": 1}
+    second_fill = {**TRADE, "id": 2, "time": TRADE["time"] + 1}
+    other_order = {**TRADE, "id": 3, "orderId": TRADE["orderId"] + 1, "time": TRADE["time"] + 2}
+    exchange_info = {
+        "symbols": [*EXCHANGE_INFO["symbols"], {"symbol": "BNBBTC", "baseAsset": "BNB", "quoteAsset": "BTC"}]
+    }
+    archive = ResponseArchive(str(tmp_path))
+    archive.append("https://api.binance.com/api/v3/exchangeInfo", exchange_info)
+    archive.append("https://api.binance.com/api/v3/myTrades?symbol=ETHBTC&fromId=0&limit=1", [first_fill])
+    archive.append("https://api.binance.com/api/v3/myTrades?symbol=BNBBTC&fromId=0&limit=1", [])
+    archive.append("https://api.binance.com/api/v3/myTrades?symbol=ETHBTC&fromId=2&limit=1", [second_fill])
+    archive.append("https://api.binance.com/api/v3/myTrades?symbol=ETHBTC&fromId=3&limit=1", [other_order])
+    archive.append("https://api.binance.com/api/v3/myTrades?symbol=ETHBTC&fromId=4&limit=1", [])
+    archive.close()
+
+    command = load_command_class("crypto_fifo_taxes", "sync_binance")
+    command.wallet = wallet
+    run_import_pipeline(command.get_replay_sources(str(tmp_path)))
+
+    # Both fills of the first order are imported, like in a sync
+    trades = Transaction.objects.filter(transaction_type=TransactionType.TRADE)
+    assert sorted(trades.values_list("tx_id", flat=True)) == [
+        str(TRADE["orderId"]),
+        str(TRADE["orderId"]),
+        str(TRADE["orderId"] + 1),
+    ]
+    # The cursor is not moved back to the archived trades
+    assert BinanceTradeCursor.objects.get(symbol="ETHBTC").last_trade_id == 50000
@@ -0,0 +1,53 @@
+from datetime import UTC, datetime
+
+import pytest
+
+from crypto_fifo_taxes.models import SyncWatermark
+from crypto_fifo_taxes.utils.binance.sync_watermark import (
+    get_sync_start_date,
+    get_sync_watermarks,
+    is_watermark_covered,
+    save_sync_watermark,
+)
+from tests.factories import WalletFactory
+
+
+def test_get_sync_start_date(settings):
+    settings.BINANCE_SYNC_OVERLAP_DAYS = 2
+    synced_until = datetime(2024, 6, 10, 12, tzinfo=UTC)
+    local_synced_until = synced_until.astimezone().replace(tzinfo=None)
+
+    # Never synced endpoints are synced from the beginning
+    assert get_sync_start_date(None) is None
+    # Resume from the watermark, with overlap
+    assert get_sync_start_date(synced_until) == datetime(2024, 6, 8, local_synced_until.hour)
+    # An explicit start date overrides the watermark
+    assert get_sync_start_date(synced_until, datetime(2020, 1, 1)) == datetime(2020, 1, 1)
+
+
+def test_is_watermark_covered():
+    synced_until = datetime(2024, 6, 10, 12, tzinfo=UTC)
+
+    assert is_watermark_covered(None, None)
+    assert is_watermark_covered(None, synced_until)
+    assert is_watermark_covered(get_sync_start_date(synced_until), synced_until)
+    # Syncs starting after the watermark leave a gap, and syncs from a date don't know what was synced before
+    assert not is_watermark_covered(datetime(2024, 7, 1), synced_until)
+    assert not is_watermark_covered(datetime(2020, 1, 1), None)
+
+
+@pytest.mark.django_db()
+def test_save_sync_watermark():
+    wallet = WalletFactory.create(name="Binance")
+    other_wallet = WalletFactory.create(name="Other")
+    first_sync = datetime(2024, 3, 10, tzinfo=UTC)
+    second_sync = datetime(2024, 3, 11, tzinfo=UTC)
+
+    save_sync_watermark("sync_deposits", wallet, first_sync)
+    save_sync_watermark("sync_withdrawals", wallet, first_sync)
+    save_sync_watermark("sync_deposits", other_wallet, first_sync)
+    save_sync_watermark("sync_deposits", wallet, second_sync)
+
+    assert SyncWatermark.objects.count() == 3
+    assert get_sync_watermarks(wallet) == {"sync_deposits": second_sync, "sync_withdrawals": first_sync}
+    assert get_sync_watermarks(other_wallet) == {"sync_deposits": first_sync}
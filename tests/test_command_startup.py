@@ -0,0 +1,81 @@
+import json
+import os
+import subprocess
+import sys
+from pathlib import Path
+
+# Budget of `manage.py` startup: setting up Django and loading every management command
+STARTUP_TIME_BUDGET = 5.0  # seconds
+STARTUP_QUERY_BUDGET = 0
+
+# Run in a new interpreter, so that the modules of the commands are imported again
+STARTUP_SCRIPT = """
+import json
+import socket
+import time
+
+start_time = time.perf_counter()
+connections = []
+connect = socket.socket.connect
+
+
+def record_connect(sock, address):
+    connections.append(str(address))
+    return connect(sock, address)
+
+
+socket.socket.connect = record_connect
+
+import django
+
+django.setup()
+
+from django.core.management import get_commands, load_command_class
+from django.db import connections as db_connections
+
+queries = []
+
+
+def record_query(execute, sql, params, many, context):
+    queries.append(sql)
+    return execute(sql, params, many, context)
+
+
+for alias in db_connections:
+    db_connections[alias].execute_wrappers.append(record_query)
+
+commands = get_commands()
+for name, app_name in commands.items():
+    load_command_class(app_name, name)
+
+print(
+    json.dumps(
+        {
+            "seconds": time.perf_counter() - start_time,
+            "commands": sorted(commands),
+            "queries": queries,
+            "connections": connections,
+        }
+    )
+)
+"""
+
+
+def test_command_startup():
+    result = subprocess.run(
+        [sys.executable, "-c", STARTUP_SCRIPT],  # noqa: S603
+        cwd=Path(__file__).resolve().parent.parent,
+        env={"DJANGO_SETTINGS_MODULE": "project.settings", **os.environ},
+        capture_output=True,
+        text=True,
+        check=False,
+        timeout=60,
+    )
+    assert result.returncode == 0, result.stderr
+    startup = json.loads(result.stdout.strip().splitlines()[-1])
+
+    assert "sync_binance" in startup["commands"]
+    # Loading commands must not query the database, or connect to e.g. Binance
+    assert len(startup["queries"]) <= STARTUP_QUERY_BUDGET, startup["queries"]
+    assert startup["connections"] == []
+    assert startup["seconds"] < STARTUP_TIME_BUDGET
@@ -5,9 +5,13 @@ import pytest
 from django.utils import timezone
 
 from crypto_fifo_taxes.models import Currency
+from crypto_fifo_taxes.utils import coingecko, price_fetch_planner
+from crypto_fifo_taxes.utils.binance.binance_api import to_timestamp
 from crypto_fifo_taxes.utils.coingecko import coingecko_request_price_history, fetch_currency_market_chart
+from crypto_fifo_taxes.utils.price_providers import get_price_provider
 from tests.factories import (
     CryptoCurrencyFactory,
+    CurrencyPriceFactory,
     TransactionDetailFactory,
     TransactionFactory,
     WalletFactory,
@@ -54,3 +58,43 @@ def test_fetch_currency_market_chart():
     assert crypto.prices.get(date=selected_datetime.date(), fiat__symbol="EUR").price == Decimal("6412.84639784161")
     # Price for today exists
     assert crypto.prices.filter(date=timezone.now().date()).count() == 2
+
+
+@pytest.mark.django_db()
+def test_fetch_currency_market_chart_missing_ranges(monkeypatch):
+    """Only the missing dates are requested, and dates the API doesn't return prices for are not requested again"""
+    wallet = WalletFactory.create()
+    crypto = CryptoCurrencyFactory.create(symbol="BTC")
+    TransactionFactory.create(
+        timestamp=datetime.datetime(2020, 1, 1, 10, tzinfo=datetime.UTC),
+        to_detail=TransactionDetailFactory.create(wallet=wallet, currency=crypto),
+    )
+    for day in range(1, 11):
+        CurrencyPriceFactory.create(currency=crypto, date=datetime.date(2020, 1, day))
+
+    requests = []
+
+    def get_market_chart_range(cg_id, vs_currency, from_timestamp_s, to_timestamp_s):
+        requests.append((from_timestamp_s, to_timestamp_s))
+        # Prices are missing from the API for 2020-01-12
+        stamps = [to_timestamp(datetime.datetime(2020, 1, day, tzinfo=datetime.UTC)) for day in (11, 13)]
+        return {
+            "prices": [[stamp, 1.5] for stamp in stamps],
+            "market_caps": [[stamp, 10] for stamp in stamps],
+            "total_volumes": [[stamp, 1] for stamp in stamps],
+        }
+
+    monkeypatch.setattr(get_price_provider(), "get_market_chart_range", get_market_chart_range)
+    monkeypatch.setattr(price_fetch_planner, "utc_date", lambda: datetime.date(2020, 1, 13))
+    monkeypatch.setattr(coingecko, "utc_date", lambda: datetime.date(2020, 1, 13))
+
+    fetch_currency_market_chart(currency=crypto)
+
+    assert len(requests) == 1
+    assert requests[0][0] == datetime.datetime(2020, 1, 11, tzinfo=datetime.UTC).timestamp()
+    assert crypto.prices.get(date=datetime.date(2020, 1, 13)).price == Decimal("1.5")
+    assert crypto.prices.get(date=datetime.date(2020, 1, 11)).num_missing_days == 1
+
+    # All prices are either saved, or known to be missing
+    fetch_currency_market_chart(currency=crypto)
+    assert len(requests) == 1
@@ -0,0 +1,70 @@
+import datetime
+from decimal import Decimal
+
+import pytest
+
+from crypto_fifo_taxes.models import FiatExchangeRate
+from crypto_fifo_taxes.utils import coingecko, price_fetch_planner
+from crypto_fifo_taxes.utils.binance.binance_api import to_timestamp
+from crypto_fifo_taxes.utils.coingecko import fetch_fiat_exchange_rates
+from crypto_fifo_taxes.utils.currency import get_fiat_currency, get_or_create_fiat_currency
+from crypto_fifo_taxes.utils.price_providers import get_price_provider
+from tests.factories import CryptoCurrencyFactory, CurrencyPriceFactory
+
+
+@pytest.mark.django_db()
+def test_fetch_fiat_exchange_rates(monkeypatch):
+    btc = CryptoCurrencyFactory.create(symbol="BTC")
+    eth = CryptoCurrencyFactory.create(symbol="ETH")
+    usd = get_or_create_fiat_currency("USD")
+    for day in (1, 2, 3):
+        CurrencyPriceFactory.create(currency=btc, date=datetime.date(2021, 1, day), price=Decimal(20000))
+        CurrencyPriceFactory.create(currency=eth, date=datetime.date(2021, 1, day), price=Decimal(500))
+
+    requests = []
+
+    def get_market_chart_range(cg_id, vs_currency, from_timestamp_s, to_timestamp_s):
+        requests.append((cg_id, vs_currency))
+        stamps = [to_timestamp(datetime.datetime(2021, 1, day, tzinfo=datetime.UTC)) for day in (1, 2, 3)]
+        return {
+            "prices": [[stamp, 24000 + i * 2000] for i, stamp in enumerate(stamps)],
+            "market_caps": [[stamp, 0] for stamp in stamps],
+            "total_volumes": [[stamp, 0] for stamp in stamps],
+        }
+
+    monkeypatch.setattr(get_price_provider(), "get_market_chart_range", get_market_chart_range)
+    monkeypatch.setattr(coingecko, "utc_date", lambda: datetime.date(2021, 1, 3))
+    monkeypatch.setattr(price_fetch_planner, "utc_date", lambda: datetime.date(2021, 1, 3))
+
+    assert fetch_fiat_exchange_rates(usd) == 3
+    # Only the reference currency is fetched in the other FIAT currency
+    assert requests == [("bitcoin", "usd")]
+    assert FiatExchangeRate.objects.get(quote=usd, date=datetime.date(2021, 1, 2)).rate == Decimal("1.3")
+
+    # All exchange rates are already saved
+    assert fetch_fiat_exchange_rates(usd) == 0
+    assert fetch_fiat_exchange_rates(get_fiat_currency()) == 0
+    assert len(requests) == 1
+
+    assert eth.get_price_in_fiat(usd, datetime.date(2021, 1, 3)) == Decimal(700)
+    assert eth.get_price_in_fiat(get_fiat_currency(), datetime.date(2021, 1, 3)) == Decimal(500)
+    assert eth.get_fiat_prices(usd, datetime.date(2021, 1, 2)) == {
+        datetime.date(2021, 1, 2): Decimal(650),
+        datetime.date(2021, 1, 3): Decimal(700),
+    }
+
+
+@pytest.mark.django_db()
+def test_get_price_in_fiat(monkeypatch):
+    eth = CryptoCurrencyFactory.create(symbol="ETH")
+    usd = get_or_create_fiat_currency("USD")
+    CurrencyPriceFactory.create(currency=eth, date=datetime.date(2021, 1, 2), price=Decimal(500))
+    FiatExchangeRate.objects.create(base=get_fiat_currency(), quote=usd, date=datetime.date(2021, 1, 2), rate=1.2)
+    monkeypatch.setattr(coingecko, "fetch_currency_market_chart", lambda currency: None)
+
+    # The price of the next day is used, and converted with the exchange rate of that day
+    assert eth.get_price_in_fiat(usd, datetime.date(2021, 1, 1)) == Decimal(600)
+
+    # Exchange rates saved later are used
+    FiatExchangeRate.objects.filter(quote=usd).update(rate=Decimal("1.3"))
+    assert eth.get_price_in_fiat(usd, datetime.date(2021, 1, 2)) == Decimal(650)
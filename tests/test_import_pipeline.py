@@ -0,0 +1,145 @@
+import threading
+import time
+
+import pytest
+
+from crypto_fifo_taxes.models import Wallet
+from crypto_fifo_taxes.utils.import_pipeline import ImportSource, run_import_pipeline
+
+
+def test_run_import_pipeline_writes_in_source_order():
+    written = []
+    writer_threads = set()
+
+    def fetch(name: str, batches: int, delay: float):
+        def fetch_batches():
+            for i in range(batches):
+                time.sleep(delay)
+                yield f"{name}{i}"
+
+        return fetch_batches
+
+    def write(batch: str) -> None:
+        writer_threads.add(threading.current_thread())
+        written.append(batch)
+
+    start_time = time.monotonic()
+    run_import_pipeline(
+        [
+            # The slowest source is written first
+            ImportSource(name="a", fetch=fetch("a", 3, 0.1), write=write),
+            ImportSource(name="b", fetch=fetch("b", 3, 0.05), write=write),
+            ImportSource(name="c", fetch=fetch("c", 2, 0.1), write=write),
+        ],
+        queue_size=1,
+    )
+
+    assert written == ["a0", "a1", "a2", "b0", "b1", "b2", "c0", "c1"]
+    assert writer_threads == {threading.current_thread()}
+    # Sources are fetched concurrently, the total time is close to that of the slowest source (0.3s)
+    assert time.monotonic() - start_time < 0.6
+
+
+def test_run_import_pipeline_fetch_error():
+    written = []
+
+    def failing_fetch():
+        yield "b0"
+        raise ValueError("Fetch failed")
+
+    with pytest.raises(ValueError, match="Fetch failed"):
+        run_import_pipeline(
+            [
+                ImportSource(name="a", fetch=lambda: ["a0"], write=written.append, finish=lambda: written.append("a")),
+                ImportSource(name="b", fetch=failing_fetch, write=written.append, finish=lambda: written.append("b")),
+                ImportSource(name="c", fetch=lambda: ["c0"], write=written.append),
+            ]
+        )
+
+    # Batches fetched before the error are written, later sources are not.
+    # Only sources that were written completely are finished
+    assert written == ["a0", "a", "b0"]
+
+
+def test_run_import_pipeline_wait_for_previous():
+    written = []
+    fetched_after = []
+
+    def fetch_a():
+        time.sleep(0.05)
+        yield "a0"
+
+    def fetch_b():
+        # Everything written by the previous sources is visible
+        fetched_after.append(list(written))
+        yield "b0"
+
+    run_import_pipeline(
+        [
+            ImportSource(name="a", fetch=fetch_a, write=written.append),
+            ImportSource(name="b", fetch=fetch_b, write=written.append, wait_for_previous=True),
+        ]
+    )
+
+    assert written == ["a0", "b0"]
+    assert fetched_after == [["a0"]]
+
+
+def test_run_import_pipeline_wait_for_previous_cancelled():
+    fetched = []
+
+    def failing_fetch():
+        raise ValueError("Fetch failed")
+        yield
+
+    with pytest.raises(ValueError, match="Fetch failed"):
+        run_import_pipeline(
+            [
+                ImportSource(name="a", fetch=failing_fetch, write=print),
+                ImportSource(name="b", fetch=lambda: fetched.append("b") or [], write=print, wait_for_previous=True),
+            ]
+        )
+
+    # Waiting sources are not fetched after the pipeline has failed
+    assert fetched == []
+
+
+def test_run_import_pipeline_prepare():
+    written = []
+    calls = []
+
+    def prepare():
+        # Called from the writer thread, after the previous sources have been written
+        calls.append(("prepare", threading.current_thread() is threading.main_thread(), list(written)))
+
+    def fetch_b():
+        calls.append(("fetch", threading.current_thread() is threading.main_thread(), list(written)))
+        yield "b0"
+
+    run_import_pipeline(
+        [
+            ImportSource(name="a", fetch=lambda: ["a0"], write=written.append),
+            ImportSource(name="b", fetch=fetch_b, write=written.append, prepare=prepare, wait_for_previous=True),
+        ]
+    )
+
+    assert calls == [("prepare", True, ["a0"]), ("fetch", False, ["a0"])]
+
+
+@pytest.mark.django_db()
+def test_run_import_pipeline_atomic():
+    def write(batch: str) -> None:
+        if batch == "b1":
+            raise ValueError("Write failed")
+        Wallet.objects.create(name=batch)
+
+    with pytest.raises(ValueError, match="Write failed"):
+        run_import_pipeline(
+            [
+                ImportSource(name="a", fetch=lambda: ["a0", "a1"], write=write),
+                ImportSource(name="b", fetch=lambda: ["b0", "b1"], write=write, atomic=True),
+            ]
+        )
+
+    # The batches of the failed atomic source are rolled back, those of the previous sources are kept
+    assert set(Wallet.objects.values_list("name", flat=True)) == {"a0", "a1"}
@@ -0,0 +1,87 @@
+import datetime
+from decimal import Decimal
+
+from crypto_fifo_taxes.enums import TransactionLabel, TransactionType
+from crypto_fifo_taxes.utils.import_spec import (
+    UNIX_MILLISECONDS,
+    ImportSpec,
+    get_timestamp_parser,
+    parse_decimals,
+    parse_symbols,
+    parse_timestamps,
+)
+from crypto_fifo_taxes.utils.staging_importer import StagingRow
+
+
+def test_parse_columns():
+    utc = datetime.UTC
+    assert parse_timestamps(["2018-03-07T12:12:12.123Z"], "%Y-%m-%dT%H:%M:%S.%fZ") == [
+        datetime.datetime(2018, 3, 7, 12, 12, 12, 123000, tzinfo=utc)
+    ]
+    assert (
+        parse_timestamps(["2020-12-27 00:00:00 GMT"] * 2, "%Y-%m-%d %H:%M:%S GMT")
+        == [datetime.datetime(2020, 12, 27, tzinfo=utc)] * 2
+    )
+    assert parse_timestamps(["27.12.2020"], "%d.%m.%Y") == [datetime.datetime(2020, 12, 27, tzinfo=utc)]
+    assert get_timestamp_parser(UNIX_MILLISECONDS) is get_timestamp_parser(UNIX_MILLISECONDS)
+
+    assert parse_decimals(["0.1", 0.1, 2]) == [Decimal("0.1"), Decimal("0.1"), Decimal(2)]
+    assert parse_decimals(["-0.5"], absolute=True) == [Decimal("0.5")]
+
+    symbols = parse_symbols(["eth", "ETH", "btc"])
+    assert symbols == ["ETH", "ETH", "BTC"]
+    assert symbols[0] is symbols[1]
+
+
+def test_import_spec_trades():
+    spec = ImportSpec(
+        wallet="Coinbase",
+        description="Trade",
+        transaction_type=TransactionType.TRADE,
+        timestamp_column="time",
+        timestamp_format="%Y-%m-%d %H:%M:%S",
+        quantity_column="size",
+        pair_column="product",
+        side_column="side",
+        price_column="price",
+        fee_column="fee",
+        fee_symbol_column="fee unit",
+    )
+    rows = [
+        {"time": "2021-01-01 00:00:00", "product": "ETH-EUR", "side": "BUY", "size": 2, "price": 500, "fee": 1},
+        {"time": "2021-01-02 00:00:00", "product": "ETH-EUR", "side": "SELL", "size": "1", "price": "600", "fee": 0},
+    ]
+    for row in rows:
+        row["fee unit"] = "EUR"
+
+    assert spec.parse(rows, ["1", "2"]) == [
+        StagingRow(
+            timestamp=datetime.datetime(2021, 1, 1, tzinfo=datetime.UTC),
+            tx_id="1",
+            description="Trade",
+            transaction_type=TransactionType.TRADE,
+            transaction_label=TransactionLabel.UNKNOWN,
+            from_wallet="Coinbase",
+            from_symbol="EUR",
+            from_quantity=Decimal(1000),
+            to_wallet="Coinbase",
+            to_symbol="ETH",
+            to_quantity=Decimal(2),
+            fee_wallet="Coinbase",
+            fee_symbol="EUR",
+            fee_quantity=Decimal(1),
+        ),
+        StagingRow(
+            timestamp=datetime.datetime(2021, 1, 2, tzinfo=datetime.UTC),
+            tx_id="2",
+            description="Trade",
+            transaction_type=TransactionType.TRADE,
+            transaction_label=TransactionLabel.UNKNOWN,
+            from_wallet="Coinbase",
+            from_symbol="ETH",
+            from_quantity=Decimal(1),
+            to_wallet="Coinbase",
+            to_symbol="EUR",
+            to_quantity=Decimal(600),
+        ),
+    ]
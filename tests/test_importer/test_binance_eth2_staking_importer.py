@@ -15,6 +15,8 @@ def test_binance_eth2_staking_importer_management_command():
 
     filepath = os.path.join(settings.BASE_DIR, "binance_eth2_staking.json.template")
     call_command("import_binance_eth2_json", file=filepath)
+    # Already imported rows are skipped in every chunk
+    call_command("import_binance_eth2_json", file=filepath, chunk_size=1)
 
     assert Transaction.objects.all().count() == 2
     assert wallet_binance.get_current_balance("BETH") == Decimal("0.00250000") + Decimal("0.00300000")
@@ -0,0 +1,25 @@
+import os
+from decimal import Decimal
+
+import pytest
+from django.conf import settings
+from django.core.management import call_command
+
+from crypto_fifo_taxes.models import Transaction
+from crypto_fifo_taxes.utils.currency import get_fiat_currency
+from tests.factories import CryptoCurrencyFactory, WalletFactory
+
+
+@pytest.mark.django_db()
+def test_coinbase_importer_management_command():
+    wallet = WalletFactory.create(name="Coinbase")
+    CryptoCurrencyFactory.create(symbol="ETH")
+    get_fiat_currency()  # EUR
+
+    filepath = os.path.join(settings.BASE_DIR, "coinbase_fills.json.template")
+    call_command("import_coinbase_json", file=filepath)
+    call_command("import_coinbase_json", file=filepath, staging=True)
+
+    assert Transaction.objects.count() == 1
+    assert wallet.get_current_balance("ETH") == Decimal(1)
+    assert wallet.get_current_balance("EUR") == Decimal(-650)
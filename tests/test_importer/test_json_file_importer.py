@@ -4,7 +4,10 @@ from decimal import Decimal
 import pytest
 from django.conf import settings
 from django.core.management import call_command
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
 
+from crypto_fifo_taxes.models import Transaction
 from tests.factories import TransactionFactory, WalletFactory
 
 
@@ -26,3 +29,31 @@ def test_json_import_management_command():
     assert wallet_binance.get_current_balance("BTC") == -1
     assert wallet_coinbase.get_current_balance("BTC") == Decimal("0.995")
     assert wallet_cold.get_current_balance("BTC") == Decimal("0.995")
+
+
+@pytest.mark.django_db()
+def test_json_import_reimport_updates_in_bulk():
+    wallet_binance = WalletFactory.create(name="Binance")
+    wallet_coinbase = WalletFactory.create(name="Coinbase")
+    WalletFactory.create(name="Cold Wallet")
+    TransactionFactory.create(tx_id="1234dbbd89333347002d73sss8026feb5f6ggggg81734bad136d18a44df91234")
+
+    filepath = os.path.join(settings.BASE_DIR, "import.json.template")
+    call_command("import_json", file=filepath)
+    transactions_count = Transaction.objects.count()
+
+    # Every row updates an existing transaction, with a fixed number of queries
+    with CaptureQueriesContext(connection) as queries:
+        call_command("import_json", file=filepath)
+
+    assert len(queries) <= 12
+    assert Transaction.objects.count() == transactions_count
+    assert Transaction.objects.filter(description="Manually updated transaction").count() == 3
+    assert wallet_binance.get_current_balance("BETH") == 1
+    assert wallet_coinbase.get_current_balance("BTC") == Decimal("0.995")
+
+
+def test_json_import_without_staging():
+    # The JSON importer has no import spec, so it can't import through the staging table
+    with pytest.raises(TypeError, match="Unknown option"):
+        call_command("import_json", staging=True)
@@ -1,10 +1,20 @@
+import json
+
 import pytest
+import requests
+from django.core.management import call_command
 from django.utils import timezone
 
 from crypto_fifo_taxes.enums import TransactionLabel
+from crypto_fifo_taxes.models import EthereumTransactionSender, MiningPoolAddress, Transaction
+from crypto_fifo_taxes.utils import ethplorer
+from crypto_fifo_taxes.utils.ethplorer import label_mining_deposits
 from crypto_fifo_taxes.utils.transaction_creator import TransactionCreator
 from tests.factories import CryptoCurrencyFactory, WalletFactory
 
+ETHERMINE_TX_ID = "0xf4c268755327817d449e852d9b5c9bb5a840f8080bf7328578c71b76e1a330a3"
+ETHERMINE_ADDRESS = "0xea674fdde714fd979de3edf0f56aa9716b898ec8"
+
 
 @pytest.mark.django_db()
 def test_mark_income_as_mining():
@@ -15,13 +25,99 @@ def test_mark_income_as_mining():
     eth_tx = TransactionCreator(
         timestamp=timezone.now(),
         description="Mining Deposit",
-        tx_id="0xf4c268755327817d449e852d9b5c9bb5a840f8080bf7328578c71b76e1a330a3",  # from Ethermine
+        tx_id=ETHERMINE_TX_ID,  # from Ethermine
     ).create_deposit(wallet=wallet, currency=eth, quantity=1)
-    assert eth_tx.transaction_label == TransactionLabel.MINING
+    # Mining deposits are labeled in a separate pass after importing
+    assert eth_tx.transaction_label != TransactionLabel.MINING
 
     btc_tx = TransactionCreator(
         timestamp=timezone.now(),
         description="Deposit",
         tx_id="4a5e1e4baab89f3a32518a88c31bc87f618f76673e2cc77ab2127b7afdeda33b",
     ).create_deposit(wallet=wallet, currency=btc, quantity=1)
+
+    assert label_mining_deposits() == 1
+
+    eth_tx.refresh_from_db()
+    btc_tx.refresh_from_db()
+    assert eth_tx.transaction_label == TransactionLabel.MINING
     assert btc_tx.transaction_label != TransactionLabel.MINING
+
+
+@pytest.mark.django_db()
+def test_label_mining_deposits_from_cache():
+    wallet = WalletFactory.create()
+    eth = CryptoCurrencyFactory.create(symbol="ETH")
+    other_tx_id = "0x" + "1" * 64
+
+    # Cached senders and pool addresses are used without requests to Ethplorer
+    MiningPoolAddress.objects.create(address=ETHERMINE_ADDRESS, fetched_at=timezone.now())
+    EthereumTransactionSender.objects.create(tx_id=ETHERMINE_TX_ID, from_address=ETHERMINE_ADDRESS)
+    EthereumTransactionSender.objects.create(tx_id=other_tx_id, from_address="0x" + "2" * 40)
+
+    mining_tx = TransactionCreator(timestamp=timezone.now(), tx_id=ETHERMINE_TX_ID).create_deposit(
+        wallet=wallet, currency=eth, quantity=1
+    )
+    other_tx = TransactionCreator(timestamp=timezone.now(), tx_id=other_tx_id).create_deposit(
+        wallet=wallet, currency=eth, quantity=1
+    )
+
+    assert label_mining_deposits() == 1
+    mining_tx.refresh_from_db()
+    other_tx.refresh_from_db()
+    assert mining_tx.transaction_label == TransactionLabel.MINING
+    assert other_tx.transaction_label == TransactionLabel.UNKNOWN
+
+    # Already labeled deposits are not checked again
+    assert label_mining_deposits() == 0
+
+
+@pytest.mark.django_db()
+def test_label_mining_deposits_keeps_fetched_senders(monkeypatch):
+    class FailingPoolsClient:
+        def get_tx_sender(self, tx_id: str) -> str:
+            return ETHERMINE_ADDRESS
+
+        def get_known_pool_addresses(self) -> list[str]:
+            raise requests.ConnectionError
+
+    monkeypatch.setattr(ethplorer, "get_ethplorer_client", FailingPoolsClient)
+    wallet = WalletFactory.create()
+    eth = CryptoCurrencyFactory.create(symbol="ETH")
+    TransactionCreator(timestamp=timezone.now(), tx_id=ETHERMINE_TX_ID).create_deposit(
+        wallet=wallet, currency=eth, quantity=1
+    )
+
+    with pytest.raises(requests.ConnectionError):
+        label_mining_deposits()
+
+    # The fetched sender is not rolled back with the failed labeling, so it isn't fetched again
+    assert EthereumTransactionSender.objects.filter(tx_id=ETHERMINE_TX_ID, from_address=ETHERMINE_ADDRESS).exists()
+
+
+@pytest.mark.django_db()
+def test_file_import_labels_mining_deposits(tmp_path):
+    WalletFactory.create(name="Binance")
+    CryptoCurrencyFactory.create(symbol="ETH")
+    MiningPoolAddress.objects.create(address=ETHERMINE_ADDRESS, fetched_at=timezone.now())
+    EthereumTransactionSender.objects.create(tx_id=ETHERMINE_TX_ID, from_address=ETHERMINE_ADDRESS)
+    filepath = tmp_path / "import.json"
+    filepath.write_text(
+        json.dumps(
+            [
+                {
+                    "tx_id": ETHERMINE_TX_ID,
+                    "type": "DEPOSIT",
+                    "timestamp": "2021-02-02 17:26:40",
+                    "wallet": "Binance",
+                    "to_symbol": "ETH",
+                    "to_amount": 1,
+                }
+            ]
+        )
+    )
+
+    # Mining deposits are labeled also when a file is imported on its own
+    call_command("import_json", file=str(filepath))
+
+    assert Transaction.objects.get(tx_id=ETHERMINE_TX_ID).transaction_label == TransactionLabel.MINING
@@ -5,6 +5,7 @@ import pytest
 from django.conf import settings
 from django.core.management import call_command
 
+from crypto_fifo_taxes.models import Transaction
 from tests.factories import CryptoCurrencyFactory, WalletFactory
 
 
@@ -15,5 +16,23 @@ def test_json_import_management_command():
 
     filepath = os.path.join(settings.BASE_DIR, "nicehash_report.csv.template")
     call_command("import_nicehash", file=filepath)
+    # Already imported dates are skipped
+    call_command("import_nicehash", file=filepath)
+
+    assert Transaction.objects.count() == 3
+    assert wallet.get_current_balance("BTC") == Decimal("0.00099000")
+
+
+@pytest.mark.django_db()
+def test_import_nicehash_staging():
+    wallet = WalletFactory.create(name="Nicehash")
+    CryptoCurrencyFactory.create(symbol="BTC")
+
+    filepath = os.path.join(settings.BASE_DIR, "nicehash_report.csv.template")
+    call_command("import_nicehash", file=filepath, staging=True)
+    # Already imported dates are skipped, regardless of the import path
+    call_command("import_nicehash", file=filepath)
+    call_command("import_nicehash", file=filepath, staging=True)
 
+    assert Transaction.objects.count() == 3
     assert wallet.get_current_balance("BTC") == Decimal("0.00099000")
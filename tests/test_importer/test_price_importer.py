@@ -0,0 +1,55 @@
+import gzip
+import json
+from datetime import UTC, date, datetime
+from decimal import Decimal
+
+import pytest
+from django.core.management import call_command
+
+from crypto_fifo_taxes.models import CurrencyPrice
+from crypto_fifo_taxes.utils.binance.binance_api import to_timestamp
+from tests.factories import CryptoCurrencyFactory, CurrencyPriceFactory
+
+
+@pytest.mark.django_db()
+def test_import_prices_csv(tmp_path):
+    btc = CryptoCurrencyFactory.create(symbol="BTC")
+    iota = CryptoCurrencyFactory.create(symbol="IOTA")
+    CurrencyPriceFactory.create(currency=btc, date=date(2021, 1, 1), price=1)
+
+    filepath = tmp_path / "prices.csv.gz"
+    with gzip.open(filepath, mode="wt") as price_file:
+        price_file.write(
+            "symbol,date,price,market_cap,volume\n"
+            "BTC,2021-01-01,25000.5,1000,100\n"
+            "BTC,2021-01-02,26000,,\n"
+            "MIOTA,2021-01-01,0.3,0,0\n"  # Renamed symbol
+            "UNKNOWN,2021-01-01,1,0,0\n"  # Missing currencies are skipped
+        )
+
+    call_command("import_prices", str(filepath), batch_size=2)
+
+    assert btc.prices.count() == 2
+    assert btc.prices.get(date=date(2021, 1, 1)).price == Decimal("25000.5")
+    assert btc.prices.get(date=date(2021, 1, 2)).market_cap == 0
+    assert iota.prices.get(date=date(2021, 1, 1)).price == Decimal("0.3")
+
+
+@pytest.mark.django_db()
+def test_import_prices_coingecko_json(tmp_path):
+    eth = CryptoCurrencyFactory.create(symbol="ETH")
+
+    stamps = [to_timestamp(datetime(2021, 1, day, tzinfo=UTC)) for day in (1, 2, 3)]
+    market_chart = {
+        "prices": [[stamp, 600 + i] for i, stamp in enumerate(stamps)],
+        "market_caps": [[stamp, 1000] for stamp in stamps],
+        "total_volumes": [[stamp, 10] for stamp in stamps],
+    }
+    filepath = tmp_path / "eth.json"
+    filepath.write_text(json.dumps(market_chart))
+
+    call_command("import_prices", str(filepath))
+
+    assert CurrencyPrice.objects.filter(currency=eth).count() == 3
+    assert eth.prices.get(date=date(2021, 1, 3)).price == Decimal(602)
+    assert eth.prices.get(date=date(2021, 1, 3)).volume == Decimal(10)
@@ -0,0 +1,92 @@
+import datetime
+from decimal import Decimal
+
+import pytest
+
+from crypto_fifo_taxes.enums import TransactionLabel, TransactionType
+from crypto_fifo_taxes.models import Currency, Transaction, Wallet
+from crypto_fifo_taxes.utils.staging_importer import StagingImporter, StagingRow
+from crypto_fifo_taxes.utils.transaction_creator import TransactionCreator
+from tests.factories import CryptoCurrencyFactory, WalletFactory
+
+
+@pytest.mark.django_db()
+def test_staging_importer():
+    wallet = WalletFactory.create(name="Binance")
+    btc = CryptoCurrencyFactory.create(symbol="BTC")
+    CryptoCurrencyFactory.create(symbol="ETH")
+    timestamp = datetime.datetime(2022, 1, 1, tzinfo=datetime.UTC)
+
+    # An existing transaction takes the first timestamp, and has the same tx_id as the first row
+    TransactionCreator(timestamp=timestamp, tx_id="1", fill_cost_basis=False).create_deposit(
+        wallet=wallet, currency=btc, quantity=Decimal(1)
+    )
+
+    def deposit(tx_id: str, quantity: str) -> StagingRow:
+        return StagingRow(
+            timestamp=timestamp,
+            tx_id=tx_id,
+            description="Staged deposit",
+            transaction_type=TransactionType.DEPOSIT,
+            transaction_label=TransactionLabel.REWARD,
+            to_wallet="Binance",
+            to_symbol="btc",
+            to_quantity=Decimal(quantity),
+        )
+
+    importer = StagingImporter("test")
+    importer.copy_rows([deposit("1", "1"), deposit("2", "2"), deposit("3", "3")])
+    importer.copy_rows(
+        [
+            StagingRow(
+                timestamp=timestamp + datetime.timedelta(milliseconds=1),
+                tx_id="",
+                description="Staged trade",
+                transaction_type=TransactionType.TRADE,
+                from_wallet="Binance",
+                from_symbol="BTC",
+                from_quantity=Decimal("0.5"),
+                to_wallet="Binance",
+                to_symbol="ETH",
+                to_quantity=Decimal(10),
+                fee_wallet="Binance",
+                fee_symbol="BNB",  # Missing currencies are created
+                fee_quantity=Decimal("0.01"),
+            )
+        ]
+    )
+    assert importer.transform() == 3
+
+    staged = list(Transaction.objects.exclude(tx_id="1").order_by("timestamp"))
+    # The first row was skipped, and the rest were staggered in the order they were copied
+    assert [(tx.tx_id, tx.timestamp) for tx in staged] == [
+        ("2", timestamp + datetime.timedelta(milliseconds=1)),
+        ("3", timestamp + datetime.timedelta(milliseconds=2)),
+        ("", timestamp + datetime.timedelta(milliseconds=3)),
+    ]
+    assert staged[0].transaction_type == TransactionType.DEPOSIT
+    assert staged[0].transaction_label == TransactionLabel.REWARD
+    assert staged[0].to_detail.quantity == Decimal(2)
+    assert staged[2].fee_detail.currency == Currency.objects.get(symbol="BNB")
+    assert wallet.get_current_balance("BTC") == Decimal("5.5")
+    assert wallet.get_current_balance("ETH") == Decimal(10)
+
+
+@pytest.mark.django_db()
+def test_staging_importer_missing_wallet():
+    importer = StagingImporter("test")
+    importer.copy_rows(
+        [
+            StagingRow(
+                timestamp=datetime.datetime(2022, 1, 1, tzinfo=datetime.UTC),
+                tx_id="",
+                description="",
+                transaction_type=TransactionType.DEPOSIT,
+                to_wallet="Missing",
+                to_symbol="BTC",
+                to_quantity=Decimal(1),
+            )
+        ]
+    )
+    with pytest.raises(Wallet.DoesNotExist):
+        importer.transform()
@@ -0,0 +1,82 @@
+import datetime
+
+import pytest
+
+from crypto_fifo_taxes.utils.currency import get_fiat_currency
+from crypto_fifo_taxes.utils.price_fetch_planner import (
+    MissingPriceRange,
+    PriceCoverage,
+    PriceFetchRequest,
+    get_price_coverage,
+    plan_price_fetch_requests,
+)
+from tests.factories import (
+    CryptoCurrencyFactory,
+    CurrencyPriceFactory,
+    TransactionDetailFactory,
+    TransactionFactory,
+    WalletFactory,
+)
+
+
+@pytest.mark.django_db()
+def test_get_price_coverage():
+    wallet = WalletFactory.create()
+    btc = CryptoCurrencyFactory.create(symbol="BTC")
+    eth = CryptoCurrencyFactory.create(symbol="ETH")
+    CryptoCurrencyFactory.create(symbol="ADA")  # No transactions
+
+    TransactionFactory.create(
+        timestamp=datetime.datetime(2021, 1, 1, 23, tzinfo=datetime.UTC),
+        from_detail=TransactionDetailFactory.create(wallet=wallet, currency=get_fiat_currency()),
+        to_detail=TransactionDetailFactory.create(wallet=wallet, currency=btc),
+    )
+    TransactionFactory.create(
+        timestamp=datetime.datetime(2021, 1, 5, tzinfo=datetime.UTC),
+        from_detail=TransactionDetailFactory.create(wallet=wallet, currency=btc),
+        to_detail=TransactionDetailFactory.create(wallet=wallet, currency=eth),
+    )
+    for day in (1, 2, 6):
+        CurrencyPriceFactory.create(currency=btc, date=datetime.date(2021, 1, day))
+    # The API is known not to return prices for 2021-01-09 and 2021-01-10
+    CurrencyPriceFactory.create(currency=btc, date=datetime.date(2021, 1, 8), num_missing_days=2)
+    for day in range(5, 13):
+        CurrencyPriceFactory.create(currency=eth, date=datetime.date(2021, 1, day))
+
+    coverages = get_price_coverage(end_date=datetime.date(2021, 1, 12))
+
+    assert set(coverages) == {btc.pk, eth.pk}
+    assert coverages[btc.pk].first_transaction_date == datetime.date(2021, 1, 1)
+    assert coverages[btc.pk].last_transaction_date == datetime.date(2021, 1, 5)
+    assert coverages[btc.pk].missing_ranges == [
+        MissingPriceRange(datetime.date(2021, 1, 3), datetime.date(2021, 1, 5)),
+        MissingPriceRange(datetime.date(2021, 1, 7), datetime.date(2021, 1, 7)),
+        MissingPriceRange(datetime.date(2021, 1, 11), datetime.date(2021, 1, 12)),
+    ]
+    assert coverages[btc.pk].missing_days == 6
+    assert coverages[eth.pk].missing_ranges == []
+
+    assert set(get_price_coverage(currency_ids=[eth.pk], end_date=datetime.date(2021, 1, 12))) == {eth.pk}
+
+
+def test_plan_price_fetch_requests():
+    coverage = PriceCoverage(
+        currency_id=1,
+        first_transaction_date=datetime.date(2020, 1, 1),
+        last_transaction_date=datetime.date(2021, 1, 1),
+        missing_ranges=[
+            MissingPriceRange(datetime.date(2020, 1, 1), datetime.date(2020, 1, 3)),
+            MissingPriceRange(datetime.date(2020, 1, 8), datetime.date(2020, 1, 14)),
+            MissingPriceRange(datetime.date(2020, 3, 1), datetime.date(2020, 3, 1)),
+        ],
+    )
+
+    # Nearby ranges are combined, up to the maximum request length
+    assert plan_price_fetch_requests(coverage, max_days=10) == [
+        PriceFetchRequest(1, datetime.date(2020, 1, 1), datetime.date(2020, 1, 10)),
+        PriceFetchRequest(1, datetime.date(2020, 1, 11), datetime.date(2020, 1, 14)),
+        PriceFetchRequest(1, datetime.date(2020, 3, 1), datetime.date(2020, 3, 1)),
+    ]
+    assert plan_price_fetch_requests(coverage, max_days=365) == [
+        PriceFetchRequest(1, datetime.date(2020, 1, 1), datetime.date(2020, 3, 1)),
+    ]
@@ -0,0 +1,51 @@
+import datetime
+import json
+
+import pytest
+
+from crypto_fifo_taxes.exceptions import CoinGeckoAPIException
+from crypto_fifo_taxes.utils import price_providers
+from crypto_fifo_taxes.utils.price_providers import ReplayPriceProvider, _get_recording_path
+
+
+def _record(recordings_dir, path: str, params: dict, body: dict) -> None:
+    with open(_get_recording_path(str(recordings_dir), path, params), "w") as recording_file:
+        json.dump({"path": path, "params": params, "status_code": 200, "body": body}, recording_file)
+
+
+def test_replay_price_provider(tmp_path):
+    params = {"date": "01-01-2020", "localization": "false"}
+    _record(tmp_path, "coins/bitcoin/history", params, {"symbol": "btc"})
+
+    provider = ReplayPriceProvider(str(tmp_path))
+
+    assert provider.get_price_history("bitcoin", datetime.date(2020, 1, 1)) == {"symbol": "btc"}
+    with pytest.raises(CoinGeckoAPIException):
+        provider.get_price_history("bitcoin", datetime.date(2020, 1, 2))
+
+
+def test_replay_price_provider_rate_limit(tmp_path, monkeypatch):
+    sleeps = []
+    monkeypatch.setattr(price_providers.time, "sleep", sleeps.append)
+    _record(tmp_path, "coins/list", {"include_platform": "false"}, [{"id": "bitcoin"}])
+
+    provider = ReplayPriceProvider(str(tmp_path), rate_limit_every=2, retry_after=3)
+
+    assert provider.get_currency_list() == [{"id": "bitcoin"}]
+    # Every second request is throttled, and retried after waiting the `Retry-After` time
+    assert provider.get_currency_list() == [{"id": "bitcoin"}]
+    assert provider.request_count == 3
+    assert provider.rate_limited_count == 1
+    assert sleeps == [3]
+
+
+def test_replay_price_provider_calls_per_minute(tmp_path):
+    _record(tmp_path, "coins/list", {"include_platform": "false"}, [])
+
+    provider = ReplayPriceProvider(str(tmp_path), calls_per_minute=2)
+
+    assert provider.send("coins/list", {"include_platform": "false"}).status_code == 200
+    assert provider.send("coins/list", {"include_platform": "false"}).status_code == 200
+    response = provider.send("coins/list", {"include_platform": "false"})
+    assert response.status_code == 429
+    assert 1 <= int(response.headers["Retry-After"]) <= 61
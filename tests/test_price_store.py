@@ -0,0 +1,87 @@
+import datetime
+from decimal import Decimal
+
+import pytest
+from django.core.management import call_command
+
+from crypto_fifo_taxes.models import CurrencyPrice
+from crypto_fifo_taxes.utils.price_store import PriceStore, export_price_store, get_price_store
+from tests.factories import CryptoCurrencyFactory, CurrencyPriceFactory
+
+
+@pytest.mark.django_db()
+def test_export_price_store(tmp_path):
+    btc = CryptoCurrencyFactory.create(symbol="BTC")
+    eth = CryptoCurrencyFactory.create(symbol="ETH")
+    CurrencyPriceFactory.create(currency=btc, date=datetime.date(2021, 1, 1), price=Decimal("28950.12345678"))
+    CurrencyPriceFactory.create(currency=btc, date=datetime.date(2021, 1, 4), price=Decimal("31000"))
+    CurrencyPriceFactory.create(currency=eth, date=datetime.date(2021, 1, 2), price=Decimal("730.5"))
+
+    assert export_price_store(str(tmp_path)) == 2
+
+    price_store = PriceStore(str(tmp_path))
+    assert price_store.series[btc.pk].end_date == datetime.date(2021, 1, 4)
+    assert price_store.get_price(btc.pk, datetime.date(2021, 1, 1)) == 28950.12345678
+    # Dates without a price, and dates outside the saved prices
+    assert price_store.get_price(btc.pk, datetime.date(2021, 1, 2)) is None
+    assert price_store.get_price(btc.pk, datetime.date(2020, 12, 31)) is None
+    assert price_store.get_price(btc.pk, datetime.date(2021, 1, 5)) is None
+
+    assert price_store.get_latest_price(btc.pk, datetime.date(2021, 1, 3)) == 28950.12345678
+    assert price_store.get_latest_price(btc.pk, datetime.date(2022, 1, 1)) == 31000
+    assert price_store.get_latest_price(eth.pk, datetime.date(2021, 1, 1)) is None
+
+    series = price_store.get_series(btc.pk, datetime.date(2021, 1, 3))
+    assert series.tolist()[1:] == [31000]
+    assert price_store.get_series(eth.pk + btc.pk, datetime.date(2021, 1, 1)) is None
+    assert price_store.get_series(eth.pk, datetime.date(2021, 1, 1)).tolist() == [730.5]
+
+
+@pytest.mark.django_db()
+def test_price_store_reexported(tmp_path):
+    btc = CryptoCurrencyFactory.create(symbol="BTC")
+    CurrencyPriceFactory.create(currency=btc, date=datetime.date(2021, 1, 1), price=Decimal(25000))
+    export_price_store(str(tmp_path))
+    price_store = PriceStore(str(tmp_path))
+
+    CurrencyPrice.objects.filter(currency=btc).update(price=Decimal(26000))
+    CurrencyPriceFactory.create(currency=btc, date=datetime.date(2021, 1, 2), price=Decimal(27000))
+    export_price_store(str(tmp_path))
+    export_price_store(str(tmp_path))
+
+    # A store opened before the exports keeps reading the prices of its own export
+    assert price_store.get_series(btc.pk, datetime.date(2021, 1, 1)).tolist() == [25000]
+    assert PriceStore(str(tmp_path)).get_series(btc.pk, datetime.date(2021, 1, 1)).tolist() == [26000, 27000]
+    # The data files of older exports are deleted
+    assert len(list(tmp_path.glob("*.f64"))) == 2
+
+
+@pytest.mark.django_db()
+def test_price_store_rebuilt_after_import(tmp_path, settings):
+    settings.PRICE_STORE_DIR = str(tmp_path / "price_store")
+    btc = CryptoCurrencyFactory.create(symbol="BTC")
+    assert get_price_store() is None
+
+    filepath = tmp_path / "prices.csv"
+    filepath.write_text("symbol,date,price\nBTC,2021-01-01,25000.5\n")
+    call_command("import_prices", str(filepath))
+
+    assert get_price_store().get_price(btc.pk, datetime.date(2021, 1, 1)) == 25000.5
+
+
+@pytest.mark.django_db()
+def test_price_store_reopened_after_export(tmp_path, settings):
+    settings.PRICE_STORE_DIR = str(tmp_path)
+    btc = CryptoCurrencyFactory.create(symbol="BTC")
+    CurrencyPriceFactory.create(currency=btc, date=datetime.date(2021, 1, 1), price=Decimal(25000))
+    export_price_store()
+
+    price_store = get_price_store()
+    assert get_price_store() is price_store
+
+    # Exported by another process, e.g. `fetch_market_prices` while the web server keeps running
+    CurrencyPrice.objects.filter(currency=btc).update(price=Decimal(26000))
+    export_price_store()
+
+    assert get_price_store() is not price_store
+    assert get_price_store().get_price(btc.pk, datetime.date(2021, 1, 1)) == 26000
@@ -0,0 +1,32 @@
+import io
+import json
+
+import pytest
+
+from crypto_fifo_taxes.utils.streaming import chunked, iter_json_array
+
+
+def test_chunked():
+    assert list(chunked(range(5), 2)) == [[0, 1], [2, 3], [4]]
+    assert list(chunked([], 2)) == []
+
+
+@pytest.mark.parametrize("read_size", [1, 3, 16, 64 * 1024])
+def test_iter_json_array(read_size):
+    data = [
+        {"trade id": 4002525, "price": 650.25, "size": 1e-05, "product": "ETH-EUR", "nested": [1, {"a": None}]},
+        12345678901234567890,
+        -3.5,
+        "string, with ] separators",
+    ]
+    for indent in (None, 2):
+        json_file = io.StringIO(json.dumps(data, indent=indent))
+        assert list(iter_json_array(json_file, read_size=read_size)) == data
+
+    assert list(iter_json_array(io.StringIO(" [ ] "), read_size=read_size)) == []
+
+
+@pytest.mark.parametrize("content", ["", "{}", "[1,", "[1 2]", "[1.]"])
+def test_iter_json_array_invalid(content):
+    with pytest.raises(ValueError):  # noqa: PT011
+        list(iter_json_array(io.StringIO(content), read_size=2))
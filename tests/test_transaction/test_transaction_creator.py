@@ -1,13 +1,17 @@
+import datetime
 from decimal import Decimal
 
 import pytest
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
 from django.utils import timezone
 
 from crypto_fifo_taxes.enums import TransactionType
-from crypto_fifo_taxes.models import Transaction, TransactionDetail
+from crypto_fifo_taxes.exceptions import TimestampConflictError
+from crypto_fifo_taxes.models import Snapshot, Transaction, TransactionDetail
 from crypto_fifo_taxes.utils.currency import get_fiat_currency
-from crypto_fifo_taxes.utils.transaction_creator import TransactionCreator
-from tests.factories import CryptoCurrencyFactory, WalletFactory
+from crypto_fifo_taxes.utils.transaction_creator import TimestampAllocator, TransactionBatch, TransactionCreator
+from tests.factories import CryptoCurrencyFactory, SnapshotFactory, WalletFactory
 
 
 @pytest.mark.django_db()
@@ -45,3 +49,87 @@ def test_transaction_creator():
     assert Transaction.objects.count() == 4
     assert TransactionDetail.objects.count() == 8
     assert tx.transaction_type == TransactionType.TRADE
+
+
+@pytest.mark.django_db()
+def test_transaction_batch():
+    wallet = WalletFactory.create()
+    fiat = get_fiat_currency()
+    crypto = CryptoCurrencyFactory.create(symbol="BTC")
+    timestamp = timezone.now()
+    TransactionCreator(timestamp=timestamp).create_deposit(wallet=wallet, currency=fiat, quantity=500)
+    SnapshotFactory.create(date=timestamp.date())
+
+    batch = TransactionBatch()
+    batch.add_deposit(TransactionCreator(timestamp=timestamp), wallet=wallet, currency=fiat, quantity=500)
+    for _ in range(2):
+        tx_creator = TransactionCreator(timestamp=timestamp)
+        tx_creator.add_from_detail(wallet=wallet, currency=fiat, quantity=200)
+        tx_creator.add_to_detail(wallet=wallet, currency=crypto, quantity=2)
+        tx_creator.add_fee_detail(wallet=wallet, currency=crypto, quantity=Decimal("0.0001"))
+        batch.add_trade(tx_creator)
+
+    # Invalid transactions are rejected before anything is saved
+    with pytest.raises(AssertionError):
+        batch.add_withdrawal(TransactionCreator(timestamp=timestamp))
+    assert len(batch) == 3
+    assert Transaction.objects.count() == 1
+
+    transactions = batch.create()
+
+    assert len(batch) == 0
+    assert Transaction.objects.count() == 4
+    assert TransactionDetail.objects.count() == 8
+    assert transactions[1].transaction_type == TransactionType.TRADE
+    assert transactions[1].to_detail.currency == crypto
+    # Timestamps are staggered to keep them unique, also within the batch
+    assert [tx.timestamp - timestamp for tx in transactions] == [
+        datetime.timedelta(milliseconds=ms) for ms in (1, 2, 3)
+    ]
+    assert Snapshot.objects.count() == 0
+
+
+@pytest.mark.django_db()
+def test_timestamp_allocator():
+    wallet = WalletFactory.create()
+    fiat = get_fiat_currency()
+    timestamp = timezone.now()
+    ms = datetime.timedelta(milliseconds=1)
+    for taken in (timestamp, timestamp + ms, timestamp + datetime.timedelta(minutes=1)):
+        TransactionCreator(timestamp=taken).create_deposit(wallet=wallet, currency=fiat, quantity=1)
+
+    with CaptureQueriesContext(connection) as queries:
+        allocator = TimestampAllocator(timestamp, timestamp + datetime.timedelta(minutes=1))
+        allocated = [allocator.allocate(timestamp) for _ in range(20)]
+        allocated.append(allocator.allocate(timestamp + datetime.timedelta(minutes=1)))
+        allocator.check_conflicts()
+
+    # Taken timestamps are loaded once, and checked for conflicts once
+    assert len(queries) == 2
+    assert allocated[:3] == [timestamp + ms * 2, timestamp + ms * 3, timestamp + ms * 4]
+    assert len(set(allocated)) == len(allocated)
+    assert allocated[-1] == timestamp + datetime.timedelta(minutes=1) + ms
+
+    # Timestamps taken after they were loaded are detected
+    TransactionCreator(timestamp=allocated[0]).create_deposit(wallet=wallet, currency=fiat, quantity=1)
+    with pytest.raises(TimestampConflictError):
+        allocator.check_conflicts()
+
+
+@pytest.mark.django_db()
+def test_existing_tx_ids():
+    wallet = WalletFactory.create()
+    fiat = get_fiat_currency()
+    for i, tx_id in enumerate(("a", "b")):
+        TransactionCreator(
+            timestamp=datetime.datetime(2022, 1, 1, i, tzinfo=datetime.UTC), tx_id=tx_id, fill_cost_basis=False
+        ).create_deposit(wallet=wallet, currency=fiat, quantity=1)
+
+    with CaptureQueriesContext(connection) as queries:
+        assert Transaction.objects.existing_tx_ids(["a", "c"]) == {"a"}
+    assert len(queries) == 1
+
+    # No query without tx_ids
+    with CaptureQueriesContext(connection) as queries:
+        assert Transaction.objects.existing_tx_ids([]) == set()
+    assert len(queries) == 0